@@ -0,0 +1,335 @@
+"""
+In-process stand-in for the EC2, CloudWatch and S3 APIs used by the benchmarks.
+
+Like botocore's Stubber it answers calls from a before-call handler, so no request
+leaves the process, but responses are computed from a synthetic account: filters,
+pagination, metric windows, the Metric Math used for fleet aggregates and multipart
+uploads behave like the real services.
+Parameter validation, the client event chain and every line of project code still
+run, which is what the benchmarks measure.
+
+With throttle_every set, calls are answered at before-send instead, so they take the
+send path with its rate limiter, retry handlers and before-send hooks, and every
+throttle_every-th attempt, starting with the first, gets an EC2 RequestLimitExceeded response.
+"""
+import re
+import threading
+import zlib
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from botocore.awsrequest import AWSResponse
+
+INSTANCE_TYPES = ("t3.micro", "t3.small", "m5.large")
+ZONES = ("a", "b", "c")
+TIERS = ("web", "api", "worker", "db")
+
+# Objects per synthetic folder of the benchmark bucket
+OBJECTS_PER_FOLDER = 1000
+
+# Metric Math functions by name
+_FUNCTIONS = {"AVG": np.mean, "MAX": np.max, "MIN": np.min, "SUM": np.sum}
+
+
+def _epoch(value):
+    # Naive datetimes are UTC, like botocore serializes them
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def _ok():
+    return AWSResponse(None, 200, {}, None)
+
+
+class _Body:
+    # The raw body botocore reads from an AWSResponse
+    def __init__(self, data):
+        self.data = data
+
+    def stream(self, **kwargs):
+        yield self.data
+
+
+_THROTTLED = (b"<Response><Errors><Error><Code>RequestLimitExceeded</Code><Message>Request limit exceeded."
+              b"</Message></Error></Errors><RequestID>fake-aws</RequestID></Response>")
+
+
+class FakeAccount:
+    """
+    Synthetic account of `instances` EC2 instances (tagged Name=bench-<n> and a tier),
+    CloudWatch series for every instance, and one bucket of `objects` keys laid out
+    as logs/<folder>/<index>.json.
+    """
+
+    def __init__(self, region, instances, objects, bucket="bench-bucket"):
+        self.region = region
+        self.bucket = bucket
+        self.objects = objects
+        self.launch_time = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self.instances = [self._instance(index) for index in range(instances)]
+        self.by_id = {instance['InstanceId']: instance for instance in self.instances}
+        self.uploads = {}
+        self.calls = 0
+        # Send-path mode (EC2 only): every throttle_every-th attempt, starting with the first, is throttled
+        self.throttle_every = None
+        self.attempts = 0
+        self.throttled = 0
+        self._answer = threading.local()
+
+    def _instance(self, index):
+        return {
+            'InstanceId': f"i-{index:017x}",
+            'ImageId': "ami-00000000000000000",
+            'InstanceType': INSTANCE_TYPES[index % len(INSTANCE_TYPES)],
+            'LaunchTime': self.launch_time,
+            'Placement': {'AvailabilityZone': f"{self.region}{ZONES[index % len(ZONES)]}"},
+            'PrivateIpAddress': f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}",
+            'State': {'Code': 16, 'Name': 'running'},
+            'Tags': [{'Key': 'Name', 'Value': f"bench-{index}"}, {'Key': 'tier', 'Value': TIERS[index % len(TIERS)]}],
+        }
+
+    def reset_states(self):
+        for instance in self.instances:
+            instance['State'] = {'Code': 16, 'Name': 'running'}
+
+    def attach(self, client):
+        """
+        Routes every call of a client to this account. The answering handler is registered
+        last, so the project's own before-call hooks (instrumentation) still run first.
+        """
+        service = client.meta.service_model.service_id.hyphenize()
+        client.meta.events.register(f"before-parameter-build.{service}", self._capture, unique_id=f"fake-aws-params-{service}")
+        client.meta.events.register_last(f"before-call.{service}", self._handle, unique_id=f"fake-aws-{service}")
+        client.meta.events.register_last(f"before-send.{service}", self._send, unique_id=f"fake-aws-send-{service}")
+        client.meta.events.register(f"before-parse.{service}", self._parse, unique_id=f"fake-aws-parse-{service}")
+        return client
+
+    def _capture(self, params, context, **kwargs):
+        # before-call only sees the serialized request, so the API parameters are kept here, as Stubber does
+        context['fake_aws_params'] = dict(params)
+
+    def _call(self, operation_name, params):
+        handler = getattr(self, f"_{operation_name}", None)
+        if handler is None:
+            raise NotImplementedError(f"The benchmark stand-in does not implement {operation_name}.")
+        self.calls += 1
+        return handler(params)
+
+    def _handle(self, model, context, **kwargs):
+        if self.throttle_every:
+            # Left to the send path, where _send answers every attempt
+            return None
+        return _ok(), self._call(model.name, context['fake_aws_params'])
+
+    def _send(self, event_name, request, **kwargs):
+        if not self.throttle_every:
+            return None
+        self.attempts += 1
+        if (self.attempts - 1) % self.throttle_every == 0:
+            self.throttled += 1
+            return AWSResponse(request.url, 503, {}, _Body(_THROTTLED))
+        # The body only has to parse; _parse supplies the response itself
+        self._answer.response = self._call(event_name.rsplit(".", 1)[-1], request.context['fake_aws_params'])
+        return AWSResponse(request.url, 200, {}, _Body(b"<Response/>"))
+
+    def _parse(self, response_dict, customized_response_dict, **kwargs):
+        if response_dict['status_code'] < 300:
+            customized_response_dict.update(self._answer.__dict__.pop('response', {}))
+
+    # EC2
+
+    def _matches(self, instance, filters):
+        tags = {tag['Key']: tag['Value'] for tag in instance['Tags']}
+        for selector in filters:
+            name, values = selector['Name'], selector['Values']
+            if name == 'instance-id':
+                value = instance['InstanceId']
+            elif name == 'instance-state-name':
+                value = instance['State']['Name']
+            elif name.startswith('tag:'):
+                value = tags.get(name[4:])
+            else:
+                raise NotImplementedError(f"Filter {name} is not supported by the benchmark stand-in.")
+            if value not in values:
+                return False
+        return True
+
+    def _select(self, params):
+        filters = params.get('Filters', [])
+        if params.get('InstanceIds'):
+            candidates = [self.by_id[instance_id] for instance_id in params['InstanceIds'] if instance_id in self.by_id]
+        else:
+            candidates = self.instances
+        # Instance ID filters are looked up directly, like an indexed backend
+        for selector in filters:
+            if selector['Name'] == 'instance-id':
+                candidates = [self.by_id[value] for value in selector['Values'] if value in self.by_id]
+                break
+        return [instance for instance in candidates if self._matches(instance, filters)]
+
+    def _page(self, items, params, default_size=1000):
+        start = int(params.get('NextToken') or 0)
+        size = params.get('MaxResults') or default_size
+        page = items[start:start + size]
+        next_token = str(start + size) if start + size < len(items) else None
+        return page, next_token
+
+    def _DescribeInstances(self, params):
+        page, next_token = self._page(self._select(params), params)
+        response = {'Reservations': [{'ReservationId': f"r-{instance['InstanceId'][2:]}", 'Instances': [instance]}
+                                     for instance in page]}
+        if next_token:
+            response['NextToken'] = next_token
+        return response
+
+    def _DescribeInstanceStatus(self, params):
+        page, next_token = self._page(self._select(params), params)
+        response = {'InstanceStatuses': [
+            {'InstanceId': instance['InstanceId'],
+             'AvailabilityZone': instance['Placement']['AvailabilityZone'],
+             'InstanceState': instance['State']}
+            for instance in page
+        ]}
+        if next_token:
+            response['NextToken'] = next_token
+        return response
+
+    def _change_states(self, params, target, code):
+        changes = []
+        for instance_id in params['InstanceIds']:
+            instance = self.by_id[instance_id]
+            changes.append({'InstanceId': instance_id, 'PreviousState': instance['State'],
+                            'CurrentState': {'Code': code, 'Name': target}})
+            instance['State'] = {'Code': code, 'Name': target}
+        return changes
+
+    def _StopInstances(self, params):
+        return {'StoppingInstances': self._change_states(params, 'stopped', 80)}
+
+    def _StartInstances(self, params):
+        return {'StartingInstances': self._change_states(params, 'running', 16)}
+
+    # CloudWatch
+
+    def _metric_series(self, query, params):
+        # Every series is a deterministic wave, so repeated runs return identical data
+        stat = query['MetricStat']
+        period = stat['Period']
+        start = _epoch(params['StartTime']) // period * period + period
+        end = _epoch(params['EndTime'])
+        epochs = np.arange(start, end, period)
+        seed = zlib.crc32(f"{stat['Metric']['MetricName']}/{stat['Metric']['Dimensions'][0]['Value']}".encode()) % 997
+        label = query.get('Label') or stat['Metric']['MetricName']
+        return label, epochs, 50 + 40 * np.sin(epochs / 3600.0 + seed)
+
+    def _expression(self, expression, inputs):
+        # The Metric Math subset used by fleet_aggregates, over METRICS() (all metric queries)
+        match = re.fullmatch(r"SORT\(METRICS\(\), (AVG|MAX|MIN|SUM), (ASC|DESC), (\d+)\)", expression)
+        if match:
+            function, order, limit = match.groups()
+            scores = [_FUNCTIONS[function](values) for _, _, values in inputs]
+            ranked = sorted(range(len(inputs)), key=lambda index: scores[index], reverse=order == "DESC")
+            return [inputs[index] for index in ranked[:int(limit)]]
+        match = re.fullmatch(r"(AVG|MAX|MIN|SUM)\(METRICS\(\)( \* 0 \+ 1)?\)", expression)
+        if match is None:
+            raise NotImplementedError(f"The benchmark stand-in does not evaluate {expression}.")
+        function, count = match.groups()
+        # Every wave of a request covers the same epochs
+        epochs = inputs[0][1] if inputs else np.empty(0, dtype=np.int64)
+        matrix = np.array([np.ones_like(values) if count else values for _, _, values in inputs]).reshape(len(inputs), len(epochs))
+        return [(expression, epochs, _FUNCTIONS[function](matrix, axis=0) if inputs else np.empty(0))]
+
+    def _GetMetricData(self, params):
+        metric_queries = [query for query in params['MetricDataQueries'] if 'MetricStat' in query]
+        inputs = {query['Id']: self._metric_series(query, params) for query in metric_queries}
+        base = datetime.fromtimestamp(0, tz=timezone.utc)
+        results = []
+        for query in params['MetricDataQueries']:
+            if not query.get('ReturnData', True):
+                continue
+            if 'Expression' in query:
+                outputs = self._expression(query['Expression'], list(inputs.values()))
+            else:
+                outputs = [inputs[query['Id']]]
+            for label, epochs, values in outputs:
+                results.append({
+                    'Id': query['Id'],
+                    'Label': label,
+                    'Timestamps': [base + timedelta(seconds=int(epoch)) for epoch in epochs],
+                    'Values': values.tolist(),
+                    'StatusCode': 'Complete',
+                })
+        return {'MetricDataResults': results, 'Messages': []}
+
+    # S3
+
+    def _key(self, index):
+        return f"logs/{index // OBJECTS_PER_FOLDER:05d}/{index:09d}.json"
+
+    def _key_range(self, prefix):
+        # Index range of the keys under a prefix of the logs/<folder>/ layout
+        if "logs/".startswith(prefix):
+            return 0, self.objects
+        folder = prefix[len("logs/"):len("logs/") + 5]
+        if prefix.startswith("logs/") and len(folder) == 5 and folder.isdigit():
+            first = int(folder) * OBJECTS_PER_FOLDER
+            return min(first, self.objects), min(first + OBJECTS_PER_FOLDER, self.objects)
+        return 0, 0
+
+    def _ListObjectsV2(self, params):
+        prefix = params.get('Prefix', "")
+        page_size = params.get('MaxKeys', 1000)
+        first, last = self._key_range(prefix)
+        position = int(params.get('ContinuationToken') or first)
+        response = {'Name': params['Bucket'], 'Prefix': prefix, 'MaxKeys': page_size, 'KeyCount': 0}
+
+        if params.get('Delimiter') == "/" and prefix in ("", "logs/"):
+            # Folder view: one common prefix per folder (or the top-level logs/ folder)
+            if prefix == "":
+                folders = ["logs/"] if self.objects else []
+            else:
+                folders = [f"logs/{folder:05d}/" for folder in range(-(-self.objects // OBJECTS_PER_FOLDER))]
+            start = position - first
+            page = folders[start:start + page_size]
+            response['CommonPrefixes'] = [{'Prefix': folder} for folder in page]
+            response['KeyCount'] = len(page)
+            response['IsTruncated'] = start + page_size < len(folders)
+            if response['IsTruncated']:
+                response['NextContinuationToken'] = str(position + page_size)
+            return response
+
+        end = min(position + page_size, last)
+        response['Contents'] = [
+            {'Key': self._key(index), 'Size': 1024 + index % 4096, 'LastModified': self.launch_time,
+             'ETag': '"0"', 'StorageClass': 'STANDARD'}
+            for index in range(position, end)
+        ]
+        response['KeyCount'] = end - position
+        response['IsTruncated'] = end < last
+        if response['IsTruncated']:
+            response['NextContinuationToken'] = str(end)
+        return response
+
+    def _PutObject(self, params):
+        body = params.get('Body')
+        if hasattr(body, 'read'):
+            body.read()
+        return {'ETag': '"0"'}
+
+    def _CreateMultipartUpload(self, params):
+        upload_id = f"upload-{len(self.uploads)}"
+        self.uploads[upload_id] = 0
+        return {'Bucket': params['Bucket'], 'Key': params['Key'], 'UploadId': upload_id}
+
+    def _UploadPart(self, params):
+        body = params['Body']
+        self.uploads[params['UploadId']] += len(body.read()) if hasattr(body, 'read') else len(body)
+        return {'ETag': f'"{params["PartNumber"]}"'}
+
+    def _CompleteMultipartUpload(self, params):
+        return {'Bucket': params['Bucket'], 'Key': params['Key'], 'ETag': '"0"'}
+
+    def _AbortMultipartUpload(self, params):
+        self.uploads.pop(params['UploadId'], None)
+        return {}
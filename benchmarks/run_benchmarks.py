@@ -0,0 +1,338 @@
+"""
+Offline benchmarks of the inventory, metrics and S3 paths.
+
+Every case runs against an in-process synthetic account (see fake_aws.py), so no AWS
+credentials or network are needed. For each account size the suite records wall
+time, AWS API calls and peak Python memory, and writes a JSON report. Passing an
+earlier report as --baseline turns the run into a regression check.
+
+    python benchmarks/run_benchmarks.py --sizes small medium --output benchmark_report.json
+    python benchmarks/run_benchmarks.py --baseline benchmark_report.json --tolerance 0.25
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+# Calls are answered before signing, but boto3 still wants a region and credentials to exist
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+
+from alerting import AlertEngine
+from aws_clients import clear_clients, get_client
+from describe_instances import get_instance_status
+from fake_aws import FakeAccount
+from fleet_aggregates import fleet_aggregate, fleet_top_n
+from fleet_ops import bulk_change_state
+from instance_inventory import InstanceInventory, clear_inventories, list_inventory
+from instrumentation import total_calls
+from metrics_engine import IncrementalFetcher, collect_fleet_metrics
+from rate_limiter import reset as reset_rate_limits
+from s3_browser import count_keys, list_page
+from s3_transfer import MiB, upload_stream
+from stop_instance import stop_instance
+from timeseries import series_from_columns
+from ttl_cache import invalidate
+
+REGION = "eu-north-1"
+
+# Synthetic account sizes: instances, objects in the benchmark bucket, and upload size
+SIZES = {
+    "small": {"instances": 10, "objects": 1_000, "upload_mib": 1},
+    "medium": {"instances": 1_000, "objects": 100_000, "upload_mib": 16},
+    "large": {"instances": 10_000, "objects": 1_000_000, "upload_mib": 64},
+}
+
+METRIC_GROUPS = {
+    "CPU Utilization": [
+        {'MetricName': 'CPUUtilization', 'Namespace': 'AWS/EC2', 'Unit': 'Percent'},
+    ],
+    "Network Metrics": [
+        {'MetricName': 'NetworkIn', 'Namespace': 'AWS/EC2', 'Unit': 'Bytes'},
+        {'MetricName': 'NetworkOut', 'Namespace': 'AWS/EC2', 'Unit': 'Bytes'},
+    ],
+}
+METRIC_WINDOW = timedelta(hours=6)
+END_TIME = datetime(2024, 6, 1, tzinfo=timezone.utc)
+
+
+# Every n-th attempt of the throttled listing, starting with the first, gets a throttling
+# response, so every call is retried at least once
+THROTTLE_EVERY = 2
+
+
+def setup_list_instances(account, spec):
+    # The dashboard's first listing of a region is a full load of its inventory
+    clear_inventories()
+
+
+def setup_list_instances_throttled(account, spec):
+    clear_inventories()
+    account.throttle_every = THROTTLE_EVERY
+    # Retry backoff is jittered; a fixed seed keeps the sleeps identical between runs
+    random.seed(0)
+
+
+def bench_list_instances(account, spec):
+    # What a cache miss of the dashboard's list_instances runs
+    list_inventory(REGION)
+
+
+def bench_list_instances_throttled(account, spec):
+    # The same listing through the send path: the rate limiter, retry handlers and
+    # before-send hooks all run, and throttled attempts are retried with backoff
+    list_inventory(REGION)
+
+
+def bench_get_instance_status(account, spec):
+    with contextlib.redirect_stdout(io.StringIO()):
+        get_instance_status(REGION, f"bench-{spec['instances'] - 1}")
+
+
+def bench_stop_instance(account, spec):
+    with contextlib.redirect_stdout(io.StringIO()):
+        stop_instance(REGION, f"bench-{spec['instances'] - 1}")
+
+
+def bench_bulk_stop_by_tag(account, spec):
+    bulk_change_state(REGION, "stop", tags={"tier": "web"}, interval=0)
+
+
+def setup_inventory(account, spec):
+    # A loaded inventory, after which 1% of the instances change state
+    account.inventory = InstanceInventory(REGION)
+    account.inventory.load()
+    for instance in account.instances[::100]:
+        instance['State'] = {'Code': 80, 'Name': 'stopped'}
+
+
+def bench_inventory_refresh(account, spec):
+    account.inventory.refresh()
+
+
+def bench_inventory_lookups(account, spec):
+    # 1000 Name lookups and a tag + state selection, all answered from the indexes
+    for index in range(1000):
+        account.inventory.find(f"bench-{index % spec['instances']}")
+    account.inventory.select(states=["running"], tags={"tier": "web"})
+
+
+def bench_fleet_metrics(account, spec):
+    collect_fleet_metrics(REGION, METRIC_GROUPS, all_running=True,
+                          start_time=END_TIME - METRIC_WINDOW, end_time=END_TIME)
+
+
+def bench_incremental_metrics(account, spec):
+    # A first refresh downloads the initial window, the next one only the newest period
+    fetcher = IncrementalFetcher(REGION)
+    metrics = [metric for group in METRIC_GROUPS.values() for metric in group]
+    instance_id = account.instances[0]['InstanceId']
+    fetcher.fetch([instance_id], metrics, end_time=END_TIME)
+    fetcher.fetch([instance_id], metrics, end_time=END_TIME + timedelta(minutes=5))
+
+
+def bench_fleet_aggregate(account, spec):
+    # Fleet-wide average lines computed by Metric Math; only the aggregates are downloaded
+    fleet_aggregate(REGION, METRIC_GROUPS, "avg", all_running=True, start_time=END_TIME - METRIC_WINDOW, end_time=END_TIME)
+
+
+def bench_fleet_aggregate_local(account, spec):
+    # The same lines reduced locally from every downloaded series
+    fleet_aggregate(REGION, METRIC_GROUPS, "avg", all_running=True, start_time=END_TIME - METRIC_WINDOW, end_time=END_TIME,
+                    server_side=False)
+
+
+def bench_fleet_top_n(account, spec):
+    fleet_top_n(REGION, METRIC_GROUPS, "NetworkOut", n=10, all_running=True,
+                start_time=END_TIME - METRIC_WINDOW, end_time=END_TIME)
+
+
+def setup_alerts(account, spec):
+    # The fleet's series are collected once per account; every run starts with a fresh engine
+    if getattr(account, "alert_series", None) is None:
+        account.alert_series = series_from_columns(collect_fleet_metrics(
+            REGION, METRIC_GROUPS, all_running=True, start_time=END_TIME - METRIC_WINDOW, end_time=END_TIME))
+    account.alert_engine = AlertEngine()
+
+
+def bench_alert_evaluation(account, spec):
+    # One tick of the default rules over the CPU and network series of every instance
+    account.alert_engine.evaluate(account.alert_series)
+
+
+def bench_s3_list_bucket(account, spec):
+    count_keys(account.bucket, region_name=REGION)
+
+
+def bench_s3_browse_folder(account, spec):
+    list_page(account.bucket, "logs/", region_name=REGION)
+    list_page(account.bucket, "logs/00000/", region_name=REGION)
+
+
+def bench_s3_upload(account, spec):
+    payload = io.BytesIO(b"\0" * (spec['upload_mib'] * MiB))
+    upload_stream(payload, account.bucket, "bench/upload.bin", region_name=REGION,
+                  size=spec['upload_mib'] * MiB, poll_interval=0.01)
+
+
+CASES = {
+    "list_instances": bench_list_instances,
+    "list_instances_throttled": bench_list_instances_throttled,
+    "get_instance_status": bench_get_instance_status,
+    "stop_instance": bench_stop_instance,
+    "bulk_stop_by_tag": bench_bulk_stop_by_tag,
+    "inventory_refresh": bench_inventory_refresh,
+    "inventory_lookups": bench_inventory_lookups,
+    "fleet_metrics": bench_fleet_metrics,
+    "incremental_metrics": bench_incremental_metrics,
+    "alert_evaluation": bench_alert_evaluation,
+    "fleet_aggregate": bench_fleet_aggregate,
+    "fleet_aggregate_local": bench_fleet_aggregate_local,
+    "fleet_top_n": bench_fleet_top_n,
+    "s3_list_bucket": bench_s3_list_bucket,
+    "s3_browse_folder": bench_s3_browse_folder,
+    "s3_upload": bench_s3_upload,
+}
+
+# Untimed preparation run before every timed run of a case
+SETUPS = {
+    "list_instances": setup_list_instances,
+    "list_instances_throttled": setup_list_instances_throttled,
+    "inventory_refresh": setup_inventory,
+    "inventory_lookups": setup_inventory,
+    "alert_evaluation": setup_alerts,
+}
+
+
+def build_account(spec):
+    """
+    Creates the synthetic account and routes the shared EC2, CloudWatch and S3 clients to it.
+    """
+    account = FakeAccount(REGION, spec['instances'], spec['objects'])
+    clear_clients()
+    for service in ("ec2", "cloudwatch", "s3"):
+        account.attach(get_client(service, region_name=REGION))
+    return account
+
+
+def _prepare(account, spec, setup):
+    # Every run starts from the same state: all instances running, no cached listings,
+    # no throttling and fresh rate limits
+    account.reset_states()
+    account.throttle_every = None
+    account.attempts = 0
+    reset_rate_limits()
+    invalidate("objects")
+    if setup is not None:
+        setup(account, spec)
+
+
+def measure(case, account, spec, repeat, setup=None):
+    """
+    Runs a case `repeat` times for wall time and API calls, then once more under
+    tracemalloc for peak memory (tracing slows code down, so it is not timed).
+    """
+    timings = []
+    api_calls = 0
+    for _ in range(repeat):
+        _prepare(account, spec, setup)
+        calls_before = total_calls()
+        start = time.perf_counter()
+        case(account, spec)
+        timings.append(time.perf_counter() - start)
+        api_calls += total_calls() - calls_before
+    api_calls //= repeat
+
+    _prepare(account, spec, setup)
+    tracemalloc.start()
+    try:
+        case(account, spec)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'wall_time_s': {'min': round(min(timings), 4), 'median': round(statistics.median(timings), 4)},
+        'api_calls': api_calls,
+        'peak_memory_mib': round(peak / MiB, 2),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns a message for every (case, size) that got slower or hungrier than the
+    baseline by more than tolerance, or that makes more API calls.
+    """
+    previous = {(row['case'], row['size']): row for row in baseline['results']}
+    regressions = []
+    for row in results:
+        old = previous.get((row['case'], row['size']))
+        if old is None:
+            continue
+        label = f"{row['case']}[{row['size']}]"
+        if row['wall_time_s']['median'] > old['wall_time_s']['median'] * (1 + tolerance):
+            regressions.append(f"{label}: median {old['wall_time_s']['median']}s -> {row['wall_time_s']['median']}s")
+        if row['api_calls'] > old['api_calls']:
+            regressions.append(f"{label}: API calls {old['api_calls']} -> {row['api_calls']}")
+        if row['peak_memory_mib'] > old['peak_memory_mib'] * (1 + tolerance) + 1:
+            regressions.append(f"{label}: peak memory {old['peak_memory_mib']} MiB -> {row['peak_memory_mib']} MiB")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite.")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=["small", "medium"])
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case (the median is reported)")
+    parser.add_argument("--output", default="benchmark_report.json", help="Where to write the JSON report")
+    parser.add_argument("--baseline", help="Earlier report to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    # Read first, so the baseline may also be the file the new report replaces
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    results = []
+    for size in args.sizes:
+        spec = SIZES[size]
+        account = build_account(spec)
+        for name in args.cases:
+            row = {'case': name, 'size': size, 'instances': spec['instances'], 'objects': spec['objects'],
+                   **measure(CASES[name], account, spec, args.repeat, SETUPS.get(name))}
+            results.append(row)
+            print(f"{name:<26}{size:<8}{row['wall_time_s']['median']:>10.4f}s{row['api_calls']:>8} calls"
+                  f"{row['peak_memory_mib']:>10.2f} MiB", flush=True)
+
+    report = {
+        'generated_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'results': results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Report written to {args.output}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
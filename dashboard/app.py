@@ -1,26 +1,88 @@
-import time
 import streamlit as st
-import boto3
 from botocore.exceptions import ClientError
 from streamlit_option_menu import option_menu
 import base64
 import logging
 from datetime import datetime, timedelta
-import plotly.graph_objs as go
-import tempfile
+import numpy as np
+import os
+import sys
+import uuid
+
+# Shared AWS helpers live next to the CLI scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from alerting import get_alert_engine
+from aws_clients import get_client, get_session
+from downsample import DEFAULT_MAX_POINTS, downsample
+from fleet_aggregates import AGGREGATES, SERVER_AGGREGATES, fleet_aggregate, fleet_top_n
+from fleet_ops import ACTIONS, change_instances, launch_fleet, select_instances
+from instance_inventory import list_inventory
+from instrumentation import api_stats, export_prometheus, helper_stats, reset as reset_instrumentation, timed, total_calls
+from inventory import MAX_REGION_WORKERS, REGION_TIMEOUT, list_enabled_regions, scan_regions
+from metrics_engine import collect_fleet_metrics
+from metrics_poller import SharedCollector, get_collector
+from rate_limiter import limiter_stats
+from s3_browser import count_keys, delete_keys, delete_prefix, list_pages, parent_prefix
+from s3_transfer import MiB, UPLOAD_CONCURRENCY, UPLOAD_PART_SIZE, upload_stream
+from timeseries import series_from_columns
+from ttl_cache import cached, invalidate
+
+
+@st.cache_resource
+def load_logo(logo_path):
+    # Read and encoded once per process instead of on every rerun
+    with open(logo_path, "rb") as image_file:
+        return base64.b64encode(image_file.read()).decode("utf-8")
+
+
+@st.cache_resource
+def available_regions(service_name):
+    return get_session().get_available_regions(service_name)
 
 
 # Load the logo
-logo_path = "logo.png"  # Replace with your logo file path
-with open(logo_path, "rb") as image_file:
-    encoded_logo = base64.b64encode(image_file.read()).decode("utf-8")
+encoded_logo = load_logo("logo.png")  # Replace with your logo file path
+
+
+@cached("security_groups")
+def fetch_security_group_ids(region_name):
+    ec2 = get_client("ec2", region_name=region_name)
+    response = ec2.describe_security_groups()
+    return [sg["GroupId"] for sg in response["SecurityGroups"]]
+
+
+@cached("key_pairs")
+def fetch_key_pair_names(region_name):
+    ec2 = get_client("ec2", region_name=region_name)
+    response = ec2.describe_key_pairs()
+    return [key["KeyName"] for key in response["KeyPairs"]]
+
+
+@cached("instances")
+def fetch_instances(region, states=None):
+    # A cache miss (expiry or invalidation after a change) costs a state poll, not a full describe
+    return list_inventory(region, states=states)
+
+
+@cached("subnets")
+def fetch_subnets(region_name):
+    paginator = get_client("ec2", region_name=region_name).get_paginator("describe_subnets")
+    return [
+        {"SubnetId": subnet["SubnetId"], "AvailabilityZone": subnet["AvailabilityZone"]}
+        for page in paginator.paginate()
+        for subnet in page["Subnets"]
+    ]
+
+
+@cached("buckets")
+def fetch_bucket_names(region_name):
+    buckets = get_client("s3", region_name=region_name).list_buckets()
+    return [bucket["Name"] for bucket in buckets.get("Buckets", [])]
 
 
 def list_security_groups(region_name):
     try:
-        ec2 = boto3.client("ec2", region_name=region_name)
-        response = ec2.describe_security_groups()
-        return [sg["GroupId"] for sg in response["SecurityGroups"]]
+        return fetch_security_group_ids(region_name)
     except ClientError as e:
         st.error(f"Error retrieving security groups: {e.response['Error']['Message']}")
         return []
@@ -28,9 +90,7 @@ def list_security_groups(region_name):
 
 def list_key_pairs(region_name):
     try:
-        ec2 = boto3.client("ec2", region_name=region_name)
-        response = ec2.describe_key_pairs()
-        return [key["KeyName"] for key in response["KeyPairs"]]
+        return fetch_key_pair_names(region_name)
     except ClientError as e:
         st.error(f"Error retrieving key pairs: {e.response['Error']['Message']}")
         return []
@@ -38,7 +98,7 @@ def list_key_pairs(region_name):
 
 def create_key_pair(region_name, key_name):
     try:
-        ec2 = boto3.client("ec2", region_name=region_name)
+        ec2 = get_client("ec2", region_name=region_name)
         response = ec2.create_key_pair(KeyName=key_name)
         private_key = response["KeyMaterial"]
         with open(f"{key_name}.pem", "w") as file:
@@ -48,11 +108,13 @@ def create_key_pair(region_name, key_name):
     except ClientError as e:
         st.error(f"Error creating key pair: {e.response['Error']['Message']}")
         return None
+    finally:
+        invalidate("key_pairs", scope=region_name)
 
 
 def start_instance(region_name, key_pair, security_group, instance_type, ami_id, instance_name, num_instances=1):
     try:
-        ec2 = boto3.client("ec2", region_name=region_name)
+        ec2 = get_client("ec2", region_name=region_name)
         response = ec2.run_instances(
             ImageId=ami_id,
             MinCount=1,
@@ -76,25 +138,17 @@ def start_instance(region_name, key_pair, security_group, instance_type, ami_id,
     except ClientError as e:
         st.error(f"Error launching instance: {e.response['Error']['Message']}")
         return None
-def list_instances(region):
+    finally:
+        invalidate("instances", scope=region_name)
+
+
+@timed("list_instances")
+def list_instances(region, states=None):
     """
     Retrieves the list of EC2 instances in the given region, including their state and tags.
     """
     try:
-        ec2_client = boto3.client("ec2", region_name=region)
-        response = ec2_client.describe_instances()
-        instances = []
-        for reservation in response["Reservations"]:
-            for instance in reservation["Instances"]:
-                instance_id = instance["InstanceId"]
-                state = instance["State"]["Name"]
-                name = None
-                if "Tags" in instance:
-                    for tag in instance["Tags"]:
-                        if tag["Key"] == "Name":
-                            name = tag["Value"]
-                instances.append({"InstanceId": instance_id, "Name": name, "State": state})
-        return instances
+        return fetch_instances(region, states=states)
     except ClientError as e:
         st.error(f"Error retrieving instances: {e.response['Error']['Message']}")
         return []
@@ -105,11 +159,13 @@ def start_instance_by_id(region, instance_id):
     Starts an EC2 instance by Instance ID.
     """
     try:
-        ec2_client = boto3.client("ec2", region_name=region)
+        ec2_client = get_client("ec2", region_name=region)
         ec2_client.start_instances(InstanceIds=[instance_id])
         st.success(f"Successfully started instance: {instance_id}")
     except ClientError as e:
         st.error(f"Error starting instance {instance_id}: {e.response['Error']['Message']}")
+    finally:
+        invalidate("instances", scope=region)
 
 
 def stop_instance_by_id(region, instance_id):
@@ -117,21 +173,23 @@ def stop_instance_by_id(region, instance_id):
     Stops an EC2 instance by Instance ID.
     """
     try:
-        ec2_client = boto3.client("ec2", region_name=region)
+        ec2_client = get_client("ec2", region_name=region)
         ec2_client.stop_instances(InstanceIds=[instance_id])
         st.success(f"Successfully stopped instance: {instance_id}")
     except ClientError as e:
         st.error(f"Error stopping instance {instance_id}: {e.response['Error']['Message']}")
+    finally:
+        invalidate("instances", scope=region)
 
 
 
 def create_bucket(bucket_name, region=None):
     try:
         if region is None:
-            s3_client = boto3.client("s3")
+            s3_client = get_client("s3")
             s3_client.create_bucket(Bucket=bucket_name)
         else:
-            s3_client = boto3.client("s3", region_name=region)
+            s3_client = get_client("s3", region_name=region)
             location = {"LocationConstraint": region}
             s3_client.create_bucket(
                 Bucket=bucket_name, CreateBucketConfiguration=location
@@ -140,71 +198,75 @@ def create_bucket(bucket_name, region=None):
     except ClientError as e:
         logging.error(e)
         return f"Failed to create bucket '{bucket_name}' in region '{region}': {e.response['Error']['Message']}"
+    finally:
+        # ListBuckets is global, so every region's listing is affected
+        invalidate("buckets")
 
 
-def upload_file_to_s3_with_file(bucket_name, file, file_name):
-    s3_client = boto3.client("s3")
-    try:
-        # Save the uploaded file to a temporary file
-        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-            temp_file.write(file.read())  # Write the file's content to the temporary file
-            temp_file_path = temp_file.name
+def upload_file_to_s3_with_file(bucket_name, file, file_name, part_size=UPLOAD_PART_SIZE, concurrency=UPLOAD_CONCURRENCY):
+    progress_bar = st.progress(0.0, text=f"Uploading '{file_name}'...")
+
+    def show_progress(bytes_uploaded, size):
+        if size:
+            progress_bar.progress(min(bytes_uploaded / size, 1.0), text=f"Uploaded {bytes_uploaded / MiB:.1f} of {size / MiB:.1f} MiB")
 
-        # Upload the temporary file to S3
-        s3_client.upload_file(temp_file_path, bucket_name, file_name)
+    try:
+        # The uploaded buffer is streamed straight into a parallel multipart upload
+        upload_stream(file, bucket_name, file_name, part_size=part_size, concurrency=concurrency,
+                      size=getattr(file, "size", None), on_progress=show_progress)
         return f"File '{file_name}' uploaded successfully to bucket '{bucket_name}'."
     except ClientError as e:
         logging.error(e)
         return f"Failed to upload file: {e.response['Error']['Message']}"
     finally:
-        # Clean up the temporary file
-        try:
-            import os
-            os.remove(temp_file_path)
-        except Exception as cleanup_error:
-            logging.error(f"Failed to delete temporary file: {cleanup_error}")
+        progress_bar.empty()
+        invalidate("objects", scope=bucket_name)
 
 
 # Function to delete an object from a bucket
 def delete_object(bucket_name, object_key):
     try:
-        s3_client = boto3.client("s3")
+        s3_client = get_client("s3")
         s3_client.delete_object(Bucket=bucket_name, Key=object_key)
         return f"Object '{object_key}' deleted successfully from bucket '{bucket_name}'."
     except ClientError as e:
         logging.error(e)
         return f"Failed to delete object '{object_key}' from bucket '{bucket_name}': {e.response['Error']['Message']}"
+    finally:
+        invalidate("objects", scope=bucket_name)
 
-def fetch_instance_metrics(region, instance_id, metrics_to_monitor):
-    cloudwatch_client = boto3.client('cloudwatch', region_name=region)
-    end_time = datetime.utcnow()
-    start_time = end_time - timedelta(minutes=5)
 
-    metric_data = []
-    for metric in metrics_to_monitor:
-        try:
-            response = cloudwatch_client.get_metric_statistics(
-                Namespace=metric['Namespace'],
-                MetricName=metric['MetricName'],
-                Dimensions=[{'Name': 'InstanceId', 'Value': instance_id}],
-                StartTime=start_time,
-                EndTime=end_time,
-                Period=300,
-                Statistics=['Average'],
-                Unit=metric['Unit']
-            )
-            datapoints = response.get('Datapoints', [])
-            if datapoints:
-                latest_point = sorted(datapoints, key=lambda x: x['Timestamp'])[-1]
-                metric_data.append({
-                    'MetricName': metric['MetricName'],
-                    'Timestamp': latest_point['Timestamp'],
-                    'Average': latest_point['Average'],
-                    'Unit': metric['Unit']
-                })
-        except Exception as e:
-            st.error(f"Error retrieving metric {metric['MetricName']}: {e}")
-    return metric_data
+def show_bulk_delete_result(result):
+    if result["Deleted"]:
+        st.success(f"Deleted {result['Deleted']} object(s).")
+    if result["Errors"]:
+        st.error(f"Failed to delete {len(result['Errors'])} object(s).")
+        st.dataframe(result["Errors"])
+
+
+def alert_rows(alerts):
+    # Timestamps are shown as naive UTC like the charts
+    return [{**alert, 'Timestamp': alert['Timestamp'].replace(tzinfo=None), 'Since': alert['Since'].replace(tzinfo=None)}
+            for alert in alerts]
+
+
+def show_notifier_errors():
+    # Breaches whose events could not be delivered must not look handled
+    alert_engine = get_alert_engine()
+    for failure in alert_engine.notifier_errors():
+        st.warning(f"{failure['Notifier']} could not deliver {failure['Events']} alert event(s) "
+                   f"at {failure['At']:%H:%M:%S} UTC: {failure['Error']}")
+    if alert_engine.dropped_events:
+        st.warning(f"{alert_engine.dropped_events} alert event(s) were dropped because the notifiers fell behind.")
+
+
+def show_alerts(breaches, empty_message="No active alerts."):
+    if not breaches:
+        st.success(empty_message)
+        return
+    st.error(f"{len(breaches)} active alert(s)")
+    st.dataframe(alert_rows(breaches), use_container_width=True, hide_index=True,
+                 column_order=["Severity", "Rule", "InstanceId", "MetricName", "Value", "Score", "Timestamp", "Since"])
 
 # Define groups of metrics
 metric_groups = {
@@ -235,7 +297,12 @@ with st.sidebar:
     )
 
 
-s3_regions = boto3.session.Session().get_available_regions("s3")
+# AWS API calls made (by every session and poller) since this session's previous rerun
+api_calls_now = total_calls()
+api_calls_since_rerun = api_calls_now - st.session_state.get("api_calls_at_rerun", api_calls_now)
+st.session_state["api_calls_at_rerun"] = api_calls_now
+
+s3_regions = available_regions("s3")
 default_region = "eu-north-1"
 default_index = s3_regions.index(default_region) if default_region in s3_regions else 0
 
@@ -244,8 +311,8 @@ with st.sidebar:
 
     selected_tab = option_menu(
         menu_title=None,
-        options=["EC2", "S3", "CloudWatch"],
-        icons=["server", "cloud", "graph-up-arrow"],
+        options=["EC2", "S3", "CloudWatch", "Inventory", "Diagnostics"],
+        icons=["server", "cloud", "graph-up-arrow", "globe", "speedometer2"],
         menu_icon="cast",
         default_index=0,
         styles={
@@ -266,31 +333,23 @@ with st.sidebar:
 if selected_tab == "EC2":
     st.header("EC2 Instance Management")
 
-    # Use tabs instead of radio buttons
-    tab1, tab2, tab3 = st.tabs(["Instance Information","Create Instance", "Manage Instances"])
+    # Only the selected view runs, so hidden views make no AWS calls (st.tabs would run them all)
+    ec2_view = st.radio("View", ["Instance Information", "Create Instance", "Manage Instances"],
+                        horizontal=True, label_visibility="collapsed", key="ec2_view")
 
-    with tab1:
+    if ec2_view == "Instance Information":
         st.subheader("Retrieve EC2 Instance Information")
 
         try:
-            ec2_client = boto3.client("ec2", region_name=selected_region)
-            response = ec2_client.describe_instances()
-            running_instances = []
-
-            # Filter only running instances
-            for reservation in response['Reservations']:
-                for instance in reservation['Instances']:
-                    if instance['State']['Name'] == 'running':
-                        instance_name = 'Unknown'
-                        if 'Tags' in instance:
-                            for tag in instance['Tags']:
-                                if tag['Key'] == 'Name':
-                                    instance_name = tag['Value']
-                        running_instances.append({
-                            'Instance Name': instance_name,
-                            'Instance ID': instance['InstanceId'],
-                            'State': instance['State']['Name']
-                        })
+            # Only running instances are requested from EC2
+            running_instances = [
+                {
+                    'Instance Name': instance['Name'] or 'Unknown',
+                    'Instance ID': instance['InstanceId'],
+                    'State': instance['State']
+                }
+                for instance in fetch_instances(selected_region, states=['running'])
+            ]
 
             if running_instances:
                 # Display running instances in a table
@@ -304,7 +363,7 @@ if selected_tab == "EC2":
         except Exception as e:
             st.error(f"Error retrieving instances: {e}")
 
-    with tab2:
+    elif ec2_view == "Create Instance":
         st.subheader("Launch a New EC2 Instance")
 
         security_groups = list_security_groups(selected_region)
@@ -345,7 +404,60 @@ if selected_tab == "EC2":
             else:
                 st.error("Please make sure all required inputs are provided!")
 
-    with tab3:
+        with st.expander("Fleet Launch"):
+            st.write("Launch many instances spread across subnets, with instance type fallbacks and safe re-runs.")
+            fleet_target = st.number_input("Target Instance Count", min_value=1, value=10, key="fleet_target")
+            fleet_types = st.multiselect("Instance Types (in fallback order)", instance_types, default=[selected_instance_type])
+            try:
+                subnets = fetch_subnets(selected_region)
+            except ClientError as e:
+                st.error(f"Error retrieving subnets: {e.response['Error']['Message']}")
+                subnets = []
+            fleet_subnets = st.multiselect(
+                "Subnets",
+                [subnet["SubnetId"] for subnet in subnets],
+                default=[subnet["SubnetId"] for subnet in subnets],
+                format_func=lambda subnet_id: next(
+                    f"{subnet_id} ({subnet['AvailabilityZone']})" for subnet in subnets if subnet["SubnetId"] == subnet_id
+                ),
+            )
+            if "fleet_token" not in st.session_state:
+                st.session_state["fleet_token"] = f"fleet-{uuid.uuid4().hex[:12]}"
+            fleet_token = st.text_input("Fleet Token", key="fleet_token", help="Re-running with the same token only launches the missing instances.")
+
+            if st.button("Launch Fleet"):
+                if not (fleet_types and fleet_subnets and fleet_token and instance_name):
+                    st.error("Please choose instance types, subnets, a fleet token and an instance name.")
+                else:
+                    progress_text = st.empty()
+                    try:
+                        result = launch_fleet(
+                            selected_region,
+                            fleet_target,
+                            ami_id,
+                            fleet_types,
+                            fleet_subnets,
+                            fleet_token,
+                            key_pair=selected_key_pair if key_pair_action == "Use Existing Key Pair" else None,
+                            security_group_ids=[selected_security_group] if selected_security_group else None,
+                            instance_name=instance_name,
+                            on_progress=lambda progress: progress_text.write(
+                                f"Round {progress['round']}: {progress['launched']}/{progress['target']} instance(s) launched"
+                            ),
+                        )
+                        st.success(f"Fleet '{fleet_token}' has {len(result['InstanceIds'])} instance(s).")
+                        if result["Shortfall"]:
+                            st.warning(f"{result['Shortfall']} instance(s) could not be launched.")
+                        for error in result["Errors"]:
+                            st.error(f"{error['SubnetId']} / {error['InstanceType']}: {error['Message']}")
+                        if result["WaitError"]:
+                            st.warning(f"Could not wait for the instances to run: {result['WaitError']}")
+                    except ClientError as e:
+                        st.error(f"Error launching fleet: {e.response['Error']['Message']}")
+                    finally:
+                        invalidate("instances", scope=selected_region)
+
+    elif ec2_view == "Manage Instances":
         st.subheader("Manage EC2 Instances")
         instances = list_instances(selected_region)
 
@@ -368,13 +480,64 @@ if selected_tab == "EC2":
         else:
             st.warning("No instances found in this region.")
 
+        st.subheader("Bulk Start / Stop")
+        bulk_action = st.radio("Action", ["Stop", "Start"], horizontal=True, key="bulk_action")
+        bulk_tag_key = st.text_input("Tag Key", key="bulk_tag_key")
+        bulk_tag_value = st.text_input("Tag Value", key="bulk_tag_value")
+        bulk_all = st.checkbox("Act on every instance in the region (no tag selector)", key="bulk_all")
+        wait_for_completion = st.checkbox("Wait until all instances reach their final state", value=True)
+
+        # Like the S3 prefix delete: the targets are resolved and shown first, then confirmed
+        bulk_tags = {bulk_tag_key: bulk_tag_value} if bulk_tag_key else None
+        bulk_selector = (selected_region, bulk_action, bulk_tag_key, bulk_tag_value, bulk_all)
+        if bulk_tag_value and not bulk_tag_key:
+            st.error("Enter the Tag Key the Tag Value belongs to.")
+        elif not bulk_tag_key and not bulk_all:
+            st.info("Enter a Tag Key (and optionally a Tag Value), or tick the box to act on every instance in the region.")
+        else:
+            if st.button("Preview Matching Instances"):
+                try:
+                    targets = select_instances(selected_region, tags=bulk_tags, states=ACTIONS[bulk_action.lower()]["from"])
+                    st.session_state["bulk_preview"] = (bulk_selector, targets)
+                except ClientError as e:
+                    st.error(f"Error selecting instances: {e.response['Error']['Message']}")
+
+            preview = st.session_state.get("bulk_preview")
+            if preview and preview[0] == bulk_selector:
+                targets = preview[1]
+                verb = "stopped" if bulk_action == "Stop" else "started"
+                st.info(f"{len(targets)} instance(s) will be {verb}.")
+                if targets:
+                    confirmed = st.checkbox(f"I understand that {len(targets)} instance(s) will be {verb}", key="bulk_confirm")
+                    if st.button(f"{bulk_action} {len(targets)} Instance(s)", disabled=not confirmed):
+                        progress_text = st.empty()
+                        try:
+                            result = change_instances(
+                                selected_region,
+                                bulk_action.lower(),
+                                targets,
+                                wait=wait_for_completion,
+                                on_progress=lambda counts: progress_text.write(
+                                    " | ".join(f"{state}: {count}" for state, count in sorted(counts.items()))
+                                ),
+                            )
+                            st.success(f"{bulk_action} requested for {len(result['Requested'])} instance(s).")
+                            for error in result["Errors"]:
+                                st.error(f"{error['Code']}: {error['Message']} ({len(error['InstanceIds'])} instance(s))")
+                        except ClientError as e:
+                            st.error(f"Error changing instance states: {e.response['Error']['Message']}")
+                        finally:
+                            st.session_state.pop("bulk_preview", None)
+                            invalidate("instances", scope=selected_region)
+
 elif selected_tab == "S3":
     st.header("S3 Bucket Management")
 
-    # Create tabs for the S3 actions
-    tab1, tab2, tab3 = st.tabs(["Create Bucket", "Upload Object", "Delete Object"])
+    # Only the selected S3 action is rendered and loads its data
+    s3_view = st.radio("View", ["Create Bucket", "Upload Object", "Delete Object"],
+                       horizontal=True, label_visibility="collapsed", key="s3_view")
 
-    with tab1:
+    if s3_view == "Create Bucket":
         st.subheader("Create a New S3 Bucket")
         bucket_name = st.text_input("Enter Bucket Name")
 
@@ -385,7 +548,7 @@ elif selected_tab == "S3":
             else:
                 st.error("Please provide both a bucket name and a region.")
 
-    with tab2:
+    elif s3_view == "Upload Object":
         st.subheader("Upload an Object to an S3 Bucket")
 
         # Initialize session state for controlling file uploader visibility
@@ -393,9 +556,7 @@ elif selected_tab == "S3":
             st.session_state["show_file_uploader"] = False
 
         try:
-            s3_client = boto3.client("s3", region_name=selected_region)
-            buckets = s3_client.list_buckets()
-            bucket_names = [bucket["Name"] for bucket in buckets.get("Buckets", [])]
+            bucket_names = fetch_bucket_names(selected_region)
         except ClientError as e:
             st.error(f"Error fetching buckets: {e.response['Error']['Message']}")
             bucket_names = []
@@ -409,9 +570,12 @@ elif selected_tab == "S3":
         # Conditionally show file uploader
         if st.session_state["show_file_uploader"]:
             file = st.file_uploader("Drag and drop or select a file to upload", key="upload_file")
+            with st.expander("Upload Settings"):
+                part_size_mib = st.slider("Part Size (MiB)", min_value=5, max_value=512, value=UPLOAD_PART_SIZE // MiB, step=5)
+                upload_concurrency = st.slider("Parallel Parts", min_value=1, max_value=32, value=UPLOAD_CONCURRENCY)
             if file and selected_bucket:
                 file_name = file.name  # Use the uploaded file's name as the object name
-                result = upload_file_to_s3_with_file(selected_bucket, file, file_name)
+                result = upload_file_to_s3_with_file(selected_bucket, file, file_name, part_size_mib * MiB, upload_concurrency)
                 if "successfully" in result:
                     st.success(result)
                     # Reset file uploader after successful upload
@@ -423,12 +587,11 @@ elif selected_tab == "S3":
             elif not file:
                 st.info("Please upload a file.")
 
-    with tab3:
+    elif s3_view == "Delete Object":
         st.subheader("Delete an Object from an S3 Bucket")
 
         try:
-            buckets = boto3.client("s3", region_name=selected_region).list_buckets()
-            bucket_names = [bucket["Name"] for bucket in buckets.get("Buckets", [])]
+            bucket_names = fetch_bucket_names(selected_region)
         except ClientError as e:
             st.error(f"Error fetching buckets: {e.response['Error']['Message']}")
             bucket_names = []
@@ -436,33 +599,269 @@ elif selected_tab == "S3":
         selected_bucket = st.selectbox("Select Bucket", bucket_names, key="delete_object_bucket")
 
         if selected_bucket:
+            # Browser position: current folder, prefix search and number of loaded pages
+            browser = st.session_state.get("object_browser")
+            if browser is None or browser["bucket"] != selected_bucket:
+                browser = {"bucket": selected_bucket, "prefix": "", "pages": 1}
+                st.session_state["object_browser"] = browser
+
+            search = st.text_input("Search keys starting with", key="delete_object_search",
+                                   help="Matched server-side against keys under the current folder.")
+            st.caption(f"s3://{selected_bucket}/{browser['prefix']}")
+            if browser["prefix"] and st.button("Up one folder"):
+                browser.update(prefix=parent_prefix(browser["prefix"]), pages=1)
+                st.rerun()
+
             try:
-                objects = boto3.client("s3", region_name=selected_region).list_objects_v2(Bucket=selected_bucket)
-                object_keys = [obj["Key"] for obj in objects.get("Contents", [])]
+                # A search lists every key below the folder; browsing lists one folder level
+                folders, objects, next_token = list_pages(
+                    selected_bucket,
+                    prefix=browser["prefix"] + search,
+                    delimiter=None if search else "/",
+                    pages=browser["pages"],
+                    region_name=selected_region,
+                )
             except ClientError as e:
                 st.error(f"Error fetching objects: {e.response['Error']['Message']}")
-                object_keys = []
-
-            if object_keys:
-                selected_object = st.selectbox("Select Object to Delete", object_keys, key="delete_object_key")
-
-                if st.button("Delete Object"):
-                    if selected_object:
-                        result = delete_object(selected_bucket, selected_object)
+                folders, objects, next_token = [], [], None
+
+            if folders:
+                selected_folder = st.selectbox("Folders", folders, format_func=lambda folder: folder[len(browser["prefix"]):])
+                if st.button("Open Folder"):
+                    browser.update(prefix=selected_folder, pages=1)
+                    st.rerun()
+
+            if objects:
+                object_keys = [obj["Key"] for obj in objects]
+                selected_objects = st.multiselect("Select Objects to Delete", object_keys, key="delete_object_keys")
+                st.caption(f"{len(object_keys)} object(s) loaded{' - more available' if next_token else ''}")
+
+                if next_token and st.button("Load More"):
+                    browser["pages"] += 1
+                    st.rerun()
+
+                if st.button("Delete Selected Objects"):
+                    if len(selected_objects) == 1:
+                        result = delete_object(selected_bucket, selected_objects[0])
                         st.success(result)
+                    elif selected_objects:
+                        show_bulk_delete_result(delete_keys(selected_bucket, selected_objects, region_name=selected_region))
                     else:
-                        st.error("Please select an object to delete.")
-            else:
+                        st.error("Please select at least one object to delete.")
+            elif not folders:
                 st.warning("No objects found in the selected bucket.")
 
+            # Bulk removal of everything under the current folder, with a dry run first
+            bulk_prefix = browser["prefix"] + search
+            with st.expander(f"Delete everything under s3://{selected_bucket}/{bulk_prefix}"):
+                if st.button("Count Objects (Dry Run)"):
+                    try:
+                        count, size = count_keys(selected_bucket, bulk_prefix, region_name=selected_region)
+                        st.session_state["bulk_delete_count"] = (selected_bucket, bulk_prefix, count)
+                        st.info(f"{count} object(s), {size / MiB:.1f} MiB would be deleted.")
+                    except ClientError as e:
+                        st.error(f"Error counting objects: {e.response['Error']['Message']}")
+
+                dry_run = st.session_state.get("bulk_delete_count")
+                if dry_run and dry_run[:2] == (selected_bucket, bulk_prefix) and dry_run[2]:
+                    confirmed = st.checkbox(f"I understand that {dry_run[2]} object(s) will be permanently deleted")
+                    if st.button("Delete All", disabled=not confirmed):
+                        progress_text = st.empty()
+                        result = delete_prefix(
+                            selected_bucket, bulk_prefix, region_name=selected_region,
+                            on_progress=lambda deleted, failed: progress_text.write(f"Deleted {deleted}, failed {failed}..."),
+                        )
+                        st.session_state.pop("bulk_delete_count", None)
+                        show_bulk_delete_result(result)
+
+# Inventory Tab scanning every enabled region at once
+elif selected_tab == "Inventory":
+    st.header("Multi-Region Inventory")
+
+    resource_labels = {
+        "Instances": "instances",
+        "Security Groups": "security_groups",
+        "Key Pairs": "key_pairs",
+        "Buckets": "buckets",
+    }
+    resource_label = st.selectbox("Resource", list(resource_labels))
+    max_workers = st.slider("Regions scanned in parallel", min_value=1, max_value=32, value=MAX_REGION_WORKERS)
+    region_timeout = st.slider("Per-region timeout (seconds)", min_value=5, max_value=120, value=int(REGION_TIMEOUT), step=5)
+
+    if st.button("Scan All Regions"):
+        import pandas as pd
+        progress = st.empty()
+        table = st.empty()
+        rows = []
+        finished = []
+        try:
+            regions = list_enabled_regions()
+        except ClientError as e:
+            st.error(f"Error fetching regions: {e.response['Error']['Message']}")
+            st.stop()
+
+        # Results are merged and re-rendered as each region finishes
+        for region, region_rows, error in scan_regions(resource_labels[resource_label], regions, max_workers, region_timeout):
+            finished.append(region)
+            rows.extend(region_rows)
+            if error is not None:
+                st.warning(f"{region}: {error}")
+            progress.progress(len(finished) / len(regions), text=f"Scanned {len(finished)}/{len(regions)} regions")
+            if rows:
+                table.dataframe(pd.DataFrame(rows), use_container_width=True)
+
+        st.success(f"Found {len(rows)} {resource_label.lower()} across {len(regions)} region(s).")
+
 # CloudWatch Tab for Monitoring
 elif selected_tab == "CloudWatch":
+    # Plotly is only imported once a chart page is opened
+    import plotly.graph_objs as go
+
     # CloudWatch view
     st.header("CloudWatch Monitoring")
 
+    monitoring_mode = st.radio("Monitoring Mode", ["Single Instance", "Fleet"], horizontal=True)
+
+    if monitoring_mode == "Fleet":
+        st.subheader("Fleet Metrics")
+        selector = st.radio("Select instances by", ["Instance IDs", "Tag", "All running"], horizontal=True)
+        fleet_instance_ids = None
+        fleet_tags = None
+        if selector == "Instance IDs":
+            ids_text = st.text_area("Instance IDs", help="One instance ID per line or comma-separated.")
+            fleet_instance_ids = [value.strip() for value in ids_text.replace(",", "\n").splitlines() if value.strip()]
+        elif selector == "Tag":
+            tag_key = st.text_input("Tag Key", value="Name")
+            tag_value = st.text_input("Tag Value")
+            fleet_tags = {tag_key: tag_value} if tag_key and tag_value else None
+        window_minutes = st.slider("Time Window (minutes)", min_value=15, max_value=720, value=60, step=15)
+        fleet_selection = dict(instance_ids=fleet_instance_ids, tags=fleet_tags, all_running=selector == "All running")
+        fleet_selected = selector == "All running" or fleet_instance_ids or fleet_tags
+        metric_names = [metric['MetricName'] for metrics in metric_groups.values() for metric in metrics]
+        fleet_view = st.radio("View", ["All series", "Aggregate", "Top N"], horizontal=True, key="fleet_view",
+                              help="Aggregate and Top N download one summary line per metric or only the top instances.")
+
+        if fleet_view == "Aggregate":
+            aggregate = st.selectbox("Aggregate", AGGREGATES, index=AGGREGATES.index("p95"),
+                                     help="avg, max, min and sum are computed by CloudWatch Metric Math; percentiles are reduced locally.")
+            if st.button("Compute Aggregates"):
+                if not fleet_selected:
+                    st.error("Please provide the instances to monitor.")
+                    st.stop()
+                end_time = datetime.utcnow()
+                try:
+                    st.session_state.fleet_aggregate = fleet_aggregate(
+                        selected_region, metric_groups, aggregate, **fleet_selection,
+                        start_time=end_time - timedelta(minutes=window_minutes), end_time=end_time, period=300,
+                    )
+                except Exception as e:
+                    st.error(f"Error computing fleet aggregates: {e}")
+
+            result = st.session_state.get("fleet_aggregate")
+            if result:
+                source = "by CloudWatch Metric Math" if result["Source"] == "metric-math" else "locally"
+                st.caption(f"{result['Aggregate']} across {result['Instances']} instance(s), computed {source}")
+                for group_name, metrics in metric_groups.items():
+                    fig = go.Figure(
+                        data=[
+                            go.Scatter(x=timestamps, y=values, mode='lines', name=metric['MetricName'])
+                            for metric in metrics
+                            for timestamps, values in [result["Series"].get(metric['MetricName'], ([], []))]
+                        ],
+                        layout=go.Layout(title=f"{group_name}: {result['Aggregate']} across the fleet", xaxis=dict(title="Time"), yaxis=dict(title="Metric Value"), height=400),
+                    )
+                    st.plotly_chart(fig, use_container_width=True, key=f"fleet_aggregate_{group_name}")
+            st.stop()
+
+        if fleet_view == "Top N":
+            col1, col2, col3, col4 = st.columns(4)
+            top_metric = col1.selectbox("Metric", metric_names, index=metric_names.index("NetworkOut"))
+            top_n = col2.number_input("Instances", min_value=1, max_value=100, value=10)
+            rank_by = col3.selectbox("Rank by", list(SERVER_AGGREGATES))
+            highest = col4.radio("Order", ["Highest", "Lowest"], horizontal=True) == "Highest"
+            if st.button("Find Top Instances"):
+                if not fleet_selected:
+                    st.error("Please provide the instances to monitor.")
+                    st.stop()
+                end_time = datetime.utcnow()
+                try:
+                    st.session_state.fleet_top_n = fleet_top_n(
+                        selected_region, metric_groups, top_metric, int(top_n), rank_by, highest, **fleet_selection,
+                        start_time=end_time - timedelta(minutes=window_minutes), end_time=end_time, period=300,
+                    )
+                except Exception as e:
+                    st.error(f"Error ranking fleet instances: {e}")
+
+            result = st.session_state.get("fleet_top_n")
+            if result:
+                source = "by CloudWatch Metric Math" if result["Source"] == "metric-math" else "locally"
+                st.caption(f"{len(result['Series'])} of {result['Instances']} instance(s) by {result['RankBy']} "
+                           f"{result['MetricName']}, ranked {source}")
+                fig = go.Figure(
+                    data=[go.Scatter(x=ranked["Timestamps"], y=ranked["Values"], mode='lines', name=ranked["InstanceId"])
+                          for ranked in result["Series"]],
+                    layout=go.Layout(title=f"Top instances by {result['RankBy']} {result['MetricName']}", xaxis=dict(title="Time"), yaxis=dict(title="Metric Value"), height=400),
+                )
+                st.plotly_chart(fig, use_container_width=True)
+                st.dataframe([{"InstanceId": ranked["InstanceId"], "Score": ranked["Score"]} for ranked in result["Series"]],
+                             use_container_width=True, hide_index=True)
+            st.stop()
+
+        if st.button("Collect Fleet Metrics"):
+            if not fleet_selected:
+                st.error("Please provide the instances to monitor.")
+                st.stop()
+            end_time = datetime.utcnow()
+            try:
+                st.session_state.fleet_metrics = collect_fleet_metrics(
+                    selected_region,
+                    metric_groups,
+                    **fleet_selection,
+                    start_time=end_time - timedelta(minutes=window_minutes),
+                    end_time=end_time,
+                    period=300,
+                )
+                # Every collected series goes through the local alert rules in one vectorized pass
+                st.session_state.fleet_alerts = get_alert_engine().evaluate(series_from_columns(st.session_state.fleet_metrics))
+            except Exception as e:
+                st.error(f"Error collecting fleet metrics: {e}")
+
+        fleet_metrics = st.session_state.get("fleet_metrics")
+        if fleet_metrics and fleet_metrics["Value"]:
+            import pandas as pd
+            df = pd.DataFrame(fleet_metrics)
+            df['Timestamp'] = pd.to_datetime(df['Timestamp'], utc=True).dt.tz_localize(None)
+            st.write(f"**{df['InstanceId'].nunique()} instance(s), {len(df)} datapoint(s)**")
+
+            st.subheader("Alerts")
+            show_notifier_errors()
+            show_alerts(st.session_state.get("fleet_alerts", []), "No alert rule is breached by the collected metrics.")
+
+            selected_metric = st.selectbox("Metric", [name for name in metric_names if name in set(df['MetricName'])])
+            metric_df = df[df['MetricName'] == selected_metric]
+            fig = go.Figure(
+                data=[
+                    go.Scatter(x=timestamps, y=values, mode='lines', name=fleet_instance_id)
+                    for fleet_instance_id, group in metric_df.sort_values('Timestamp').groupby('InstanceId')
+                    for timestamps, values in [downsample(group['Timestamp'].to_numpy(), group['Value'].to_numpy())]
+                ],
+                layout=go.Layout(title=f"{selected_metric} across the fleet", xaxis=dict(title="Time"), yaxis=dict(title="Metric Value"), height=400),
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
+            # Latest value of every metric per instance
+            latest = df.sort_values('Timestamp').groupby(['InstanceId', 'MetricName'])['Value'].last().unstack()
+            st.dataframe(latest)
+        elif fleet_metrics is not None:
+            st.warning("No datapoints found for the selected instances.")
+        st.stop()
+
     # Inputs for Instance ID and Refresh Interval
     instance_id = st.text_input("Instance ID", help="Enter the EC2 instance ID to monitor.")
     refresh_interval = st.slider("Refresh Interval (seconds)", min_value=10, max_value=120, value=30, step=10, help="Set the refresh interval for metric updates.")
+    chart_windows = {"Last hour": timedelta(hours=1), "Last 6 hours": timedelta(hours=6), "Last 24 hours": timedelta(hours=24), "All history": None}
+    chart_window = st.selectbox("Chart Window", list(chart_windows), index=3, help="Narrow the window to see the raw datapoints.")
+    max_points = st.slider("Max Points per Line", min_value=100, max_value=5000, value=DEFAULT_MAX_POINTS, step=100, help="Longer series are downsampled with LTTB before they are sent to the browser.")
 
     # Validate inputs
     if not instance_id or not selected_region:
@@ -471,50 +870,131 @@ elif selected_tab == "CloudWatch":
 
     st.write(f"Monitoring Instance: `{instance_id}` in Region: `{selected_region}`")
 
-    # Initialize session state for metrics data
-    if 'metric_data' not in st.session_state:
-        st.session_state.metric_data = {group: [] for group in metric_groups}
-
-    # Create containers for each group to update dynamically
-    graph_containers = {group_name: st.empty() for group_name in metric_groups}
-
-    # Main loop
-    while True:
-        for group_name, metrics_to_monitor in metric_groups.items():
-            metric_data = fetch_instance_metrics(selected_region, instance_id, metrics_to_monitor)
-            if metric_data:
-                st.session_state.metric_data[group_name].append({
-                    'timestamp': datetime.utcnow(),
-                    'data': metric_data
-                })
-
-                # Generate Plotly traces for the group
-                traces = []
-                for metric in metrics_to_monitor:
-                    metric_name = metric['MetricName']
-                    values = [
-                        data_point['Average'] for record in st.session_state.metric_data[group_name]
-                        for data_point in record['data']
-                        if data_point['MetricName'] == metric_name
-                    ]
-                    timestamps = [
-                        record['timestamp'] for record in st.session_state.metric_data[group_name]
-                        for data_point in record['data']
-                        if data_point['MetricName'] == metric_name
-                    ]
-                    trace = go.Scatter(x=timestamps, y=values, mode='lines+markers', name=metric_name)
-                    traces.append(trace)
-
-                # Create Plotly figure for the group
-                layout = go.Layout(
-                    title=f"{group_name} Metrics",
-                    xaxis=dict(title="Time"),
-                    yaxis=dict(title="Metric Value"),
-                    height=400,
-                )
-                fig = go.Figure(data=traces, layout=layout)
-
-                # Update the graph in its container
-                graph_containers[group_name].plotly_chart(fig, use_container_width=True)
-
-        time.sleep(refresh_interval)
+    # Sessions watching the same series share one background poller per process
+    subscription = st.session_state.get('metrics_subscription')
+    wanted_key = SharedCollector.series_key(selected_region, instance_id, metric_groups)
+    if (subscription is None or subscription.closed or subscription.key != wanted_key
+            or subscription.interval != refresh_interval or not subscription.poller.is_alive()):
+        if subscription is not None:
+            subscription.close()
+        subscription = get_collector().subscribe(selected_region, instance_id, metric_groups, interval=refresh_interval)
+        st.session_state.metrics_subscription = subscription
+    poller = subscription.poller
+    if poller.error('history') is not None:
+        st.warning(f"Metric history on disk could not be read or saved: {poller.error('history')}")
+    st.caption(f"{get_collector().subscriber_count(subscription.key)} session(s) watching this instance")
+
+    @st.fragment(run_every=refresh_interval)
+    def render_alerts():
+        # Breaches are evaluated by the shared collector across every monitored instance
+        alert_engine = get_alert_engine()
+        if poller.error('alerts') is not None:
+            st.warning(f"Alert evaluation failed: {poller.error('alerts')}")
+        show_notifier_errors()
+        show_alerts(alert_engine.active(instance_id), f"No active alerts for `{instance_id}`.")
+        evaluation = alert_engine.last_evaluation
+        if evaluation is not None:
+            st.caption(f"Last evaluation at {evaluation['At']:%H:%M:%S} UTC: {evaluation['Series']} series, "
+                       f"{evaluation['Breaches']} breach(es) in {evaluation['Seconds'] * 1000:.1f} ms")
+        with st.expander("Alerts across all monitored instances"):
+            show_alerts(alert_engine.active())
+            events = alert_engine.events()
+            if events:
+                st.write("Recent events")
+                st.dataframe(alert_rows(events), use_container_width=True, hide_index=True,
+                             column_order=["Status", "Severity", "Rule", "InstanceId", "MetricName", "Value", "Score", "Timestamp"])
+
+    st.subheader("Alerts")
+    render_alerts()
+
+    if 'metric_figures' not in st.session_state:
+        st.session_state.metric_figures = {}
+
+    @st.fragment(run_every=refresh_interval)
+    def render_metric_group(group_name, metrics_to_monitor):
+        error = poller.error(group_name)
+        if error is not None:
+            st.error(f"Error retrieving {group_name}: {error}")
+
+        # Figures are only rebuilt when the poller published new datapoints for the group. One
+        # figure per group is kept, so other instances and windows do not pile up in the session
+        figure_key = (subscription.key, chart_window, max_points, id(poller), poller.version(group_name))
+        cached_figure = st.session_state.metric_figures.get(group_name)
+        if cached_figure is not None and cached_figure[0] == figure_key:
+            fig = cached_figure[1]
+        else:
+            # Generate Plotly traces for the group
+            traces = []
+            for metric in metrics_to_monitor:
+                metric_name = metric['MetricName']
+                timestamps, values = poller.series(metric_name)
+                if chart_windows[chart_window] is not None and len(timestamps):
+                    cutoff = timestamps[-1] - np.timedelta64(chart_windows[chart_window])
+                    start = int(np.searchsorted(timestamps, cutoff))
+                    timestamps, values = timestamps[start:], values[start:]
+                timestamps, values = downsample(timestamps, values, max_points)
+                trace = go.Scatter(x=timestamps, y=values, mode='lines+markers', name=metric_name)
+                traces.append(trace)
+
+            # Create Plotly figure for the group
+            layout = go.Layout(
+                title=f"{group_name} Metrics",
+                xaxis=dict(title="Time"),
+                yaxis=dict(title="Metric Value"),
+                height=400,
+            )
+            fig = go.Figure(data=traces, layout=layout)
+            st.session_state.metric_figures[group_name] = (figure_key, fig)
+
+        st.plotly_chart(fig, use_container_width=True, key=f"metric_chart_{group_name}")
+
+    for group_name, metrics_to_monitor in metric_groups.items():
+        render_metric_group(group_name, metrics_to_monitor)
+
+# Diagnostics Tab showing where AWS calls and helper time go
+elif selected_tab == "Diagnostics":
+    import pandas as pd
+    st.header("Diagnostics")
+
+    api_rows = api_stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("API Calls", sum(row["Calls"] for row in api_rows), delta=api_calls_since_rerun, help="Delta: calls since the previous rerun")
+    col2.metric("Errors", sum(row["Errors"] for row in api_rows))
+    col3.metric("Retries", sum(row["Retries"] for row in api_rows))
+    col4.metric("Throttles", sum(row["Throttles"] for row in api_rows))
+
+    st.subheader("AWS API Calls")
+    if api_rows:
+        st.dataframe(pd.DataFrame(api_rows), use_container_width=True, hide_index=True)
+    else:
+        st.info("No AWS API calls recorded yet.")
+
+    st.subheader("Helpers")
+    helper_rows = helper_stats()
+    if helper_rows:
+        st.dataframe(pd.DataFrame(helper_rows), use_container_width=True, hide_index=True)
+    else:
+        st.info("No helper timings recorded yet.")
+
+    st.subheader("Rate Limiter")
+    limits = limiter_stats()
+    budget = limits["RetryBudget"]
+    st.write(f"Retry budget: {budget['Tokens']}/{budget['Capacity']} tokens left, {budget['Rejected']} retries rejected")
+    if limits["Buckets"]:
+        st.dataframe(pd.DataFrame(limits["Buckets"]), use_container_width=True, hide_index=True)
+
+    st.subheader("Alert Notifiers")
+    notifier_errors = get_alert_engine().notifier_errors()
+    if notifier_errors:
+        st.dataframe(pd.DataFrame(notifier_errors), use_container_width=True, hide_index=True)
+    else:
+        st.info("Every alert notifier delivered its latest events.")
+
+    metrics_text = export_prometheus()
+    col1, col2 = st.columns(2)
+    col1.download_button("Download Prometheus Metrics", metrics_text, file_name="metrics.prom", mime="text/plain")
+    if col2.button("Reset Counters"):
+        reset_instrumentation()
+        st.rerun()
+    with st.expander("Prometheus Text"):
+        st.code(metrics_text, language="text")
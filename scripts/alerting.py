@@ -0,0 +1,376 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import urllib.request
+from collections import deque
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Default rule limits: CPU percent for the threshold rule and |z| for the anomaly rules
+CPU_THRESHOLD = float(os.environ.get("ALERT_CPU_THRESHOLD", "90"))
+ZSCORE_THRESHOLD = float(os.environ.get("ALERT_ZSCORE_THRESHOLD", "3"))
+
+# Fewest baseline points a z-score is computed from. The dashboard's default one-hour fleet
+# window at a 300 s period holds at most 12 points, 10 or 11 of them before the newest one
+# once CloudWatch has not published the current period yet, so a few missing points are tolerated.
+ZSCORE_MIN_POINTS = 8
+
+# Optional URL that receives every batch of alert events as a JSON POST
+WEBHOOK_URL = os.environ.get("ALERT_WEBHOOK_URL", "")
+
+# Seconds after which a breach whose series is no longer evaluated (e.g. one raised by a
+# one-off fleet collection, or by a poller that stopped) expires
+ALERT_TTL = float(os.environ.get("ALERT_TTL", "900"))
+
+# Alert events (firing, resolved and expired) kept for display
+EVENT_HISTORY = 500
+
+# Event batches waiting for the notifier worker; batches beyond this are dropped and counted
+NOTIFICATION_QUEUE_SIZE = int(os.environ.get("ALERT_NOTIFICATION_QUEUE", "100"))
+
+
+class ThresholdRule:
+    """
+    Breaches when the last `points` values of a series are all above (or below) a threshold.
+    """
+
+    def __init__(self, name, metric_name, threshold, above=True, points=1, severity="critical"):
+        self.name = name
+        self.metric_name = metric_name
+        self.threshold = threshold
+        self.above = above
+        self.points = points
+        self.severity = severity
+
+    @property
+    def depth(self):
+        return self.points
+
+    def evaluate(self, timestamps, values):
+        """
+        Returns (breached, score) arrays with one entry per row of the value matrix.
+        """
+        recent = values[:, -self.points:]
+        # NaN (missing points) compares False, so short series never breach
+        beyond = recent > self.threshold if self.above else recent < self.threshold
+        return beyond.all(axis=1), values[:, -1]
+
+
+class ZScoreRule:
+    """
+    Breaches when the newest value lies more than `threshold` standard deviations from the
+    mean of the `window` values before it. std is floored at min_std so that near-constant
+    series do not turn tiny wiggles into anomalies.
+    """
+
+    def __init__(self, name, metric_name, threshold=ZSCORE_THRESHOLD, window=36, min_points=ZSCORE_MIN_POINTS, min_std=0.0,
+                 severity="warning"):
+        self.name = name
+        self.metric_name = metric_name
+        self.threshold = threshold
+        self.window = window
+        self.min_points = min_points
+        self.min_std = min_std
+        self.severity = severity
+
+    @property
+    def depth(self):
+        return self.window + 1
+
+    def evaluate(self, timestamps, values):
+        baseline = values[:, -self.window - 1:-1]
+        valid = ~np.isnan(baseline)
+        count = valid.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(valid, baseline, 0.0).sum(axis=1) / count
+            deviations = np.where(valid, baseline - mean[:, None], 0.0)
+            std = np.maximum(np.sqrt((deviations ** 2).sum(axis=1) / count), self.min_std)
+            score = (values[:, -1] - mean) / std
+            breached = (count >= self.min_points) & (np.abs(score) >= self.threshold)
+        return breached, score
+
+
+class RateOfChangeRule:
+    """
+    Breaches when a series changed faster than max_change per `per` seconds between its
+    last two points. direction is "both", "up" or "down".
+    """
+
+    def __init__(self, name, metric_name, max_change, per=300, direction="both", severity="warning"):
+        self.name = name
+        self.metric_name = metric_name
+        self.max_change = max_change
+        self.per = per
+        self.direction = direction
+        self.severity = severity
+
+    @property
+    def depth(self):
+        return 2
+
+    def evaluate(self, timestamps, values):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rate = (values[:, -1] - values[:, -2]) / (timestamps[:, -1] - timestamps[:, -2]) * self.per
+            if self.direction == "up":
+                breached = rate > self.max_change
+            elif self.direction == "down":
+                breached = rate < -self.max_change
+            else:
+                breached = np.abs(rate) > self.max_change
+        return breached, rate
+
+
+def default_rules():
+    return [
+        ThresholdRule("High CPU", "CPUUtilization", CPU_THRESHOLD, points=3),
+        RateOfChangeRule("CPU spike", "CPUUtilization", 50, direction="up"),
+        ZScoreRule("CPU anomaly", "CPUUtilization", min_std=1.0),
+        ZScoreRule("NetworkIn anomaly", "NetworkIn", min_std=65536),
+        ZScoreRule("NetworkOut anomaly", "NetworkOut", min_std=65536),
+    ]
+
+
+def series_matrix(series, keys, depth):
+    """
+    Stacks the last `depth` points of each series into (timestamps, values) matrices of
+    shape (len(keys), depth). Shorter series are right-aligned and padded with NaN;
+    timestamps are epoch seconds.
+    """
+    timestamps = np.full((len(keys), depth), np.nan)
+    values = np.full((len(keys), depth), np.nan)
+    for row, key in enumerate(keys):
+        series_timestamps, series_values = series[key]
+        count = min(depth, len(series_values))
+        if count:
+            timestamps[row, depth - count:] = np.asarray(series_timestamps[-count:], dtype="datetime64[ns]").view(np.int64)
+            values[row, depth - count:] = series_values[-count:]
+    return timestamps / 1e9, values
+
+
+class LogNotifier:
+    """
+    Writes every alert event to the logging module.
+    """
+
+    def __init__(self, logger=None):
+        self.logger = logger or logging.getLogger("alerting")
+
+    def __call__(self, events):
+        for event in events:
+            level = logging.WARNING if event['Status'] == "firing" else logging.INFO
+            self.logger.log(level, "[%s] %s on %s/%s: value %.4g, score %.4g", event['Status'].upper(), event['Rule'],
+                            event['InstanceId'], event['MetricName'], event['Value'], event['Score'])
+
+
+class WebhookNotifier:
+    """
+    POSTs each batch of alert events as a JSON list to a URL.
+    """
+
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def __call__(self, events):
+        body = json.dumps(events, default=str).encode()
+        request = urllib.request.Request(self.url, data=body, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+
+class AlertEngine:
+    """
+    Evaluates alert rules over many series at once.
+
+    Each call to evaluate() stacks the newest points of every series of a metric into
+    one matrix, so a rule runs as a handful of NumPy operations over the whole fleet
+    instead of a Python loop per series. Breaches are tracked between calls: notifiers
+    (any callable taking a list of event dicts) only hear about breaches that start
+    ("firing"), end ("resolved") or whose series went unevaluated for ttl seconds ("expired").
+
+    Notifiers run on one background worker fed by a bounded queue, so a slow webhook
+    never holds up the poller thread that evaluated the alerts. When the queue is
+    full, the batch is dropped and its events are counted in dropped_events.
+    """
+
+    def __init__(self, rules=None, notifiers=None, ttl=ALERT_TTL, queue_size=NOTIFICATION_QUEUE_SIZE):
+        self.rules = default_rules() if rules is None else list(rules)
+        self.notifiers = list(notifiers or [])
+        self.ttl = ttl
+        self.last_evaluation = None
+        self._active = {}
+        self._evaluated_at = {}
+        self._events = deque(maxlen=EVENT_HISTORY)
+        self._notifier_errors = {}
+        self.dropped_events = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._worker = None
+        self._lock = threading.Lock()
+
+    @property
+    def metric_names(self):
+        return list(dict.fromkeys(rule.metric_name for rule in self.rules))
+
+    @property
+    def depth(self):
+        return max((rule.depth for rule in self.rules), default=0)
+
+    def _breaches(self, series):
+        keys_by_metric = {}
+        for key in series:
+            keys_by_metric.setdefault(key[1], []).append(key)
+
+        breaches = {}
+        for metric_name in self.metric_names:
+            keys = keys_by_metric.get(metric_name)
+            if not keys:
+                continue
+            rules = [rule for rule in self.rules if rule.metric_name == metric_name]
+            timestamps, values = series_matrix(series, keys, max(rule.depth for rule in rules))
+            for rule in rules:
+                breached, score = rule.evaluate(timestamps, values)
+                for row in np.flatnonzero(breached):
+                    instance_id = keys[row][0]
+                    breaches[(rule.name, instance_id, metric_name)] = {
+                        'Rule': rule.name,
+                        'Severity': rule.severity,
+                        'InstanceId': instance_id,
+                        'MetricName': metric_name,
+                        'Value': float(values[row, -1]),
+                        'Score': float(score[row]),
+                        'Timestamp': datetime.fromtimestamp(timestamps[row, -1], tz=timezone.utc),
+                    }
+        return breaches
+
+    def evaluate(self, series):
+        """
+        Runs every rule over {(InstanceId, MetricName): (timestamps, values)} and returns
+        the breaches of those series. Only breaches of series present in `series` can
+        resolve, so callers may evaluate different parts of the fleet independently.
+        """
+        start = time.perf_counter()
+        breaches = self._breaches(series)
+        with self._lock:
+            events = []
+            now = time.monotonic()
+            for key, breach in breaches.items():
+                previous = self._active.get(key)
+                breach['Since'] = previous['Since'] if previous else breach['Timestamp']
+                if previous is None:
+                    events.append({'Status': "firing", **breach})
+                self._active[key] = breach
+                self._evaluated_at[key] = now
+            for key in [key for key in self._active if key not in breaches and key[1:] in series]:
+                del self._evaluated_at[key]
+                events.append({'Status': "resolved", **self._active.pop(key)})
+            events.extend(self._expire(now))
+            self._events.extend(events)
+            self.last_evaluation = {
+                'Series': len(series),
+                'Breaches': len(breaches),
+                'Seconds': time.perf_counter() - start,
+                'At': datetime.now(timezone.utc),
+            }
+        if events:
+            self._notify(events)
+        return list(breaches.values())
+
+    def _expire(self, now):
+        # Called with the lock held; the caller records and delivers the events
+        expired = [key for key, evaluated_at in self._evaluated_at.items() if now - evaluated_at > self.ttl]
+        events = []
+        for key in expired:
+            del self._evaluated_at[key]
+            events.append({'Status': "expired", **self._active.pop(key)})
+        return events
+
+    def _notify(self, events):
+        if not self.notifiers:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._deliver_queued, name="alert-notifier", daemon=True)
+                self._worker.start()
+        try:
+            self._queue.put_nowait(events)
+        except queue.Full:
+            logging.error(f"Alert notification queue is full; dropped {len(events)} event(s)")
+            with self._lock:
+                self.dropped_events += len(events)
+
+    def _deliver_queued(self):
+        while True:
+            events = self._queue.get()
+            try:
+                self._deliver(events)
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """
+        Waits until every queued batch of events was handed to the notifiers.
+        """
+        self._queue.join()
+
+    def _deliver(self, events):
+        for notifier in self.notifiers:
+            # Plain functions are named after themselves, notifier objects after their class
+            name = getattr(notifier, "__name__", type(notifier).__name__)
+            try:
+                notifier(events)
+            except Exception as e:
+                logging.error(f"Alert notifier {name} failed to deliver {len(events)} event(s): {e}")
+                with self._lock:
+                    self._notifier_errors[name] = {'Notifier': name, 'Error': str(e), 'Events': len(events),
+                                                   'At': datetime.now(timezone.utc)}
+            else:
+                with self._lock:
+                    self._notifier_errors.pop(name, None)
+
+    def active(self, instance_id=None):
+        """
+        Returns the ongoing breaches, optionally of one instance only, newest first.
+        Breaches past their ttl expire here as well, so they leave the list even when
+        nothing evaluates their series any more.
+        """
+        with self._lock:
+            events = self._expire(time.monotonic())
+            self._events.extend(events)
+            breaches = [breach for breach in self._active.values() if instance_id is None or breach['InstanceId'] == instance_id]
+        if events:
+            self._notify(events)
+        return sorted(breaches, key=lambda breach: breach['Timestamp'], reverse=True)
+
+    def events(self):
+        with self._lock:
+            return list(reversed(self._events))
+
+    def notifier_errors(self):
+        """
+        Returns the last failure of every notifier whose latest delivery failed.
+        """
+        with self._lock:
+            return list(self._notifier_errors.values())
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_alert_engine():
+    """
+    Returns the process-wide AlertEngine with the default rules. Events are logged and,
+    when ALERT_WEBHOOK_URL is set, posted to that URL.
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            notifiers = [LogNotifier()]
+            if WEBHOOK_URL:
+                notifiers.append(WebhookNotifier(WEBHOOK_URL))
+            _engine = AlertEngine(notifiers=notifiers)
+        return _engine
@@ -0,0 +1,63 @@
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+
+from instrumentation import instrument
+from rate_limiter import MAX_ATTEMPTS, install
+
+# Size of each client's HTTP connection pool; raise it for highly concurrent callers
+MAX_POOL_CONNECTIONS = int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", "50"))
+
+_lock = threading.Lock()
+_sessions = {}
+_clients = {}
+
+
+def get_session(profile_name=None):
+    """
+    Returns the process-wide boto3 session for a credentials profile.
+    """
+    with _lock:
+        session = _sessions.get(profile_name)
+        if session is None:
+            session = boto3.session.Session(profile_name=profile_name)
+            _sessions[profile_name] = session
+        return session
+
+
+def get_client(service_name, region_name=None, profile_name=None, max_pool_connections=None):
+    """
+    Returns a shared, rate-limited client for (service, region, profile), creating it on first use.
+    Clients are thread-safe, so repeat callers reuse the loaded service model and the
+    warm keep-alive connections of the first client instead of building a new one.
+    """
+    key = (service_name, region_name, profile_name)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    session = get_session(profile_name)
+    # Session objects are not thread-safe, so client construction is serialised
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            config = Config(
+                max_pool_connections=max_pool_connections or MAX_POOL_CONNECTIONS,
+                retries={'mode': 'standard', 'total_max_attempts': MAX_ATTEMPTS},
+            )
+            # Every call goes through the shared per-operation rate limiter and retry budget,
+            # and is recorded by the API call instrumentation
+            client = instrument(install(session.client(service_name, region_name=region_name, config=config)))
+            _clients[key] = client
+        return client
+
+
+def clear_clients():
+    """
+    Drops every cached session and client, e.g. after credentials were rotated.
+    """
+    with _lock:
+        _clients.clear()
+        _sessions.clear()
@@ -1,11 +1,12 @@
-import boto3
-from datetime import datetime, timedelta
+from metric_history import get_history_store
+from metrics_engine import IncrementalFetcher
+from datetime import datetime
 import time
 
-def monitor_instance_metrics_realtime(region, instance_id, refresh_interval=60):
+def monitor_instance_metrics_realtime(region, instance_id, refresh_interval=60, history=None):
     try:
-        # Initialize the CloudWatch client for the specified region
-        cloudwatch_client = boto3.client('cloudwatch', region_name=region)
+        # Datapoints are also kept on disk for later dashboards and offline analysis
+        history = history or get_history_store()
 
         # Define the metrics to monitor
         metrics_to_monitor = [
@@ -27,36 +28,37 @@ def monitor_instance_metrics_realtime(region, instance_id, refresh_interval=60):
         print(f"Starting real-time monitoring for instance {instance_id} in region {region}...")
         print("Press Ctrl+C to stop the monitoring.")
 
+        # Keeps a watermark per metric so each refresh only downloads new datapoints
+        fetcher = IncrementalFetcher(region, period=300)
+
         while True:
-            # Define the time range for the current fetch
             end_time = datetime.utcnow()
-            start_time = end_time - timedelta(minutes=5)  # Fetch data for the last 5 minutes
 
             print(f"\n[Real-Time Update: {end_time.strftime('%Y-%m-%d %H:%M:%S')} UTC]")
-            for metric in metrics_to_monitor:
-                try:
-                    response = cloudwatch_client.get_metric_statistics(
-                        Namespace=metric['Namespace'],
-                        MetricName=metric['MetricName'],
-                        Dimensions=[
-                            {'Name': 'InstanceId', 'Value': instance_id}
-                        ],
-                        StartTime=start_time,
-                        EndTime=end_time,
-                        Period=300,  # Data points every 5 minutes
-                        Statistics=['Average'],
-                        Unit=metric['Unit']
-                    )
+            try:
+                # Fetch every metric in a single batched GetMetricData round trip
+                results = fetcher.fetch([instance_id], metrics_to_monitor)
+            except Exception as e:
+                print(f"Error retrieving metrics: {e}")
+                results = {}
 
-                    # Print the latest data point, if available
-                    datapoints = response.get('Datapoints', [])
-                    if datapoints:
-                        latest_point = sorted(datapoints, key=lambda x: x['Timestamp'])[-1]
-                        print(f"Metric: {metric['MetricName']}, Average Value: {latest_point['Average']} {metric['Unit']}")
-                    else:
-                        print(f"Metric: {metric['MetricName']}, No data available for the last 5 minutes.")
-                except Exception as e:
-                    print(f"Error retrieving metric {metric['MetricName']}: {e}")
+            try:
+                history.write_points(
+                    ((region, series_instance_id, metric_name, timestamp, value)
+                     for (series_instance_id, metric_name), points in results.items()
+                     for timestamp, value in points),
+                    fetcher.period, fetcher.statistic,
+                )
+            except Exception as e:
+                print(f"Error saving metrics history: {e}")
+
+            for metric in metrics_to_monitor:
+                datapoints = results.get((instance_id, metric['MetricName']), [])
+                # Print every data point published since the previous refresh
+                for timestamp, value in datapoints:
+                    print(f"Metric: {metric['MetricName']}, {timestamp.strftime('%Y-%m-%d %H:%M:%S')} UTC, Average Value: {value} {metric['Unit']}")
+                if results and not datapoints:
+                    print(f"Metric: {metric['MetricName']}, No new data since the last update.")
 
             # Wait for the next refresh
             time.sleep(refresh_interval)
@@ -68,7 +70,8 @@ def monitor_instance_metrics_realtime(region, instance_id, refresh_interval=60):
 
 
 
-region = 'eu-north-1'
-instance_id = 'i-0fde582b868f11d61'
-monitor_instance_metrics_realtime(region, instance_id)
-monitor_instance_metrics_realtime(region, instance_id, refresh_interval=30)
+if __name__ == "__main__":
+    # e.g. python scripts/cloudwatch_metrics.py --region eu-north-1 i-0fde582b868f11d61 --follow --interval 30
+    import sys
+    from fleet_cli import main
+    sys.exit(main(["metrics", *sys.argv[1:]]))
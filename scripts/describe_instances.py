@@ -1,38 +1,13 @@
-import boto3
+from instance_lookup import find_instances
 
-def get_instance_status(region, identifier):
+def get_instance_status(region, identifier, inventory=None):
     try:
-        # Initialize the EC2 client for the specified region
-        ec2_client = boto3.client('ec2', region_name=region)
-
-        # Retrieve all instances
-        response = ec2_client.describe_instances()
-
-        # List to store matching instances
-        matching_instances = []
-
-        # Search for the target instance(s) by ID or Name tag
-        for reservation in response['Reservations']:
-            for instance in reservation['Instances']:
-                instance_id = instance['InstanceId']
-                instance_state = instance['State']['Name']
-
-                # Check if identifier matches the Instance ID
-                if instance_id == identifier:
-                    matching_instances.append({
-                        'InstanceId': instance_id,
-                        'State': instance_state
-                    })
-
-                # Check if identifier matches the Name tag
-                if 'Tags' in instance:
-                    for tag in instance['Tags']:
-                        if tag['Key'] == 'Name' and tag['Value'] == identifier:
-                            matching_instances.append({
-                                'InstanceId': instance_id,
-                                'State': instance_state,
-                                'Name': tag['Value']
-                            })
+        if inventory is not None:
+            # Many lookups share one loaded InstanceInventory and are answered from its indexes
+            matching_instances = [record.as_dict() for record in inventory.find(identifier)]
+        else:
+            # Match the target instance(s) by ID or Name tag server-side
+            matching_instances = find_instances(region, identifier)
 
         # Print all matching instances
         if matching_instances:
@@ -45,8 +20,8 @@ def get_instance_status(region, identifier):
     except Exception as e:
         print(f"Error retrieving instance status: {e}")
 
-# Retrieve by Instance ID
-get_instance_status(region='eu-north-1', identifier='i-047944d99cd7991bc')
-
-# Retrieve by Instance Name
-get_instance_status(region='eu-north-1', identifier='nicgar_santej_lab3')
+if __name__ == "__main__":
+    # e.g. python scripts/describe_instances.py --region eu-north-1 i-047944d99cd7991bc nicgar_santej_lab3
+    import sys
+    from fleet_cli import main
+    sys.exit(main(["describe", *sys.argv[1:]]))
@@ -0,0 +1,88 @@
+import numpy as np
+
+# Points kept per chart trace unless the caller asks for another target
+DEFAULT_MAX_POINTS = 1000
+
+
+def _as_float(x):
+    # datetime64 axes are reduced on their integer representation
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype("datetime64[ns]").astype(np.int64).astype(np.float64)
+    return x.astype(np.float64)
+
+
+def minmax_indices(y, max_points):
+    """
+    Returns sorted indices keeping the minimum and maximum of max_points // 2 equal buckets,
+    plus the first and last point. Fully vectorized.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n <= max_points or max_points < 4:
+        return np.arange(n)
+
+    n_buckets = (max_points - 2) // 2
+    edges = np.linspace(1, n - 1, n_buckets + 1).astype(np.int64)
+    width = int(np.max(np.diff(edges)))
+    # Each bucket becomes one row, padded with NaN up to the widest bucket
+    offsets = edges[:-1, None] + np.arange(width)[None, :]
+    valid = offsets < edges[1:, None]
+    offsets = np.where(valid, offsets, edges[:-1, None])
+    rows = np.where(valid, y[offsets], np.nan)
+    rows_for_min = np.where(np.isnan(rows), np.inf, rows)
+    rows_for_max = np.where(np.isnan(rows), -np.inf, rows)
+    bucket_index = np.arange(n_buckets)
+    mins = offsets[bucket_index, np.argmin(rows_for_min, axis=1)]
+    maxs = offsets[bucket_index, np.argmax(rows_for_max, axis=1)]
+    return np.unique(np.concatenate(([0], mins, maxs, [n - 1])))
+
+
+def lttb_indices(x, y, max_points):
+    """
+    Largest-Triangle-Three-Buckets: returns max_points sorted indices that best
+    preserve the visual shape of the series. Each bucket's triangle areas are
+    computed with NumPy; only the walk over buckets is a Python loop.
+    """
+    x = _as_float(x)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n <= max_points or max_points < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    anchor = 0
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # The next bucket's average is the third corner of every candidate triangle
+        next_start, next_end = end, edges[bucket + 2] if bucket + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        areas = np.abs(
+            (x[anchor] - avg_x) * (y[start:end] - y[anchor])
+            - (x[anchor] - x[start:end]) * (avg_y - y[anchor])
+        )
+        anchor = start + int(np.argmax(areas))
+        selected[bucket + 1] = anchor
+    return selected
+
+
+def downsample(x, y, max_points=DEFAULT_MAX_POINTS, method="lttb"):
+    """
+    Reduces a series to at most max_points points with LTTB or min/max bucketing.
+    Series that already fit are returned unchanged.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if len(y) <= max_points:
+        return x, y
+    if method == "minmax":
+        indices = minmax_indices(y, max_points)
+    elif method == "lttb":
+        indices = lttb_indices(x, y, max_points)
+    else:
+        raise ValueError(f"Unknown downsampling method '{method}'.")
+    return x[indices], y[indices]
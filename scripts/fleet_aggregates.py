@@ -0,0 +1,257 @@
+import logging
+import warnings
+from datetime import datetime, timedelta
+
+import numpy as np
+from botocore.exceptions import ClientError
+
+from aws_clients import get_client
+from instrumentation import timed
+from metrics_engine import MAX_QUERIES_PER_REQUEST, build_fleet_queries, collect_fleet_metrics, resolve_instance_ids
+from timeseries import align_series, series_from_columns, to_datetime64
+
+# Aggregates that CloudWatch Metric Math computes across series, by their expression function
+SERVER_AGGREGATES = {"avg": "AVG", "max": "MAX", "min": "MIN", "sum": "SUM"}
+
+# Percentiles have no cross-series Metric Math function and are always reduced locally
+PERCENTILES = {"p50": 50, "p90": 90, "p95": 95, "p99": 99}
+
+AGGREGATES = tuple(SERVER_AGGREGATES) + tuple(PERCENTILES)
+
+# Metric queries per request when expressions are evaluated server-side; the rest of
+# the 500 queries allowed per GetMetricData request is left for the expressions
+SERVER_CHUNK_SIZE = MAX_QUERIES_PER_REQUEST - 2
+
+_REDUCERS = {"avg": np.nanmean, "max": np.nanmax, "min": np.nanmin, "sum": np.nansum}
+
+
+def find_metric(metric_groups, metric_name):
+    """
+    Returns the metric definition named metric_name in metric_groups.
+    """
+    for metrics in metric_groups.values():
+        for metric in metrics:
+            if metric['MetricName'] == metric_name:
+                return metric
+    raise ValueError(f"Metric {metric_name} is not part of the metric groups.")
+
+
+def reduce_matrix(matrix, aggregate, axis=0):
+    """
+    Reduces a NaN-padded matrix with one of AGGREGATES, ignoring missing points.
+    """
+    if aggregate not in AGGREGATES:
+        raise ValueError(f"Unknown aggregate {aggregate}; use one of {', '.join(AGGREGATES)}.")
+    # Rows or columns without any point reduce to NaN; numpy warns about those
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        if aggregate in PERCENTILES:
+            return np.nanpercentile(matrix, PERCENTILES[aggregate], axis=axis)
+        return _REDUCERS[aggregate](matrix, axis=axis)
+
+
+def aggregate_series(series, metric_name, aggregate):
+    """
+    Local fallback: reduces the metric_name series of {(InstanceId, MetricName): (timestamps, values)}
+    to one (timestamps, values) series, point by point across instances.
+    """
+    timestamps, matrix = align_series([points for key, points in series.items() if key[1] == metric_name])
+    if not len(timestamps):
+        return timestamps, np.empty(0)
+    return timestamps, reduce_matrix(matrix, aggregate)
+
+
+def top_n_series(series, metric_name, n=10, rank_by="avg", descending=True):
+    """
+    Local fallback: ranks the instances by rank_by over their whole metric_name series
+    and returns the first n as dicts with InstanceId, Score, Timestamps and Values.
+    """
+    keys = [key for key in series if key[1] == metric_name]
+    if not keys:
+        return []
+    _, matrix = align_series([series[key] for key in keys])
+    scores = reduce_matrix(matrix, rank_by, axis=1)
+    # Instances without datapoints (NaN scores) always rank last
+    order = np.argsort(np.where(np.isnan(scores), -np.inf if descending else np.inf, scores), kind="stable")
+    if descending:
+        order = order[::-1]
+    return [
+        {'InstanceId': keys[row][0], 'Score': float(scores[row]),
+         'Timestamps': series[keys[row]][0], 'Values': series[keys[row]][1]}
+        for row in order[:n]
+    ]
+
+
+def _hidden_queries(instance_ids, metric, period, statistic):
+    # Inputs of the expressions: evaluated by CloudWatch, but not returned
+    queries, query_index = build_fleet_queries(instance_ids, [metric], (statistic,), period)
+    for query in queries:
+        query['ReturnData'] = False
+        query['Label'] = query_index[query['Id']][0]
+    return queries
+
+
+def _expression(query_id, expression, period):
+    return {'Id': query_id, 'Expression': expression, 'Period': period, 'ReturnData': True}
+
+
+def _get_expression_results(cloudwatch_client, queries, start_time, end_time):
+    """
+    Runs one GetMetricData request (following NextToken) and returns
+    {(Id, Label): (timestamps, values)}. Expressions that return several series,
+    like SORT, produce one entry per series.
+    """
+    points = {}
+    request = {'MetricDataQueries': queries, 'StartTime': start_time, 'EndTime': end_time,
+               'ScanBy': 'TimestampAscending'}
+    while True:
+        response = cloudwatch_client.get_metric_data(**request)
+        for result in response.get('MetricDataResults', []):
+            if result.get('StatusCode') == 'InternalError':
+                raise RuntimeError(f"CloudWatch could not evaluate {result['Id']}: {result.get('Messages')}")
+            points.setdefault((result['Id'], result.get('Label')), []).extend(
+                zip(result.get('Timestamps', []), result.get('Values', [])))
+        next_token = response.get('NextToken')
+        if not next_token:
+            break
+        request['NextToken'] = next_token
+
+    series = {}
+    for key, key_points in points.items():
+        key_points.sort(key=lambda point: point[0])
+        series[key] = (np.array([to_datetime64(timestamp) for timestamp, _ in key_points], dtype="datetime64[ns]"),
+                       np.array([value for _, value in key_points], dtype=np.float64))
+    return series
+
+
+def _chunks(fleet):
+    return [fleet[offset:offset + SERVER_CHUNK_SIZE] for offset in range(0, len(fleet), SERVER_CHUNK_SIZE)]
+
+
+def _server_aggregate(cloudwatch_client, fleet, metric, aggregate, start_time, end_time, period, statistic):
+    chunks = _chunks(fleet)
+    function = SERVER_AGGREGATES[aggregate]
+    partials = []
+    counts = []
+    for chunk in chunks:
+        queries = _hidden_queries(chunk, metric, period, statistic)
+        if aggregate == "avg" and len(chunks) > 1:
+            # Averages of several requests are combined from their sums and datapoint counts
+            queries.append(_expression("total", "SUM(METRICS())", period))
+            queries.append(_expression("points", "SUM(METRICS() * 0 + 1)", period))
+        else:
+            queries.append(_expression("aggregate", f"{function}(METRICS())", period))
+        results = _get_expression_results(cloudwatch_client, queries, start_time, end_time)
+        for (query_id, _), points in results.items():
+            (counts if query_id == "points" else partials).append(points)
+
+    timestamps, matrix = align_series(partials + counts)
+    if len(chunks) == 1:
+        return timestamps, matrix[0] if len(matrix) else np.empty(0)
+    if aggregate == "avg":
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return timestamps, np.nansum(matrix[:len(partials)], axis=0) / np.nansum(matrix[len(partials):], axis=0)
+    return timestamps, reduce_matrix(matrix, aggregate)
+
+
+def _server_top_n(cloudwatch_client, fleet, metric, n, rank_by, descending, start_time, end_time, period, statistic):
+    order = "DESC" if descending else "ASC"
+    candidates = {}
+    for chunk in _chunks(fleet):
+        queries = _hidden_queries(chunk, metric, period, statistic)
+        queries.append(_expression("top", f"SORT(METRICS(), {SERVER_AGGREGATES[rank_by]}, {order}, {n})", period))
+        for (_, label), points in _get_expression_results(cloudwatch_client, queries, start_time, end_time).items():
+            # A SORT without matching series still returns one empty result
+            if len(points[1]):
+                candidates[(label, metric['MetricName'])] = points
+    # Each request returned its own top n; the overall top n is among them
+    return top_n_series(candidates, metric['MetricName'], n, rank_by, descending)
+
+
+def _local_series(region, fleet, metrics, start_time, end_time, period, statistic):
+    columns = collect_fleet_metrics(region, {"Aggregate": metrics}, instance_ids=fleet,
+                                    start_time=start_time, end_time=end_time, period=period, statistic=statistic)
+    return series_from_columns(columns)
+
+
+@timed("fleet_aggregate")
+def fleet_aggregate(region, metric_groups, aggregate="avg", metric_names=None, instance_ids=None, tags=None,
+                    all_running=False, start_time=None, end_time=None, period=300, statistic="Average",
+                    server_side=True):
+    """
+    Computes one fleet-wide series per metric of metric_groups (or only metric_names),
+    e.g. the p95 CPUUtilization across a tag selector.
+
+    avg, max, min and sum are computed by CloudWatch Metric Math over metric queries
+    that are not returned, so only the aggregate lines are downloaded. Percentiles, and
+    any aggregate whose expression CloudWatch rejects, are reduced locally with NumPy
+    from the downloaded series.
+
+    Returns a dict with Aggregate, Instances, Source ("metric-math" or "local") and
+    Series ({MetricName: (timestamps, values)}).
+    """
+    if aggregate not in AGGREGATES:
+        raise ValueError(f"Unknown aggregate {aggregate}; use one of {', '.join(AGGREGATES)}.")
+    end_time = end_time or datetime.utcnow()
+    start_time = start_time or end_time - timedelta(hours=1)
+    metrics = [metric for group in metric_groups.values() for metric in group
+               if metric_names is None or metric['MetricName'] in metric_names]
+    fleet = resolve_instance_ids(region, instance_ids, tags, all_running)
+    result = {'Aggregate': aggregate, 'Instances': len(fleet), 'Source': "local", 'Series': {}}
+    if not fleet:
+        return result
+
+    if server_side and aggregate in SERVER_AGGREGATES:
+        cloudwatch_client = get_client('cloudwatch', region_name=region)
+        try:
+            for metric in metrics:
+                result['Series'][metric['MetricName']] = _server_aggregate(
+                    cloudwatch_client, fleet, metric, aggregate, start_time, end_time, period, statistic)
+            result['Source'] = "metric-math"
+            return result
+        except (ClientError, RuntimeError) as e:
+            logging.error(f"Metric Math aggregate failed, reducing locally instead: {e}")
+            result['Series'] = {}
+
+    series = _local_series(region, fleet, metrics, start_time, end_time, period, statistic)
+    for metric in metrics:
+        result['Series'][metric['MetricName']] = aggregate_series(series, metric['MetricName'], aggregate)
+    return result
+
+
+@timed("fleet_top_n")
+def fleet_top_n(region, metric_groups, metric_name, n=10, rank_by="avg", descending=True, instance_ids=None,
+                tags=None, all_running=False, start_time=None, end_time=None, period=300, statistic="Average",
+                server_side=True):
+    """
+    Finds the n instances with the highest (or lowest) rank_by of a metric over the
+    window, e.g. the top 10 instances by average NetworkOut.
+
+    Server-side, a Metric Math SORT expression returns only the top n series of every
+    request; otherwise every series is downloaded and ranked locally.
+
+    Returns a dict with MetricName, RankBy, Instances, Source and Series, a list of
+    dicts with InstanceId, Score, Timestamps and Values in rank order.
+    """
+    if rank_by not in SERVER_AGGREGATES:
+        raise ValueError(f"Unknown ranking {rank_by}; use one of {', '.join(SERVER_AGGREGATES)}.")
+    end_time = end_time or datetime.utcnow()
+    start_time = start_time or end_time - timedelta(hours=1)
+    metric = find_metric(metric_groups, metric_name)
+    fleet = resolve_instance_ids(region, instance_ids, tags, all_running)
+    result = {'MetricName': metric_name, 'RankBy': rank_by, 'Instances': len(fleet), 'Source': "local", 'Series': []}
+    if not fleet:
+        return result
+
+    if server_side:
+        try:
+            result['Series'] = _server_top_n(get_client('cloudwatch', region_name=region), fleet, metric, n, rank_by,
+                                             descending, start_time, end_time, period, statistic)
+            result['Source'] = "metric-math"
+            return result
+        except (ClientError, RuntimeError) as e:
+            logging.error(f"Metric Math top-N failed, ranking locally instead: {e}")
+
+    series = _local_series(region, fleet, [metric], start_time, end_time, period, statistic)
+    result['Series'] = top_n_series(series, metric_name, n, rank_by, descending)
+    return result
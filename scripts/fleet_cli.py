@@ -0,0 +1,355 @@
+"""
+Non-interactive fleet CLI. Every command takes many targets and/or regions, runs
+them concurrently and streams one JSON object per line (NDJSON) as results arrive.
+
+    python scripts/fleet_cli.py regions
+    python scripts/fleet_cli.py describe --region eu-north-1 i-0123456789abcdef0 web-1 web-2
+    python scripts/fleet_cli.py describe --region eu-north-1 --region us-east-1 --state running
+    python scripts/fleet_cli.py launch --region eu-north-1 --ami ami-xxxxxxxx --instance-type t3.micro \\
+        --subnet-id subnet-a --subnet-id subnet-b --count 4 --name demo-ec2
+    python scripts/fleet_cli.py stop --region eu-north-1 --tag tier=web --wait
+    python scripts/fleet_cli.py metrics --region eu-north-1 i-0123456789abcdef0 --metric CPUUtilization --follow
+
+Failures are reported as records with an "error" key; the exit status is 1 when any occurred.
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+from botocore.exceptions import ClientError
+
+from aws_clients import get_client, get_session
+from fleet_ops import change_state, launch_fleet, wait_for_state
+from instance_inventory import get_inventory
+from instance_lookup import find_instances, iter_instances
+from metrics_engine import IncrementalFetcher
+
+# Tasks (regions or targets) run at the same time
+MAX_WORKERS = int(os.environ.get("FLEET_CLI_MAX_WORKERS", "16"))
+
+# Above this many targets in a region, one inventory load answers every lookup
+INVENTORY_THRESHOLD = 5
+
+# Records buffered between the workers and the writer before workers wait
+QUEUE_SIZE = 1000
+
+DEFAULT_METRICS = ("CPUUtilization", "NetworkIn", "NetworkOut")
+
+# Instance fields written by describe and stop
+INSTANCE_FIELDS = ("InstanceId", "Name", "State", "InstanceType", "Tags")
+
+_DONE = object()
+
+# Set on Ctrl+C so running tasks, including --follow loops, wind down
+_stopping = threading.Event()
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+class NdjsonWriter:
+    """
+    Writes one compact JSON object per line and flushes it, so consumers see each
+    record as soon as it is produced. Safe to call from several threads.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record, default=_json_default, separators=(",", ":"))
+        with self._lock:
+            if 'error' in record:
+                self.errors += 1
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+
+def _error_record(context, error):
+    if isinstance(error, ClientError):
+        return {**context, 'error': error.response['Error']['Code'], 'message': error.response['Error']['Message']}
+    return {**context, 'error': type(error).__name__, 'message': str(error)}
+
+
+def stream_tasks(tasks, writer, max_workers=MAX_WORKERS):
+    """
+    Runs (context, generator function) tasks concurrently and writes their records
+    from the calling thread in arrival order. The queue is bounded, so fast producers
+    wait for the writer instead of buffering a large output in memory.
+    """
+    records = queue.Queue(maxsize=QUEUE_SIZE)
+    _stopping.clear()
+
+    def run(context, task):
+        try:
+            for record in task():
+                if _stopping.is_set():
+                    break
+                records.put(record)
+        except Exception as e:
+            # Any failure becomes an error record, so it is reported and sets the exit status
+            records.put(_error_record(context, e))
+        finally:
+            records.put(_DONE)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tasks)))) as executor:
+        for context, task in tasks:
+            executor.submit(run, context, task)
+        remaining = len(tasks)
+        try:
+            while remaining:
+                record = records.get()
+                if record is _DONE:
+                    remaining -= 1
+                else:
+                    writer.write(record)
+        except BaseException:
+            # On interruption the queue is drained so no worker stays blocked on it
+            _stopping.set()
+            while remaining:
+                if records.get() is _DONE:
+                    remaining -= 1
+            raise
+
+
+def _tag(pair):
+    key, separator, value = pair.partition("=")
+    if not separator:
+        raise argparse.ArgumentTypeError(f"tags must look like Key=Value, got '{pair}'")
+    return key, value
+
+
+def _resolve(region, targets, states=None):
+    """
+    Yields (target, matching instances) for every target, matched by instance ID or Name.
+    Many targets are answered from one inventory load instead of one lookup each.
+    """
+    if len(targets) > INVENTORY_THRESHOLD:
+        inventory = get_inventory(region)
+        inventory.refresh()
+        for target in targets:
+            matches = [record.as_dict() for record in inventory.find(target, states=states)]
+            yield target, [{field: match[field] for field in INSTANCE_FIELDS} for match in matches]
+    else:
+        for target in targets:
+            yield target, find_instances(region, target, states=states, fields=INSTANCE_FIELDS)
+
+
+def cmd_regions(args):
+    def task():
+        for region in get_client('ec2').describe_regions()['Regions']:
+            yield {'RegionName': region['RegionName'], 'Endpoint': region['Endpoint']}
+    return [({'command': 'regions'}, task)]
+
+
+def cmd_describe(args):
+    tags = dict(args.tag or [])
+    states = args.state or None
+    tasks = []
+    for region in args.region:
+        if not args.targets:
+            # Whole-region listings stream page by page
+            def task(region=region):
+                for instance in iter_instances(region, states=states, tags=tags, fields=INSTANCE_FIELDS):
+                    yield {'region': region, **instance}
+            tasks.append(({'region': region}, task))
+        elif len(args.targets) > INVENTORY_THRESHOLD:
+            def task(region=region):
+                for target, matches in _resolve(region, args.targets, states):
+                    yield from _describe_records(region, target, matches)
+            tasks.append(({'region': region}, task))
+        else:
+            for target in args.targets:
+                def task(region=region, target=target):
+                    for target_name, matches in _resolve(region, [target], states):
+                        yield from _describe_records(region, target_name, matches)
+                tasks.append(({'region': region, 'target': target}, task))
+    return tasks
+
+
+def _describe_records(region, target, matches):
+    if not matches:
+        yield {'region': region, 'target': target, 'found': False}
+    for instance in matches:
+        yield {'region': region, 'target': target, 'found': True, **instance}
+
+
+def cmd_launch(args):
+    if len(args.region) > 1:
+        raise SystemExit("launch takes a single --region, since subnet IDs belong to one region.")
+    fleet_token = args.fleet_token or f"fleet-{uuid.uuid4().hex[:12]}"
+
+    def launch(region):
+        def task():
+            result = launch_fleet(
+                region,
+                args.count,
+                args.ami,
+                args.instance_type,
+                args.subnet_id,
+                fleet_token,
+                key_pair=args.key_name,
+                security_group_ids=args.security_group_ids,
+                instance_name=args.name,
+                wait=args.wait,
+            )
+            for instance_id in result['InstanceIds']:
+                yield {'region': region, 'FleetToken': fleet_token, 'InstanceId': instance_id,
+                       'State': result['States'].get(instance_id)}
+            for error in result['Errors']:
+                yield {'region': region, 'FleetToken': fleet_token, 'error': error['Code'], 'message': error['Message'],
+                       'SubnetId': error['SubnetId'], 'InstanceType': error['InstanceType']}
+            if result['WaitError']:
+                yield {'region': region, 'FleetToken': fleet_token, 'error': 'WaitFailed', 'message': result['WaitError']}
+            yield {'region': region, 'FleetToken': fleet_token, 'Launched': len(result['InstanceIds']),
+                   'Shortfall': result['Shortfall']}
+        return task
+
+    return [({'region': region, 'FleetToken': fleet_token}, launch(region)) for region in args.region]
+
+
+def cmd_stop(args):
+    tags = dict(args.tag or [])
+    if not args.targets and not tags:
+        raise SystemExit("stop needs instance IDs/Names or --tag selectors.")
+
+    def stop(region):
+        def task():
+            selected = {}
+            if args.targets:
+                for target, matches in _resolve(region, args.targets):
+                    if not matches:
+                        yield {'region': region, 'target': target, 'found': False}
+                    for instance in matches:
+                        selected.setdefault(instance['InstanceId'], (target, instance['State']))
+            if tags:
+                for instance in iter_instances(region, tags=tags, fields=("InstanceId", "State")):
+                    selected.setdefault(instance['InstanceId'], (None, instance['State']))
+
+            running = []
+            for instance_id, (target, state) in selected.items():
+                if state == 'running':
+                    running.append(instance_id)
+                else:
+                    yield {'region': region, 'target': target, 'InstanceId': instance_id, 'State': state, 'skipped': True}
+
+            # One StopInstances request per 1000 instances, whatever the number of targets
+            result = change_state(region, "stop", running)
+            for instance_id in result['Requested']:
+                yield {'region': region, 'target': selected[instance_id][0], 'InstanceId': instance_id, 'action': 'stop'}
+            for error in result['Errors']:
+                yield {'region': region, 'InstanceIds': error['InstanceIds'], 'error': error['Code'], 'message': error['Message']}
+
+            if args.wait and result['Requested']:
+                for instance_id, state in wait_for_state(region, result['Requested'], 'stopped').items():
+                    yield {'region': region, 'InstanceId': instance_id, 'State': state}
+        return task
+
+    return [({'region': region}, stop(region)) for region in args.region]
+
+
+def cmd_metrics(args):
+    metrics = [{'MetricName': name, 'Namespace': args.namespace} for name in (args.metric or DEFAULT_METRICS)]
+
+    def follow(region):
+        def task():
+            fetcher = IncrementalFetcher(region, period=args.period, statistic=args.stat,
+                                         initial_window=timedelta(minutes=args.minutes))
+            while True:
+                # Every target and metric of the region goes into the same batched GetMetricData calls
+                results = fetcher.fetch(args.instance_ids, metrics)
+                for (instance_id, metric_name), points in sorted(results.items()):
+                    for timestamp, value in points:
+                        yield {'region': region, 'InstanceId': instance_id, 'MetricName': metric_name,
+                               'Statistic': args.stat, 'Timestamp': timestamp, 'Value': value}
+                if not args.follow or _stopping.wait(args.interval):
+                    return
+        return task
+
+    return [({'region': region}, follow(region)) for region in args.region]
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Fleet operations with NDJSON output.")
+    parser.add_argument("--max-workers", type=int, default=MAX_WORKERS, help="Tasks run at the same time")
+    commands = parser.add_subparsers(dest="command", required=True)
+    default_region = get_session().region_name or "eu-north-1"
+
+    def add_regions(command):
+        command.add_argument("--region", action="append", help=f"Region to act on, repeatable (default {default_region})")
+
+    commands.add_parser("regions", help="List regions and endpoints")
+
+    describe = commands.add_parser("describe", help="Describe instances by ID/Name, or list every matching instance")
+    add_regions(describe)
+    describe.add_argument("targets", nargs="*", help="Instance IDs or Name tags")
+    describe.add_argument("--state", action="append", help="Only instances in this state, repeatable")
+    describe.add_argument("--tag", action="append", type=_tag, help="Key=Value tag selector, repeatable")
+
+    launch = commands.add_parser("launch", help="Launch a fleet spread over subnets")
+    add_regions(launch)
+    launch.add_argument("--ami", required=True)
+    launch.add_argument("--instance-type", action="append", required=True, help="Repeatable, in fallback order")
+    launch.add_argument("--subnet-id", action="append", required=True, help="Repeatable, one per AZ")
+    launch.add_argument("--count", type=int, default=1)
+    launch.add_argument("--key-name")
+    launch.add_argument("--security-group-ids", nargs="+")
+    launch.add_argument("--name", help="Name tag of the instances")
+    launch.add_argument("--fleet-token", help="Re-use to make a re-run launch only the missing instances")
+    launch.add_argument("--no-wait", dest="wait", action="store_false", help="Do not wait for the instances to run")
+
+    stop = commands.add_parser("stop", help="Stop instances by ID/Name and/or tag selector")
+    add_regions(stop)
+    stop.add_argument("targets", nargs="*", help="Instance IDs or Name tags")
+    stop.add_argument("--tag", action="append", type=_tag, help="Key=Value tag selector, repeatable")
+    stop.add_argument("--wait", action="store_true", help="Wait until the instances are stopped")
+
+    metrics = commands.add_parser("metrics", help="Stream CloudWatch datapoints of instances")
+    add_regions(metrics)
+    metrics.add_argument("instance_ids", nargs="+")
+    metrics.add_argument("--metric", action="append", help=f"Repeatable (default {', '.join(DEFAULT_METRICS)})")
+    metrics.add_argument("--namespace", default="AWS/EC2")
+    metrics.add_argument("--period", type=int, default=300)
+    metrics.add_argument("--stat", default="Average")
+    metrics.add_argument("--minutes", type=int, default=60, help="History returned by the first fetch")
+    metrics.add_argument("--follow", action="store_true", help="Keep streaming new datapoints")
+    metrics.add_argument("--interval", type=int, default=60, help="Seconds between polls with --follow")
+
+    parser.set_defaults(default_region=default_region)
+    return parser
+
+
+COMMANDS = {
+    "regions": cmd_regions,
+    "describe": cmd_describe,
+    "launch": cmd_launch,
+    "stop": cmd_stop,
+    "metrics": cmd_metrics,
+}
+
+
+def main(argv=None, stream=None):
+    args = build_parser().parse_args(argv)
+    if hasattr(args, "region"):
+        args.region = args.region or [args.default_region]
+    writer = NdjsonWriter(stream)
+    try:
+        stream_tasks(COMMANDS[args.command](args), writer, args.max_workers)
+    except KeyboardInterrupt:
+        return 130
+    return 1 if writer.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,269 @@
+import hashlib
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from aws_clients import get_client
+from instance_lookup import iter_instances
+from instrumentation import timed
+
+# Instance IDs sent per StartInstances/StopInstances request
+LIFECYCLE_BATCH_SIZE = 1000
+
+# Error codes caused by individual instances of a StartInstances/StopInstances request;
+# the rest of a batch failing with one of these can still be changed
+INSTANCE_ERRORS = {"IncorrectInstanceState", "InvalidInstanceID.NotFound", "InvalidInstanceID.Malformed",
+                   "UnsupportedOperation"}
+
+# DescribeInstanceStatus accepts at most 100 instance IDs per request
+STATUS_BATCH_SIZE = 100
+
+# States an instance must be in for an action to apply, and the state the action ends in
+ACTIONS = {
+    "start": {"from": ["stopped"], "target": "running"},
+    "stop": {"from": ["running"], "target": "stopped"},
+}
+
+
+def _chunks(items, size):
+    for offset in range(0, len(items), size):
+        yield items[offset:offset + size]
+
+
+def select_instances(region, instance_ids=None, tags=None, states=None):
+    """
+    Returns the IDs of the instances matching a tag and/or state selector.
+    """
+    return [
+        instance['InstanceId']
+        for instance in iter_instances(region, instance_ids=instance_ids, tags=tags, states=states, fields=("InstanceId",))
+    ]
+
+
+def _change_batch(call, batch, result):
+    try:
+        call(InstanceIds=batch)
+        result['Requested'].extend(batch)
+    except ClientError as e:
+        code = e.response['Error']['Code']
+        if code in INSTANCE_ERRORS and len(batch) > 1:
+            # The whole request fails for one bad instance, so the batch is halved until
+            # the failing instances are isolated; k of them cost about 2k * log2(n) calls
+            middle = len(batch) // 2
+            _change_batch(call, batch[:middle], result)
+            _change_batch(call, batch[middle:], result)
+            return
+        result['Errors'].append({'InstanceIds': batch, 'Code': code, 'Message': e.response['Error']['Message']})
+
+
+def change_state(region, action, instance_ids):
+    """
+    Starts or stops instances in as few requests as possible. A batch rejected because
+    of some of its instances (see INSTANCE_ERRORS) is split, so only those fail.
+    Returns {'Requested': [instance_id, ...], 'Errors': [{'InstanceIds', 'Code', 'Message'}, ...]}.
+    """
+    ec2_client = get_client('ec2', region_name=region)
+    call = ec2_client.start_instances if action == "start" else ec2_client.stop_instances
+    result = {'Requested': [], 'Errors': []}
+    for batch in _chunks(list(instance_ids), LIFECYCLE_BATCH_SIZE):
+        _change_batch(call, batch, result)
+    return result
+
+
+def _describe_batch(ec2_client, batch, states):
+    try:
+        batch_states = {}
+        paginator = ec2_client.get_paginator('describe_instance_status')
+        for page in paginator.paginate(InstanceIds=batch, IncludeAllInstances=True):
+            for status in page['InstanceStatuses']:
+                batch_states[status['InstanceId']] = status['InstanceState']['Name']
+        states.update(batch_states)
+    except ClientError as e:
+        # Freshly launched instances can be unknown to DescribeInstanceStatus for a few seconds,
+        # and one unknown ID fails its whole request; the batch is halved until only those are left out
+        if e.response['Error']['Code'] != 'InvalidInstanceID.NotFound':
+            raise
+        if len(batch) > 1:
+            middle = len(batch) // 2
+            _describe_batch(ec2_client, batch[:middle], states)
+            _describe_batch(ec2_client, batch[middle:], states)
+
+
+def describe_states(region, instance_ids):
+    """
+    Returns {instance_id: state name} using batched DescribeInstanceStatus calls.
+    Instances that DescribeInstanceStatus does not know (yet) are left out.
+    """
+    ec2_client = get_client('ec2', region_name=region)
+    states = {}
+    for batch in _chunks(list(instance_ids), STATUS_BATCH_SIZE):
+        _describe_batch(ec2_client, batch, states)
+    return states
+
+
+def wait_for_state(region, instance_ids, target_state, timeout=600, interval=5, on_progress=None):
+    """
+    Polls every instance with one shared loop until all reached target_state or
+    timeout seconds passed. Instances that arrived are no longer polled.
+
+    on_progress(counts) receives a Counter of state names after every poll.
+    Returns {instance_id: last seen state}.
+    """
+    pending = list(instance_ids)
+    states = {}
+    deadline = time.monotonic() + timeout
+    while pending:
+        # Instances not visible yet stay pending until they show up or the timeout passes
+        states.update(describe_states(region, pending))
+        pending = [instance_id for instance_id in pending if states.get(instance_id) != target_state]
+        if on_progress is not None:
+            on_progress(Counter(states.values()))
+        if not pending or time.monotonic() >= deadline:
+            break
+        time.sleep(interval)
+    return states
+
+
+@timed("bulk_change_state")
+def bulk_change_state(region, action, instance_ids=None, tags=None, wait=True, timeout=600, interval=5, on_progress=None):
+    """
+    Applies a start/stop action to every selected instance that is in a state the
+    action applies to, then optionally waits for all of them to settle.
+    Returns {'Requested', 'Errors', 'States'} where States maps IDs to their last seen state.
+    """
+    targets = select_instances(region, instance_ids=instance_ids, tags=tags, states=ACTIONS[action]["from"])
+    return change_instances(region, action, targets, wait, timeout, interval, on_progress)
+
+
+@timed("change_instances")
+def change_instances(region, action, targets, wait=True, timeout=600, interval=5, on_progress=None):
+    """
+    Applies a start/stop action to already selected instances (e.g. the ones a preview
+    showed), then optionally waits for all of them to settle.
+    Returns {'Requested', 'Errors', 'States'} like bulk_change_state.
+    """
+    result = change_state(region, action, targets) if targets else {'Requested': [], 'Errors': []}
+    result['States'] = {}
+    if wait and result['Requested']:
+        result['States'] = wait_for_state(region, result['Requested'], ACTIONS[action]["target"], timeout, interval, on_progress)
+    return result
+
+
+def _split(count, parts):
+    # Spreads count as evenly as possible over parts, earlier parts taking the remainder
+    base, extra = divmod(count, parts)
+    return [base + (1 if index < extra else 0) for index in range(parts)]
+
+
+def _client_token(*parts):
+    # ClientToken is limited to 64 ASCII characters, so the parts are hashed
+    return hashlib.sha256("-".join(str(part) for part in parts).encode()).hexdigest()[:64]
+
+
+def _launch_in_subnet(region, subnet_id, count, instance_types, client_token, launch_args):
+    """
+    Launches up to count instances in one subnet, falling back through instance_types
+    when a type has no capacity. Returns (instance_ids, errors).
+    """
+    ec2_client = get_client('ec2', region_name=region)
+    launched, errors = [], []
+    for index, instance_type in enumerate(instance_types):
+        remaining = count - len(launched)
+        if remaining <= 0:
+            break
+        try:
+            response = ec2_client.run_instances(
+                MinCount=1,
+                MaxCount=remaining,
+                InstanceType=instance_type,
+                SubnetId=subnet_id,
+                # The same token makes retries of this exact request return the same instances
+                ClientToken=_client_token(client_token, index),
+                **launch_args,
+            )
+            launched.extend(instance['InstanceId'] for instance in response['Instances'])
+        except ClientError as e:
+            errors.append({'SubnetId': subnet_id, 'InstanceType': instance_type,
+                           'Code': e.response['Error']['Code'], 'Message': e.response['Error']['Message']})
+    return launched, errors
+
+
+@timed("launch_fleet")
+def launch_fleet(region, target_count, ami_id, instance_types, subnet_ids, fleet_token, key_pair=None,
+                 security_group_ids=None, instance_name=None, max_rounds=5, max_workers=8,
+                 wait=True, timeout=600, interval=5, on_progress=None):
+    """
+    Launches instances until target_count of them exist for fleet_token.
+
+    The count is spread across subnet_ids (one per AZ) and launched in parallel.
+    Each subnet walks instance_types in order when capacity runs out, and any
+    shortfall is redistributed over the subnets in the next round. Instances are
+    tagged with fleet-token, so re-running with the same token only launches what
+    is still missing, and every request carries a ClientToken so retried calls
+    never double-launch.
+
+    Returns {'InstanceIds', 'Shortfall', 'Errors', 'States', 'WaitError'}. The launched
+    IDs are returned even when waiting fails; WaitError then holds the error message.
+    """
+    # Stopped members still belong to the fleet; only terminated ones need replacing
+    existing = {
+        instance['InstanceId']: instance['State']
+        for instance in iter_instances(region, tags={'fleet-token': fleet_token},
+                                       states=['pending', 'running', 'stopping', 'stopped'], fields=("InstanceId", "State"))
+    }
+    instance_ids = list(existing)
+    errors = []
+
+    tags = [{'Key': 'fleet-token', 'Value': fleet_token}]
+    if instance_name:
+        tags.append({'Key': 'Name', 'Value': instance_name})
+    launch_args = {'ImageId': ami_id, 'TagSpecifications': [{'ResourceType': 'instance', 'Tags': tags}]}
+    if key_pair:
+        launch_args['KeyName'] = key_pair
+    if security_group_ids:
+        launch_args['SecurityGroupIds'] = list(security_group_ids)
+
+    subnets = list(subnet_ids)
+    for round_number in range(max_rounds):
+        shortfall = target_count - len(instance_ids)
+        if shortfall <= 0 or not subnets:
+            break
+        # The token encodes the requested and reached fleet sizes, so a retried round reuses its
+        # tokens while a re-run with another target_count never resends a token with another MaxCount
+        round_token = _client_token(fleet_token, target_count, len(instance_ids))
+        shares = _split(shortfall, len(subnets))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                subnet_id: executor.submit(_launch_in_subnet, region, subnet_id, share, instance_types,
+                                           _client_token(round_token, subnet_id), launch_args)
+                for subnet_id, share in zip(subnets, shares) if share
+            }
+        exhausted = set()
+        for subnet_id, future in futures.items():
+            launched, subnet_errors = future.result()
+            instance_ids.extend(launched)
+            errors.extend(subnet_errors)
+            if not launched:
+                exhausted.add(subnet_id)
+        # Subnets that produced nothing in a round are left out of the next one
+        subnets = [subnet_id for subnet_id in subnets if subnet_id not in exhausted]
+        if on_progress is not None:
+            on_progress({'launched': len(instance_ids), 'target': target_count, 'round': round_number + 1})
+
+    result = {
+        'InstanceIds': instance_ids,
+        'Shortfall': max(target_count - len(instance_ids), 0),
+        'Errors': errors,
+        'States': {},
+        'WaitError': None,
+    }
+    # Stopped members are left alone, so only the others are waited for
+    waiting = [instance_id for instance_id in instance_ids if existing.get(instance_id) not in ('stopping', 'stopped')]
+    if wait and waiting:
+        try:
+            result['States'] = wait_for_state(region, waiting, 'running', timeout, interval)
+        except ClientError as e:
+            result['WaitError'] = e.response['Error']['Message']
+    return result
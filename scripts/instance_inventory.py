@@ -0,0 +1,241 @@
+import os
+import threading
+import time
+from collections import defaultdict
+
+from aws_clients import get_client
+from instance_lookup import iter_instances
+
+# Seconds between full describes; in between only instance states are polled.
+# Tag edits are not visible in state polls, so they show up at the next full describe.
+FULL_REFRESH_INTERVAL = float(os.environ.get("INVENTORY_FULL_REFRESH", "900"))
+
+# Instance IDs per describe_instances instance-id filter when re-describing changed instances
+DESCRIBE_BATCH_SIZE = 200
+
+# describe_instance_status returns at most 1000 statuses per page
+STATUS_PAGE_SIZE = 1000
+
+_FIELDS = ("InstanceId", "Name", "State", "InstanceType", "Placement", "LaunchTime", "Tags")
+
+
+class InstanceRecord:
+    """
+    Compact record of one instance.
+    """
+
+    __slots__ = ("instance_id", "name", "state", "instance_type", "availability_zone", "launch_time", "tags")
+
+    def __init__(self, instance_id, name, state, instance_type=None, availability_zone=None, launch_time=None, tags=None):
+        self.instance_id = instance_id
+        self.name = name
+        self.state = state
+        self.instance_type = instance_type
+        self.availability_zone = availability_zone
+        self.launch_time = launch_time
+        self.tags = tags or {}
+
+    @classmethod
+    def from_instance(cls, instance):
+        """
+        Builds a record from an iter_instances result projected with the inventory fields.
+        """
+        return cls(
+            instance['InstanceId'],
+            instance['Name'],
+            instance['State'],
+            instance['InstanceType'],
+            (instance['Placement'] or {}).get('AvailabilityZone'),
+            instance['LaunchTime'],
+            instance['Tags'],
+        )
+
+    def as_dict(self):
+        """
+        Returns the record with the keys used by instance_lookup.project_instance.
+        """
+        return {
+            'InstanceId': self.instance_id,
+            'Name': self.name,
+            'State': self.state,
+            'InstanceType': self.instance_type,
+            'AvailabilityZone': self.availability_zone,
+            'LaunchTime': self.launch_time,
+            'Tags': dict(self.tags),
+        }
+
+
+class InstanceInventory:
+    """
+    In-memory inventory of one region's instances with hash indexes on instance ID,
+    Name tag, every (tag key, value) pair and state, so lookups do not scan.
+
+    load() runs a full describe. refresh() polls only instance states through
+    describe_instance_status and describes just the instances that are new or whose
+    state changed; it falls back to load() every full_refresh_interval seconds.
+    """
+
+    def __init__(self, region, full_refresh_interval=FULL_REFRESH_INTERVAL):
+        self.region = region
+        self.full_refresh_interval = full_refresh_interval
+        self.loaded_at = None
+        self.refreshed_at = None
+        self._records = {}
+        self._by_name = defaultdict(set)
+        self._by_state = defaultdict(set)
+        self._by_tag = defaultdict(set)
+        self._lock = threading.Lock()
+        # Refreshes run one at a time; readers only wait for the index swap
+        self._refresh_lock = threading.Lock()
+
+    def _index(self, record):
+        self._records[record.instance_id] = record
+        if record.name is not None:
+            self._by_name[record.name].add(record.instance_id)
+        self._by_state[record.state].add(record.instance_id)
+        for tag in record.tags.items():
+            self._by_tag[tag].add(record.instance_id)
+
+    def _unindex(self, instance_id):
+        record = self._records.pop(instance_id, None)
+        if record is None:
+            return
+        entries = [(self._by_name, record.name), (self._by_state, record.state)]
+        entries.extend((self._by_tag, tag) for tag in record.tags.items())
+        for index, key in entries:
+            ids = index.get(key)
+            if ids is not None:
+                ids.discard(instance_id)
+                if not ids:
+                    del index[key]
+
+    def _describe(self, instance_ids=None):
+        if instance_ids is None:
+            return [InstanceRecord.from_instance(instance) for instance in iter_instances(self.region, fields=_FIELDS)]
+        instance_ids = list(instance_ids)
+        records = []
+        for offset in range(0, len(instance_ids), DESCRIBE_BATCH_SIZE):
+            batch = instance_ids[offset:offset + DESCRIBE_BATCH_SIZE]
+            records.extend(InstanceRecord.from_instance(instance)
+                           for instance in iter_instances(self.region, instance_ids=batch, fields=_FIELDS))
+        return records
+
+    def _poll_states(self):
+        paginator = get_client('ec2', region_name=self.region).get_paginator('describe_instance_status')
+        states = {}
+        for page in paginator.paginate(IncludeAllInstances=True, PaginationConfig={'PageSize': STATUS_PAGE_SIZE}):
+            for status in page['InstanceStatuses']:
+                states[status['InstanceId']] = status['InstanceState']['Name']
+        return states
+
+    def load(self):
+        """
+        Replaces the inventory with a full describe of the region.
+        """
+        with self._refresh_lock:
+            records = self._describe()
+            with self._lock:
+                for index in (self._records, self._by_name, self._by_state, self._by_tag):
+                    index.clear()
+                for record in records:
+                    self._index(record)
+                self.loaded_at = self.refreshed_at = time.monotonic()
+        return len(records)
+
+    def refresh(self):
+        """
+        Brings the inventory up to date and returns the IDs of the instances that were
+        added, changed or removed. The first call and overdue ones do a full load().
+        """
+        if self.loaded_at is None or time.monotonic() - self.loaded_at >= self.full_refresh_interval:
+            self.load()
+            return {'Added': [], 'Changed': [], 'Removed': [], 'Full': True}
+
+        with self._refresh_lock:
+            states = self._poll_states()
+            with self._lock:
+                known = {instance_id: record.state for instance_id, record in self._records.items()}
+            added = [instance_id for instance_id in states if instance_id not in known]
+            changed = [instance_id for instance_id, state in states.items() if instance_id in known and known[instance_id] != state]
+            removed = [instance_id for instance_id in known if instance_id not in states]
+
+            records = self._describe(added + changed) if added or changed else []
+            with self._lock:
+                for instance_id in changed + removed:
+                    self._unindex(instance_id)
+                for record in records:
+                    self._index(record)
+                self.refreshed_at = time.monotonic()
+        return {'Added': added, 'Changed': changed, 'Removed': removed, 'Full': False}
+
+    def __len__(self):
+        return len(self._records)
+
+    def get(self, instance_id):
+        return self._records.get(instance_id)
+
+    def find(self, identifier, states=None):
+        """
+        Returns the records whose instance ID or Name tag equals identifier.
+        """
+        with self._lock:
+            ids = set(self._by_name.get(identifier, ()))
+            if identifier in self._records:
+                ids.add(identifier)
+            records = [self._records[instance_id] for instance_id in sorted(ids)]
+        return [record for record in records if not states or record.state in states]
+
+    def select(self, states=None, tags=None, names=None):
+        """
+        Returns the records matching every criterion by intersecting index sets.
+        states and names match any of their values; tags ({Key: Value}) must all match.
+        """
+        with self._lock:
+            candidates = None
+            criteria = []
+            if states:
+                criteria.append(set().union(*(self._by_state.get(state, ()) for state in states)))
+            if names:
+                criteria.append(set().union(*(self._by_name.get(name, ()) for name in names)))
+            for tag in (tags or {}).items():
+                criteria.append(self._by_tag.get(tag, set()))
+            # Smallest set first keeps the intersections cheap
+            for ids in sorted(criteria, key=len):
+                candidates = set(ids) if candidates is None else candidates & ids
+            if candidates is None:
+                return list(self._records.values())
+            return [self._records[instance_id] for instance_id in sorted(candidates)]
+
+
+_inventories = {}
+_inventories_lock = threading.Lock()
+
+
+def get_inventory(region):
+    """
+    Returns the process-wide InstanceInventory of a region, creating it (unloaded) on first use.
+    """
+    with _inventories_lock:
+        inventory = _inventories.get(region)
+        if inventory is None:
+            inventory = InstanceInventory(region)
+            _inventories[region] = inventory
+        return inventory
+
+
+def list_inventory(region, states=None):
+    """
+    Brings the region's inventory up to date and returns its instances as dicts,
+    optionally only those in one of states.
+    """
+    inventory = get_inventory(region)
+    inventory.refresh()
+    return [record.as_dict() for record in inventory.select(states=states)]
+
+
+def clear_inventories():
+    """
+    Drops every process-wide inventory, so the next use of a region starts with a full load.
+    """
+    with _inventories_lock:
+        _inventories.clear()
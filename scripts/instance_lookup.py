@@ -0,0 +1,70 @@
+from aws_clients import get_client
+
+# Fields projected from each instance when the caller does not ask for more
+DEFAULT_FIELDS = ("InstanceId", "Name", "State")
+
+# describe_instances returns at most 1000 instances per page
+PAGE_SIZE = 1000
+
+
+def build_instance_filters(instance_ids=None, names=None, states=None, tags=None):
+    """
+    Translates lookup criteria into EC2 Filters so matching happens server-side.
+    Values inside one filter are OR-ed, separate filters are AND-ed.
+    """
+    filters = []
+    if instance_ids:
+        filters.append({'Name': 'instance-id', 'Values': list(instance_ids)})
+    if names:
+        filters.append({'Name': 'tag:Name', 'Values': list(names)})
+    if states:
+        filters.append({'Name': 'instance-state-name', 'Values': list(states)})
+    for key, value in (tags or {}).items():
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        filters.append({'Name': f"tag:{key}", 'Values': list(values)})
+    return filters
+
+
+def project_instance(instance, fields=DEFAULT_FIELDS):
+    """
+    Reduces a raw describe_instances record to the requested fields.
+    'Name' is read from the Name tag, 'State' is the state name and 'Tags' becomes a dict.
+    """
+    record = {}
+    for field in fields:
+        if field == 'Name':
+            record['Name'] = next((tag['Value'] for tag in instance.get('Tags', []) if tag['Key'] == 'Name'), None)
+        elif field == 'State':
+            record['State'] = instance['State']['Name']
+        elif field == 'Tags':
+            record['Tags'] = {tag['Key']: tag['Value'] for tag in instance.get('Tags', [])}
+        else:
+            record[field] = instance.get(field)
+    return record
+
+
+def iter_instances(region, instance_ids=None, names=None, states=None, tags=None, fields=DEFAULT_FIELDS):
+    """
+    Streams the instances matching every given criterion, one page at a time.
+    Yields projected records (see project_instance) and follows NextToken to the end.
+    """
+    ec2_client = get_client('ec2', region_name=region)
+    paginator = ec2_client.get_paginator('describe_instances')
+    filters = build_instance_filters(instance_ids, names, states, tags)
+    for page in paginator.paginate(Filters=filters, PaginationConfig={'PageSize': PAGE_SIZE}):
+        for reservation in page['Reservations']:
+            for instance in reservation['Instances']:
+                yield project_instance(instance, fields)
+
+
+def find_instances(region, identifier, states=None, fields=DEFAULT_FIELDS):
+    """
+    Returns the instances whose Instance ID or Name tag equals identifier.
+    """
+    matches = {}
+    if identifier.startswith('i-'):
+        for instance in iter_instances(region, instance_ids=[identifier], states=states, fields=fields):
+            matches[instance['InstanceId']] = instance
+    for instance in iter_instances(region, names=[identifier], states=states, fields=fields):
+        matches.setdefault(instance['InstanceId'], instance)
+    return list(matches.values())
@@ -0,0 +1,256 @@
+import functools
+import threading
+import time
+from bisect import bisect_left
+
+from botocore.retries.standard import RetryEventAdapter, ThrottlingErrorDetector
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is +Inf
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram in the Prometheus layout (cumulative counts are derived on export).
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """
+        Estimates a quantile as the upper bound of the bucket it falls in.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class ApiCallStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.throttles = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latency = Histogram()
+
+
+_lock = threading.Lock()
+_api = {}
+_helpers = {}
+
+
+def _api_entry(service_name, operation_name, region_name):
+    key = (service_name, operation_name, region_name or "")
+    entry = _api.get(key)
+    if entry is None:
+        entry = _api[key] = ApiCallStats()
+    return entry
+
+
+def _content_length(headers):
+    try:
+        return int(headers.get('Content-Length') or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def instrument(client):
+    """
+    Hooks a client's events to record, per (service, operation, region), the call
+    count, end-to-end latency (including retries and rate-limit waits), errors,
+    retries, throttled attempts and request/response bytes.
+    """
+    region_name = client.meta.region_name
+    service_id = client.meta.service_model.service_id.hyphenize()
+    service_name = client.meta.service_model.service_name
+    adapter = RetryEventAdapter()
+    throttling = ThrottlingErrorDetector(adapter)
+
+    def operation_of(event_name):
+        return event_name.rsplit(".", 1)[-1]
+
+    def before_call(context, **kwargs):
+        context['instrumentation_start'] = time.perf_counter()
+
+    def after_call(event_name, http_response, parsed, context, **kwargs):
+        elapsed = time.perf_counter() - context.get('instrumentation_start', time.perf_counter())
+        with _lock:
+            entry = _api_entry(service_name, operation_of(event_name), region_name)
+            entry.calls += 1
+            entry.retries += parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+            if http_response.status_code >= 300:
+                entry.errors += 1
+            entry.latency.observe(elapsed)
+
+    def after_call_error(event_name, context, **kwargs):
+        elapsed = time.perf_counter() - context.get('instrumentation_start', time.perf_counter())
+        with _lock:
+            entry = _api_entry(service_name, operation_of(event_name), region_name)
+            entry.calls += 1
+            entry.errors += 1
+            entry.latency.observe(elapsed)
+
+    def before_send(event_name, request, **kwargs):
+        sent = _content_length(request.headers)
+        with _lock:
+            _api_entry(service_name, operation_of(event_name), region_name).bytes_sent += sent
+
+    def needs_retry(event_name, **kwargs):
+        # Called once per attempt, so throttles and bytes of retried attempts are counted too
+        response = kwargs.get('response')
+        received = 0
+        if response is not None:
+            # Non-streaming bodies are already read and parsed; streamed ones must not be touched
+            received = _content_length(response[0].headers)
+            if not received and not kwargs['operation'].has_streaming_output:
+                received = len(response[0].content)
+        throttled = response is not None and throttling.is_throttling_error_from_context(
+            adapter.create_retry_context(**kwargs)
+        )
+        with _lock:
+            entry = _api_entry(service_name, operation_of(event_name), region_name)
+            entry.bytes_received += received
+            entry.throttles += int(throttled)
+
+    client.meta.events.register(f"before-call.{service_id}", before_call)
+    client.meta.events.register(f"after-call.{service_id}", after_call)
+    client.meta.events.register(f"after-call-error.{service_id}", after_call_error)
+    client.meta.events.register(f"before-send.{service_id}", before_send)
+    client.meta.events.register_last(f"needs-retry.{service_id}", needs_retry)
+    return client
+
+
+def timed(name):
+    """
+    Decorator recording the wall time of every call of a helper under `name`.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with _lock:
+                    histogram = _helpers.get(name)
+                    if histogram is None:
+                        histogram = _helpers[name] = Histogram()
+                    histogram.observe(elapsed)
+        return wrapper
+    return decorator
+
+
+def total_calls():
+    with _lock:
+        return sum(entry.calls for entry in _api.values())
+
+
+def _summary(histogram):
+    return {
+        'Avg (ms)': round(histogram.sum / histogram.count * 1000, 1) if histogram.count else None,
+        'p50 (s)': histogram.quantile(0.5),
+        'p95 (s)': histogram.quantile(0.95),
+        'p99 (s)': histogram.quantile(0.99),
+        'Total (s)': round(histogram.sum, 3),
+    }
+
+
+def api_stats():
+    """
+    Returns one row per (service, operation, region), most time-consuming first.
+    """
+    with _lock:
+        rows = [
+            {'Service': service, 'Operation': operation, 'Region': region, 'Calls': entry.calls,
+             'Errors': entry.errors, 'Retries': entry.retries, 'Throttles': entry.throttles,
+             'Bytes Sent': entry.bytes_sent, 'Bytes Received': entry.bytes_received, **_summary(entry.latency)}
+            for (service, operation, region), entry in _api.items()
+        ]
+    return sorted(rows, key=lambda row: row['Total (s)'], reverse=True)
+
+
+def helper_stats():
+    """
+    Returns one row per timed helper, most time-consuming first.
+    """
+    with _lock:
+        rows = [{'Helper': name, 'Calls': histogram.count, **_summary(histogram)} for name, histogram in _helpers.items()]
+    return sorted(rows, key=lambda row: row['Total (s)'], reverse=True)
+
+
+def reset():
+    with _lock:
+        _api.clear()
+        _helpers.clear()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _histogram_lines(metric, histogram, labels):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+        cumulative += count
+        le = "+Inf" if bound == float("inf") else repr(bound)
+        lines.append(f"{metric}_bucket{_labels(**labels, le=le)} {cumulative}")
+    lines.append(f"{metric}_sum{_labels(**labels)} {histogram.sum}")
+    lines.append(f"{metric}_count{_labels(**labels)} {histogram.count}")
+    return lines
+
+
+def export_prometheus():
+    """
+    Renders every recorded metric in the Prometheus text exposition format.
+    """
+    counters = (
+        ('aws_api_calls_total', 'AWS API calls made', 'calls'),
+        ('aws_api_errors_total', 'AWS API calls that failed', 'errors'),
+        ('aws_api_retries_total', 'Retried AWS API attempts', 'retries'),
+        ('aws_api_throttles_total', 'Throttled AWS API attempts', 'throttles'),
+        ('aws_api_request_bytes_total', 'Bytes sent in AWS API requests', 'bytes_sent'),
+        ('aws_api_response_bytes_total', 'Bytes received in AWS API responses', 'bytes_received'),
+    )
+    with _lock:
+        api = sorted(_api.items())
+        helpers = sorted(_helpers.items())
+        lines = []
+        for metric, description, attribute in counters:
+            lines += [f"# HELP {metric} {description}.", f"# TYPE {metric} counter"]
+            for (service, operation, region), entry in api:
+                lines.append(f"{metric}{_labels(service=service, operation=operation, region=region)} {getattr(entry, attribute)}")
+
+        lines += ["# HELP aws_api_call_duration_seconds AWS API call latency including retries.",
+                  "# TYPE aws_api_call_duration_seconds histogram"]
+        for (service, operation, region), entry in api:
+            lines += _histogram_lines('aws_api_call_duration_seconds', entry.latency,
+                                      {'service': service, 'operation': operation, 'region': region})
+
+        lines += ["# HELP helper_duration_seconds Wall time of instrumented helpers.",
+                  "# TYPE helper_duration_seconds histogram"]
+        for name, histogram in helpers:
+            lines += _histogram_lines('helper_duration_seconds', histogram, {'helper': name})
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,98 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from aws_clients import get_client
+from instance_lookup import iter_instances
+
+# Regions scanned in parallel and the seconds one region may take before it is reported as timed out
+MAX_REGION_WORKERS = int(os.environ.get("INVENTORY_MAX_WORKERS", "8"))
+REGION_TIMEOUT = float(os.environ.get("INVENTORY_REGION_TIMEOUT", "30"))
+
+
+def list_enabled_regions():
+    """
+    Returns the names of the regions enabled for the account.
+    """
+    regions = get_client('ec2').describe_regions()['Regions']
+    return sorted(region['RegionName'] for region in regions)
+
+
+def scan_instances(region):
+    return [
+        {'Region': region, 'InstanceId': instance['InstanceId'], 'Name': instance['Name'],
+         'State': instance['State'], 'InstanceType': instance['InstanceType']}
+        for instance in iter_instances(region, fields=("InstanceId", "Name", "State", "InstanceType"))
+    ]
+
+
+def scan_security_groups(region):
+    paginator = get_client('ec2', region_name=region).get_paginator('describe_security_groups')
+    return [
+        {'Region': region, 'GroupId': group['GroupId'], 'GroupName': group['GroupName'], 'VpcId': group.get('VpcId')}
+        for page in paginator.paginate()
+        for group in page['SecurityGroups']
+    ]
+
+
+def scan_key_pairs(region):
+    response = get_client('ec2', region_name=region).describe_key_pairs()
+    return [
+        {'Region': region, 'KeyName': key['KeyName'], 'KeyPairId': key.get('KeyPairId'), 'KeyType': key.get('KeyType')}
+        for key in response['KeyPairs']
+    ]
+
+
+def scan_buckets(region):
+    # ListBuckets is global; BucketRegion keeps each region's scan to its own buckets
+    paginator = get_client('s3', region_name=region).get_paginator('list_buckets')
+    return [
+        {'Region': region, 'Name': bucket['Name'], 'CreationDate': bucket['CreationDate']}
+        for page in paginator.paginate(BucketRegion=region)
+        for bucket in page.get('Buckets', [])
+    ]
+
+
+SCANNERS = {
+    "instances": scan_instances,
+    "security_groups": scan_security_groups,
+    "key_pairs": scan_key_pairs,
+    "buckets": scan_buckets,
+}
+
+
+def scan_regions(resource, regions=None, max_workers=MAX_REGION_WORKERS, timeout=REGION_TIMEOUT):
+    """
+    Scans one resource type across regions in parallel and yields
+    (region, rows, error) tuples in the order the regions finish.
+    At most max_workers regions run at once; a region still running after
+    timeout seconds is yielded with a TimeoutError and no longer waited for.
+    """
+    scanner = SCANNERS[resource]
+    regions = regions or list_enabled_regions()
+    started_at = {}
+
+    def run(region):
+        started_at[region] = time.monotonic()
+        return scanner(region)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        pending = {executor.submit(run, region): region for region in regions}
+        while pending:
+            done, _ = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+            for future in done:
+                region = pending.pop(future)
+                try:
+                    yield region, future.result(), None
+                except Exception as e:
+                    yield region, [], e
+
+            now = time.monotonic()
+            for future, region in list(pending.items()):
+                if region in started_at and now - started_at[region] > timeout:
+                    del pending[future]
+                    yield region, [], TimeoutError(f"Scanning {region} took longer than {timeout:g}s")
+    finally:
+        # Abandoned scans finish in the background; queued ones are dropped
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -1,8 +1,8 @@
-import boto3
+from aws_clients import get_client
 from botocore.exceptions import ClientError
 
 def list_regions():
-    ec2 = boto3.client('ec2')
+    ec2 = get_client('ec2')
 
     try:
         regions = ec2.describe_regions()['Regions']
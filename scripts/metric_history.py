@@ -0,0 +1,148 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+# On-disk location of the metric history database
+HISTORY_DB_PATH = os.environ.get("METRIC_HISTORY_DB", "metric_history.sqlite3")
+
+# Days of datapoints kept on disk (0 keeps everything), and the minimum seconds between prunes
+HISTORY_RETENTION_DAYS = float(os.environ.get("METRIC_HISTORY_RETENTION_DAYS", "30"))
+PRUNE_INTERVAL = 3600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS datapoints (
+    region TEXT NOT NULL,
+    instance_id TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    period INTEGER NOT NULL,
+    stat TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (region, instance_id, metric, period, stat, ts)
+) WITHOUT ROWID
+"""
+
+# Databases written before period and stat were part of the key only hold 300 s averages
+_MIGRATION = [
+    "ALTER TABLE datapoints RENAME TO datapoints_unversioned",
+    _SCHEMA,
+    "INSERT OR REPLACE INTO datapoints"
+    " SELECT region, instance_id, metric, 300, 'Average', ts, value FROM datapoints_unversioned",
+    "DROP TABLE datapoints_unversioned",
+]
+
+
+def to_epoch_ms(timestamp):
+    """
+    Converts a datetime (naive values are taken as UTC) to epoch milliseconds.
+    """
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return int(timestamp.timestamp() * 1000)
+
+
+def from_epoch_ms(value):
+    return datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+
+
+class MetricHistoryStore:
+    """
+    Embedded SQLite store of metric datapoints.
+
+    Rows are clustered by (region, instance, metric, period, statistic, timestamp), so
+    series of one metric at different resolutions never overwrite each other and a
+    time-range read of one series is a single index range scan. Writes are batched into one
+    transaction and re-written datapoints replace the stored value. Datapoints older
+    than retention_days are removed by prune_expired().
+    """
+
+    def __init__(self, path=HISTORY_DB_PATH, retention_days=HISTORY_RETENTION_DAYS):
+        self.path = path
+        self.retention = timedelta(days=retention_days) if retention_days else None
+        self._pruned_at = None
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            columns = [row[1] for row in self._connection.execute("PRAGMA table_info(datapoints)")]
+            if columns and 'period' not in columns:
+                for statement in _MIGRATION:
+                    self._connection.execute(statement)
+            self._connection.execute(_SCHEMA)
+
+    def write_points(self, rows, period=300, stat="Average"):
+        """
+        Stores (region, instance_id, metric, timestamp, value) rows of period/stat series
+        in one transaction. Returns the number of rows written.
+        """
+        batch = [
+            (region, instance_id, metric, period, stat, to_epoch_ms(timestamp), float(value))
+            for region, instance_id, metric, timestamp, value in rows
+        ]
+        if batch:
+            with self._lock, self._connection:
+                self._connection.executemany("INSERT OR REPLACE INTO datapoints VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+        return len(batch)
+
+    def read_range(self, region, instance_id, metric, start_time=None, end_time=None, period=300, stat="Average"):
+        """
+        Returns (timestamps as datetime64[ns], float64 values) of one period/stat series, oldest first.
+        """
+        start_ms = to_epoch_ms(start_time) if start_time else -(2 ** 63)
+        end_ms = to_epoch_ms(end_time) if end_time else 2 ** 63 - 1
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT ts, value FROM datapoints"
+                " WHERE region = ? AND instance_id = ? AND metric = ? AND period = ? AND stat = ?"
+                " AND ts BETWEEN ? AND ? ORDER BY ts",
+                (region, instance_id, metric, period, stat, start_ms, end_ms),
+            ).fetchall()
+        data = np.array(rows, dtype=np.float64).reshape(-1, 2)
+        return data[:, 0].astype(np.int64).astype("datetime64[ms]").astype("datetime64[ns]"), data[:, 1].copy()
+
+    def prune(self, older_than):
+        """
+        Deletes datapoints older than the given datetime and returns how many were removed.
+        """
+        with self._lock, self._connection:
+            cursor = self._connection.execute("DELETE FROM datapoints WHERE ts < ?", (to_epoch_ms(older_than),))
+            return cursor.rowcount
+
+    def prune_expired(self):
+        """
+        Prunes datapoints older than the retention, at most once per PRUNE_INTERVAL seconds.
+        Returns how many were removed, or None when no prune was due.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self.retention is None or (self._pruned_at is not None and now - self._pruned_at < PRUNE_INTERVAL):
+                return None
+            self._pruned_at = now
+        return self.prune(datetime.now(timezone.utc) - self.retention)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_history_store(path=HISTORY_DB_PATH):
+    """
+    Returns the process-wide MetricHistoryStore for a database path. Expired datapoints
+    are pruned when the store is opened; pollers writing to it prune them after that.
+    """
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = MetricHistoryStore(path)
+            store.prune_expired()
+            _stores[path] = store
+        return store
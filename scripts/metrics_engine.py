@@ -0,0 +1,206 @@
+from aws_clients import get_client
+from datetime import datetime, timedelta, timezone
+from instance_lookup import iter_instances
+from instrumentation import timed
+
+# CloudWatch accepts at most 500 MetricDataQueries per GetMetricData request
+MAX_QUERIES_PER_REQUEST = 500
+
+
+def build_fleet_queries(instance_ids, metrics, statistics=("Average",), period=300):
+    """
+    Builds one MetricDataQuery per (instance, metric, statistic) combination.
+    Returns the queries and a lookup from query Id to (InstanceId, MetricName, Statistic).
+    """
+    queries = []
+    query_index = {}
+    for instance_id in instance_ids:
+        for metric in metrics:
+            for statistic in statistics:
+                # Ids must start with a lowercase letter and be unique per request
+                query_id = f"q{len(queries)}"
+                metric_stat = {
+                    'Metric': {
+                        'Namespace': metric['Namespace'],
+                        'MetricName': metric['MetricName'],
+                        'Dimensions': [{'Name': 'InstanceId', 'Value': instance_id}]
+                    },
+                    'Period': period,
+                    'Stat': statistic
+                }
+                if metric.get('Unit'):
+                    metric_stat['Unit'] = metric['Unit']
+                queries.append({'Id': query_id, 'MetricStat': metric_stat, 'ReturnData': True})
+                query_index[query_id] = (instance_id, metric['MetricName'], statistic)
+    return queries, query_index
+
+
+@timed("get_metric_data_batched")
+def get_metric_data_batched(cloudwatch_client, queries, start_time, end_time):
+    """
+    Runs the queries through as few GetMetricData requests as possible, following
+    NextToken until every page has been read.
+    Returns a dict mapping query Id to a list of (Timestamp, Value) sorted by time.
+    """
+    results = {query['Id']: [] for query in queries}
+    for offset in range(0, len(queries), MAX_QUERIES_PER_REQUEST):
+        request = {
+            'MetricDataQueries': queries[offset:offset + MAX_QUERIES_PER_REQUEST],
+            'StartTime': start_time,
+            'EndTime': end_time,
+            'ScanBy': 'TimestampAscending'
+        }
+        while True:
+            response = cloudwatch_client.get_metric_data(**request)
+            for result in response.get('MetricDataResults', []):
+                results[result['Id']].extend(zip(result.get('Timestamps', []), result.get('Values', [])))
+            next_token = response.get('NextToken')
+            if not next_token:
+                break
+            request['NextToken'] = next_token
+
+    for points in results.values():
+        points.sort(key=lambda point: point[0])
+    return results
+
+
+def resolve_instance_ids(region, instance_ids=None, tags=None, all_running=False):
+    """
+    Resolves a fleet selector to a list of instance IDs.
+    Explicit instance_ids win; otherwise instances are matched by tags ({Key: Value})
+    and/or restricted to the running state when all_running is set.
+    """
+    if instance_ids:
+        return list(dict.fromkeys(instance_ids))
+
+    if not tags and not all_running:
+        raise ValueError("Provide instance_ids, tags or all_running=True to select a fleet.")
+
+    states = ['running'] if all_running else None
+    return [instance['InstanceId'] for instance in iter_instances(region, states=states, tags=tags, fields=("InstanceId",))]
+
+
+@timed("collect_fleet_metrics")
+def collect_fleet_metrics(region, metric_groups, instance_ids=None, tags=None, all_running=False,
+                          start_time=None, end_time=None, period=300, statistic="Average"):
+    """
+    Fetches every metric in metric_groups for a whole fleet in batched GetMetricData calls.
+    The fleet is selected by instance IDs, a tag selector, or all running instances.
+
+    Returns a columnar dict with equally long lists under the keys
+    InstanceId, Group, MetricName, Unit, Timestamp and Value (one row per datapoint).
+    """
+    cloudwatch_client = get_client('cloudwatch', region_name=region)
+    end_time = end_time or datetime.utcnow()
+    start_time = start_time or end_time - timedelta(seconds=period)
+
+    fleet = resolve_instance_ids(region, instance_ids, tags, all_running)
+    columns = {'InstanceId': [], 'Group': [], 'MetricName': [], 'Unit': [], 'Timestamp': [], 'Value': []}
+    if not fleet:
+        return columns
+
+    metrics = []
+    metric_info = {}
+    for group_name, group_metrics in metric_groups.items():
+        for metric in group_metrics:
+            if metric['MetricName'] not in metric_info:
+                metrics.append(metric)
+                metric_info[metric['MetricName']] = (group_name, metric.get('Unit'))
+
+    queries, query_index = build_fleet_queries(fleet, metrics, (statistic,), period)
+    results = get_metric_data_batched(cloudwatch_client, queries, start_time, end_time)
+
+    for query_id, points in results.items():
+        instance_id, metric_name, _ = query_index[query_id]
+        group_name, unit = metric_info[metric_name]
+        for timestamp, value in points:
+            columns['InstanceId'].append(instance_id)
+            columns['Group'].append(group_name)
+            columns['MetricName'].append(metric_name)
+            columns['Unit'].append(unit)
+            columns['Timestamp'].append(timestamp)
+            columns['Value'].append(value)
+    return columns
+
+
+class IncrementalFetcher:
+    """
+    Fetches only datapoints newer than each series' watermark.
+
+    Every call re-reads `lookback` before the oldest watermark so points that
+    CloudWatch publishes late are backfilled. Points already returned with the same
+    value are dropped; a point whose value CloudWatch revised since (e.g. a period
+    that was still being aggregated) is returned again, so callers overwrite it.
+    Series without a watermark start `initial_window` before end_time.
+    """
+
+    def __init__(self, region, period=300, statistic="Average",
+                 lookback=timedelta(minutes=10), initial_window=timedelta(hours=1)):
+        self.region = region
+        self.period = period
+        self.statistic = statistic
+        self.lookback = lookback
+        self.initial_window = initial_window
+        self._watermarks = {}
+        self._seen = {}
+
+    def watermark(self, instance_id, metric_name):
+        return self._watermarks.get((instance_id, metric_name))
+
+    def seed(self, instance_id, metric_name, timestamps, values):
+        """
+        Marks already-stored datapoints (timezone-aware datetimes and their values) as
+        seen, e.g. after loading history from disk, so the next fetch continues from the
+        newest one.
+        """
+        if not timestamps:
+            return
+        key = (instance_id, metric_name)
+        watermark = max(timestamps)
+        if key in self._watermarks:
+            watermark = max(watermark, self._watermarks[key])
+        self._watermarks[key] = watermark
+        cutoff = watermark - self.lookback
+        seen = self._seen.setdefault(key, {})
+        seen.update((timestamp, value) for timestamp, value in zip(timestamps, values) if timestamp >= cutoff)
+
+    @timed("IncrementalFetcher.fetch")
+    def fetch(self, instance_ids, metrics, end_time=None):
+        """
+        Returns {(InstanceId, MetricName): [(Timestamp, Value), ...]} holding only
+        datapoints that are new or whose value changed since an earlier call, sorted by time.
+        """
+        end_time = end_time or datetime.now(timezone.utc)
+        if end_time.tzinfo is None:
+            end_time = end_time.replace(tzinfo=timezone.utc)
+
+        keys = [(instance_id, metric['MetricName']) for instance_id in instance_ids for metric in metrics]
+        starts = [
+            self._watermarks[key] - self.lookback if key in self._watermarks else end_time - self.initial_window
+            for key in keys
+        ]
+        start_time = min(starts) if starts else end_time - self.initial_window
+
+        cloudwatch_client = get_client('cloudwatch', region_name=self.region)
+        queries, query_index = build_fleet_queries(instance_ids, metrics, (self.statistic,), self.period)
+        results = get_metric_data_batched(cloudwatch_client, queries, start_time, end_time)
+
+        new_points = {key: [] for key in keys}
+        for query_id, points in results.items():
+            instance_id, metric_name, _ = query_index[query_id]
+            key = (instance_id, metric_name)
+            seen = self._seen.setdefault(key, {})
+            # Points before this series' own lookback were already handled on earlier calls
+            floor = self._watermarks[key] - self.lookback if key in self._watermarks else None
+            for timestamp, value in points:
+                if (floor is None or timestamp >= floor) and seen.get(timestamp) != value:
+                    seen[timestamp] = value
+                    new_points[key].append((timestamp, value))
+
+            if points:
+                watermark = max(self._watermarks.get(key, points[-1][0]), points[-1][0])
+                self._watermarks[key] = watermark
+                # Timestamps older than the lookback can no longer be re-read, so forget them
+                cutoff = watermark - self.lookback
+                self._seen[key] = {timestamp: value for timestamp, value in seen.items() if timestamp >= cutoff}
+        return new_points
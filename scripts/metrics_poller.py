@@ -0,0 +1,300 @@
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from alerting import get_alert_engine
+from instrumentation import timed
+from metric_history import get_history_store
+from metrics_engine import IncrementalFetcher
+from timeseries import TimeSeriesStore
+
+# Minimum seconds between fleet-wide alert evaluations; points polled in between are evaluated by the next one
+ALERT_EVALUATION_INTERVAL = float(os.environ.get("ALERT_EVALUATION_INTERVAL", "10"))
+
+
+class MetricsPoller:
+    """
+    Background worker that polls the metric groups of one instance.
+
+    Each tick fetches every group concurrently through its own IncrementalFetcher,
+    appends the new datapoints to a TimeSeriesStore and bumps the version of each
+    group that changed, so readers only rebuild what is new. The worker stops by
+    itself once nobody has read a snapshot for idle_timeout seconds.
+
+    With a MetricHistoryStore, new datapoints are also written to disk (pruning expired
+    ones along the way) and the last `preload` of history is loaded from it when the
+    poller starts.
+    on_poll, when given, is called with the poller after every tick.
+    """
+
+    def __init__(self, region, instance_id, metric_groups, interval=30, period=300, idle_timeout=300, store=None,
+                 history=None, preload=timedelta(hours=6), on_poll=None, statistic="Average"):
+        self.region = region
+        self.instance_id = instance_id
+        self.metric_groups = metric_groups
+        self.interval = interval
+        self.period = period
+        self.statistic = statistic
+        self.idle_timeout = idle_timeout
+        self.store = store or TimeSeriesStore()
+        self.history = history
+        self.preload = preload
+        self.on_poll = on_poll
+        self.last_polled = None
+        self._fetchers = {group_name: IncrementalFetcher(region, period, statistic) for group_name in metric_groups}
+        self._versions = {group_name: 0 for group_name in metric_groups}
+        self._errors = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_read = time.monotonic()
+
+    @property
+    def key(self):
+        return self.region, self.instance_id
+
+    def start(self):
+        if self._thread is None:
+            if self.history is not None:
+                try:
+                    self._load_history()
+                except Exception as e:
+                    with self._lock:
+                        self._errors['history'] = e
+            self._thread = threading.Thread(target=self._run, name=f"metrics-poller-{self.instance_id}", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def is_alive(self):
+        # A poller that is still loading its history counts as alive
+        return not self._stop.is_set() and (self._thread is None or self._thread.is_alive())
+
+    def _load_history(self):
+        start_time = datetime.now(timezone.utc) - self.preload
+        for group_name, metrics in self.metric_groups.items():
+            for metric in metrics:
+                timestamps, values = self.history.read_range(self.region, self.instance_id, metric['MetricName'], start_time,
+                                                             period=self.period, stat=self.statistic)
+                # Subscribers may already read the poller while it loads
+                with self._lock:
+                    for timestamp, value in zip(timestamps, values):
+                        self.store.append(self.instance_id, metric['MetricName'], timestamp, value)
+                self._fetchers[group_name].seed(
+                    self.instance_id, metric['MetricName'],
+                    [timestamp.replace(tzinfo=timezone.utc) for timestamp in timestamps.astype("datetime64[us]").tolist()],
+                    values.tolist(),
+                )
+            with self._lock:
+                self._versions[group_name] += 1
+
+    def _fetch_group(self, group_name):
+        metrics = self.metric_groups[group_name]
+        return self._fetchers[group_name].fetch([self.instance_id], metrics)
+
+    @timed("MetricsPoller.poll_once")
+    def poll_once(self):
+        """
+        Fetches all groups concurrently and publishes the new datapoints.
+        """
+        with ThreadPoolExecutor(max_workers=len(self.metric_groups) or 1) as executor:
+            futures = {group_name: executor.submit(self._fetch_group, group_name) for group_name in self.metric_groups}
+
+        rows = []
+        for group_name, future in futures.items():
+            try:
+                new_points = future.result()
+            except Exception as e:
+                with self._lock:
+                    self._errors[group_name] = e
+                continue
+
+            with self._lock:
+                self._errors.pop(group_name, None)
+                changed = False
+                for (instance_id, metric_name), points in new_points.items():
+                    for timestamp, value in points:
+                        self.store.append(instance_id, metric_name, timestamp, value)
+                        rows.append((self.region, instance_id, metric_name, timestamp, value))
+                        changed = True
+                if changed:
+                    self._versions[group_name] += 1
+
+        if self.history is not None and rows:
+            try:
+                self.history.write_points(rows, self.period, self.statistic)
+                self.history.prune_expired()
+            except Exception as e:
+                with self._lock:
+                    self._errors['history'] = e
+        self.last_polled = time.time()
+
+        if self.on_poll is not None:
+            try:
+                self.on_poll(self)
+            except Exception as e:
+                with self._lock:
+                    self._errors['alerts'] = e
+            else:
+                with self._lock:
+                    self._errors.pop('alerts', None)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.poll_once()
+            if time.monotonic() - self._last_read > self.idle_timeout:
+                self._stop.set()
+                break
+            self._stop.wait(self.interval)
+
+    def version(self, group_name):
+        self._last_read = time.monotonic()
+        with self._lock:
+            return self._versions[group_name]
+
+    def error(self, group_name):
+        with self._lock:
+            return self._errors.get(group_name)
+
+    def series(self, metric_name):
+        """
+        Returns copies of (timestamps, values) taken while no poll is writing.
+        """
+        self._last_read = time.monotonic()
+        with self._lock:
+            timestamps, values = self.store.series(self.instance_id, metric_name)
+            return timestamps.copy(), values.copy()
+
+    def snapshot(self, metric_names, points):
+        """
+        Returns {(InstanceId, MetricName): (timestamps, values)} copies of the newest `points`
+        of each series. Unlike series(), it does not count as a read, so background
+        consumers do not keep an idle poller alive.
+        """
+        with self._lock:
+            snapshot = {}
+            for metric_name in metric_names:
+                timestamps, values = self.store.series(self.instance_id, metric_name)
+                if len(values):
+                    snapshot[(self.instance_id, metric_name)] = timestamps[-points:].copy(), values[-points:].copy()
+            return snapshot
+
+
+class Subscription:
+    """
+    A viewer's handle on a shared poller. Closing it, or letting it be garbage
+    collected together with its session, releases the viewer's reference.
+    """
+
+    def __init__(self, collector, key, poller, interval):
+        self.key = key
+        self.poller = poller
+        self.interval = interval
+        self._finalizer = weakref.finalize(self, collector._release, key, poller, interval)
+
+    def close(self):
+        self._finalizer()
+
+    @property
+    def closed(self):
+        return not self._finalizer.alive
+
+
+class SharedCollector:
+    """
+    Process-wide registry that runs one MetricsPoller per distinct
+    (region, instance, metric set, period), however many viewers subscribe.
+
+    Subscriptions are reference-counted: the poller interval follows the fastest
+    subscriber and a poller is stopped as soon as its last subscriber leaves.
+
+    With an AlertEngine, the newest points of every poller are evaluated together
+    after poller ticks, at most once per ALERT_EVALUATION_INTERVAL seconds.
+    """
+
+    def __init__(self, history=None, alert_engine=None):
+        self.history = history
+        self.alert_engine = alert_engine
+        self._alerts_evaluated_at = None
+        self._pollers = {}
+        self._intervals = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def series_key(region, instance_id, metric_groups, period=300):
+        metric_set = tuple(
+            (group_name, tuple(metric['MetricName'] for metric in metrics))
+            for group_name, metrics in metric_groups.items()
+        )
+        return region, instance_id, metric_set, period
+
+    def subscribe(self, region, instance_id, metric_groups, interval=30, period=300):
+        key = self.series_key(region, instance_id, metric_groups, period)
+        created = None
+        with self._lock:
+            poller = self._pollers.get(key)
+            if poller is None or not poller.is_alive():
+                poller = created = MetricsPoller(region, instance_id, metric_groups, interval=interval, period=period,
+                                                 history=self.history,
+                                                 on_poll=self._evaluate_alerts if self.alert_engine else None)
+                self._pollers[key] = poller
+                self._intervals[key] = []
+            self._intervals[key].append(interval)
+            poller.interval = min(self._intervals[key])
+        # Loading the history reads from disk, so it must not hold up other subscribers
+        if created is not None:
+            created.start()
+        return Subscription(self, key, poller, interval)
+
+    def _release(self, key, poller, interval):
+        with self._lock:
+            # A poller that was replaced after going idle no longer counts this subscriber
+            if self._pollers.get(key) is not poller:
+                return
+            intervals = self._intervals[key]
+            intervals.remove(interval)
+            if intervals:
+                self._pollers[key].interval = min(intervals)
+            else:
+                self._pollers.pop(key).stop()
+                del self._intervals[key]
+
+    def subscriber_count(self, key):
+        with self._lock:
+            return len(self._intervals.get(key, []))
+
+    def _evaluate_alerts(self, poller):
+        with self._lock:
+            now = time.monotonic()
+            if self._alerts_evaluated_at is not None and now - self._alerts_evaluated_at < ALERT_EVALUATION_INTERVAL:
+                return
+            self._alerts_evaluated_at = now
+            pollers = list(self._pollers.values())
+
+        engine = self.alert_engine
+        series = {}
+        for fleet_poller in pollers:
+            series.update(fleet_poller.snapshot(engine.metric_names, engine.depth))
+        engine.evaluate(series)
+
+
+_collector = None
+_collector_lock = threading.Lock()
+
+
+def get_collector():
+    """
+    Returns the process-wide SharedCollector, creating it on first use.
+    Its pollers persist datapoints to the process-wide metric history store and feed
+    the process-wide alert engine.
+    """
+    global _collector
+    with _collector_lock:
+        if _collector is None:
+            _collector = SharedCollector(history=get_history_store(), alert_engine=get_alert_engine())
+        return _collector
@@ -0,0 +1,182 @@
+import os
+import threading
+import time
+
+from botocore.retries.standard import RetryEventAdapter, StandardRetryConditions, ThrottlingErrorDetector
+
+# Requests per second each (region, service, operation) starts at, and the most it may grow to
+INITIAL_RATE = float(os.environ.get("AWS_RATE_LIMIT", "20"))
+MAX_RATE = float(os.environ.get("AWS_RATE_LIMIT_MAX", "100"))
+MIN_RATE = 0.5
+
+# The rate is halved on a throttling response (at most once per cooldown) and
+# grows back by RATE_INCREASE requests per second for every successful call
+RATE_DECREASE_FACTOR = 0.5
+RATE_DECREASE_COOLDOWN = 1.0
+RATE_INCREASE = 0.1
+
+# Process-wide retry budget: every retry spends one token and every successful call
+# earns back RETRY_BUDGET_REFILL, so sustained retries stay below 10% of traffic
+RETRY_BUDGET = float(os.environ.get("AWS_RETRY_BUDGET", "50"))
+RETRY_BUDGET_REFILL = 0.1
+
+# Attempts per call, including the first; retries back off with full jitter
+MAX_ATTEMPTS = int(os.environ.get("AWS_MAX_ATTEMPTS", "5"))
+
+
+class TokenBucket:
+    """
+    Token bucket whose rate adapts to throttling (additive increase, multiplicative decrease).
+    The bucket holds at most one second worth of tokens, so bursts never exceed the current rate.
+    """
+
+    def __init__(self, rate=INITIAL_RATE, min_rate=MIN_RATE, max_rate=MAX_RATE):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.throttles = 0
+        self._tokens = rate
+        self._updated = time.monotonic()
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self._tokens + (now - self._updated) * self.rate, max(self.rate, 1.0))
+        self._updated = now
+
+    def acquire(self):
+        """
+        Takes one token, sleeping until it is available. A caller that has to wait
+        reserves its token first, so waiting threads are served in arrival order.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= 1
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0
+        if delay:
+            time.sleep(delay)
+        return delay
+
+    def on_throttle(self):
+        with self._lock:
+            now = time.monotonic()
+            self.throttles += 1
+            # Concurrent requests of one burst are throttled together; they count as one signal
+            if now - self._last_decrease < RATE_DECREASE_COOLDOWN:
+                return
+            self._refill(now)
+            self._last_decrease = now
+            self.rate = max(self.min_rate, self.rate * RATE_DECREASE_FACTOR)
+            self._tokens = min(self._tokens, 0)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + RATE_INCREASE)
+
+
+class RetryBudget:
+    """
+    Shared allowance of retries. When it is spent, failing calls raise their error
+    instead of retrying, which keeps retries from amplifying a throttling storm.
+    """
+
+    def __init__(self, capacity=RETRY_BUDGET, refill=RETRY_BUDGET_REFILL):
+        self.capacity = capacity
+        self.refill = refill
+        self.tokens = capacity
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def try_spend(self):
+        with self._lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            self.rejected += 1
+            return False
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + self.refill)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+retry_budget = RetryBudget()
+
+
+def get_bucket(region_name, service_name, operation_name):
+    """
+    Returns the process-wide TokenBucket of one (region, service, operation).
+    """
+    key = (region_name, service_name, operation_name)
+    bucket = _buckets.get(key)
+    if bucket is None:
+        with _buckets_lock:
+            bucket = _buckets.setdefault(key, TokenBucket())
+    return bucket
+
+
+def limiter_stats():
+    """
+    Returns the current rate and throttle count of every bucket, plus the retry budget.
+    """
+    with _buckets_lock:
+        buckets = dict(_buckets)
+    return {
+        'Buckets': [
+            {'Region': region, 'Service': service, 'Operation': operation,
+             'Rate': round(bucket.rate, 2), 'Throttles': bucket.throttles}
+            for (region, service, operation), bucket in sorted(buckets.items(), key=lambda item: str(item[0]))
+        ],
+        'RetryBudget': {'Tokens': round(retry_budget.tokens, 2), 'Capacity': retry_budget.capacity,
+                        'Rejected': retry_budget.rejected},
+    }
+
+
+def reset():
+    """
+    Drops every bucket and refills the retry budget, e.g. between benchmark runs.
+    """
+    with _buckets_lock:
+        _buckets.clear()
+    with retry_budget._lock:
+        retry_budget.tokens = retry_budget.capacity
+        retry_budget.rejected = 0
+
+
+def install(client, max_attempts=MAX_ATTEMPTS):
+    """
+    Hooks a client's events so every attempt of every call waits for a token of its
+    operation's bucket, throttling responses slow that bucket down, and retries
+    are only made while the shared retry budget allows.
+    The client itself should use the 'standard' retry mode, which adds jittered backoff.
+    """
+    region_name = client.meta.region_name
+    service_id = client.meta.service_model.service_id.hyphenize()
+    service_name = client.meta.service_model.service_name
+    adapter = RetryEventAdapter()
+    throttling = ThrottlingErrorDetector(adapter)
+    retryable = StandardRetryConditions(max_attempts=max_attempts)
+
+    def before_send(event_name, **kwargs):
+        get_bucket(region_name, service_name, event_name.rsplit(".", 1)[-1]).acquire()
+
+    def needs_retry(operation, **kwargs):
+        bucket = get_bucket(region_name, service_name, operation.name)
+        context = adapter.create_retry_context(operation=operation, **kwargs)
+        if throttling.is_throttling_error_from_context(context):
+            bucket.on_throttle()
+        elif kwargs.get('caught_exception') is None and kwargs['response'][0].status_code < 300:
+            bucket.on_success()
+            retry_budget.deposit()
+            return None
+        if retryable.is_retryable(context) and not retry_budget.try_spend():
+            # A non-None answer from the first handler overrides the retry handler. botocore
+            # only reads False as "no retry" since 1.43.3; older versions retry at once instead
+            return False
+        return None
+
+    client.meta.events.register(f"before-send.{service_id}", before_send)
+    client.meta.events.register_first(f"needs-retry.{service_id}", needs_retry)
+    return client
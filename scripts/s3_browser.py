@@ -0,0 +1,154 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from botocore.exceptions import ClientError
+
+from aws_clients import get_client
+from instrumentation import timed
+from ttl_cache import cached, invalidate
+
+# Keys fetched per page of the object browser (ListObjectsV2 returns at most 1000)
+PAGE_SIZE = 200
+
+# DeleteObjects accepts at most 1000 keys per request; batches run in parallel
+DELETE_BATCH_SIZE = 1000
+DELETE_CONCURRENCY = int(os.environ.get("S3_DELETE_CONCURRENCY", "4"))
+
+
+@cached("objects")
+def list_page(bucket_name, prefix="", delimiter="/", continuation_token=None, page_size=PAGE_SIZE, region_name=None):
+    """
+    Lists one page of a bucket under a prefix, folder-style when a delimiter is given.
+    Returns {'Folders': [prefix, ...], 'Objects': [{'Key', 'Size', 'LastModified'}, ...],
+    'NextToken': token of the next page or None}. Pages are cached per bucket, prefix and token.
+    """
+    request = {'Bucket': bucket_name, 'Prefix': prefix, 'MaxKeys': page_size}
+    if delimiter:
+        request['Delimiter'] = delimiter
+    if continuation_token:
+        request['ContinuationToken'] = continuation_token
+
+    response = get_client('s3', region_name=region_name).list_objects_v2(**request)
+    return {
+        'Folders': [common_prefix['Prefix'] for common_prefix in response.get('CommonPrefixes', [])],
+        'Objects': [
+            {'Key': obj['Key'], 'Size': obj['Size'], 'LastModified': obj['LastModified']}
+            for obj in response.get('Contents', [])
+        ],
+        'NextToken': response.get('NextContinuationToken') if response.get('IsTruncated') else None,
+    }
+
+
+def list_pages(bucket_name, prefix="", delimiter="/", pages=1, page_size=PAGE_SIZE, region_name=None):
+    """
+    Loads the first `pages` pages of a listing, following continuation tokens.
+    Returns (folders, objects, next_token) merged across the loaded pages.
+    """
+    folders, objects, token = [], [], None
+    for _ in range(pages):
+        page = list_page(bucket_name, prefix, delimiter, token, page_size, region_name)
+        folders.extend(page['Folders'])
+        objects.extend(page['Objects'])
+        token = page['NextToken']
+        if token is None:
+            break
+    return folders, objects, token
+
+
+def parent_prefix(prefix, delimiter="/"):
+    """
+    Returns the folder above prefix ('a/b/' -> 'a/', 'a/' -> '').
+    """
+    trimmed = prefix.rstrip(delimiter)
+    return trimmed[:trimmed.rfind(delimiter) + 1] if delimiter in trimmed else ""
+
+
+def iter_keys(bucket_name, prefix="", region_name=None):
+    """
+    Streams every key under a prefix, one ListObjectsV2 page at a time.
+    """
+    paginator = get_client('s3', region_name=region_name).get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            yield obj['Key']
+
+
+def count_keys(bucket_name, prefix="", region_name=None):
+    """
+    Dry run for delete_prefix: returns (object count, total bytes) under a prefix.
+    """
+    paginator = get_client('s3', region_name=region_name).get_paginator('list_objects_v2')
+    count = size = 0
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            count += 1
+            size += obj['Size']
+    return count, size
+
+
+def _delete_batch(bucket_name, keys, region_name):
+    try:
+        response = get_client('s3', region_name=region_name).delete_objects(
+            Bucket=bucket_name,
+            Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True},
+        )
+    except ClientError as e:
+        error = e.response['Error']
+        return 0, [{'Key': key, 'Code': error.get('Code'), 'Message': error.get('Message')} for key in keys]
+    errors = [
+        {'Key': error['Key'], 'Code': error.get('Code'), 'Message': error.get('Message')}
+        for error in response.get('Errors', [])
+    ]
+    return len(keys) - len(errors), errors
+
+
+@timed("delete_keys")
+def delete_keys(bucket_name, keys, region_name=None, concurrency=DELETE_CONCURRENCY, on_progress=None):
+    """
+    Deletes keys from any iterable in DeleteObjects batches of up to 1000 keys,
+    with at most `concurrency` batches in flight. Keys are consumed lazily, so a
+    streamed listing is never held in memory in full.
+
+    on_progress(deleted, failed) is called from the calling thread after every batch.
+    Returns {'Deleted': count, 'Errors': [{'Key', 'Code', 'Message'}, ...]}.
+    """
+    result = {'Deleted': 0, 'Errors': []}
+
+    def collect(finished):
+        for future in finished:
+            deleted, errors = future.result()
+            result['Deleted'] += deleted
+            result['Errors'].extend(errors)
+        if on_progress is not None:
+            on_progress(result['Deleted'], len(result['Errors']))
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            in_flight = set()
+            for batch in _batches(keys, DELETE_BATCH_SIZE):
+                if len(in_flight) >= concurrency:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(finished)
+                in_flight.add(executor.submit(_delete_batch, bucket_name, batch, region_name))
+            collect(wait(in_flight).done)
+    finally:
+        invalidate("objects", scope=bucket_name)
+    return result
+
+
+def delete_prefix(bucket_name, prefix, region_name=None, concurrency=DELETE_CONCURRENCY, on_progress=None):
+    """
+    Deletes every object under a prefix while the listing is still being streamed.
+    """
+    return delete_keys(bucket_name, iter_keys(bucket_name, prefix, region_name), region_name, concurrency, on_progress)
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,67 @@
+import os
+import threading
+import time
+
+from boto3.s3.transfer import TransferConfig, create_transfer_manager
+from s3transfer.subscribers import BaseSubscriber
+
+from aws_clients import get_client
+from instrumentation import timed
+
+MiB = 1024 * 1024
+
+# Multipart part size in bytes and the number of parts uploaded in parallel
+UPLOAD_PART_SIZE = int(os.environ.get("S3_UPLOAD_PART_SIZE", str(8 * MiB)))
+UPLOAD_CONCURRENCY = int(os.environ.get("S3_UPLOAD_CONCURRENCY", "4"))
+
+# S3 rejects multipart parts smaller than 5 MiB (except the last one)
+MIN_PART_SIZE = 5 * MiB
+
+
+class _ProgressCounter(BaseSubscriber):
+    # Called from the transfer threads, so the counter is guarded by a lock
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.bytes_transferred = 0
+
+    def on_progress(self, future, bytes_transferred, **kwargs):
+        with self._lock:
+            self.bytes_transferred += bytes_transferred
+
+
+@timed("upload_stream")
+def upload_stream(fileobj, bucket_name, key, region_name=None, part_size=UPLOAD_PART_SIZE,
+                  concurrency=UPLOAD_CONCURRENCY, size=None, on_progress=None, poll_interval=0.2):
+    """
+    Streams a readable file object to S3 without staging it on disk.
+
+    Objects larger than part_size go through a multipart upload whose parts are
+    read in chunks and sent by `concurrency` threads; at most that many parts are
+    buffered at once, so peak memory stays around part_size * concurrency. Each
+    part is an independent UploadPart request retried by the client's retry policy.
+
+    on_progress(bytes_uploaded, size) is called from the calling thread while the
+    upload runs, which makes it safe to update UI elements from it.
+    Raises botocore's ClientError when the upload fails.
+    """
+    part_size = max(part_size, MIN_PART_SIZE)
+    config = TransferConfig(
+        multipart_threshold=part_size,
+        multipart_chunksize=part_size,
+        max_concurrency=concurrency,
+    )
+    config.max_in_memory_upload_chunks = concurrency
+
+    progress = _ProgressCounter()
+    client = get_client("s3", region_name=region_name)
+    with create_transfer_manager(client, config) as manager:
+        future = manager.upload(fileobj, bucket_name, key, subscribers=[progress])
+        if size is not None:
+            future.meta.provide_transfer_size(size)
+        while not future.done():
+            if on_progress is not None:
+                on_progress(progress.bytes_transferred, size)
+            time.sleep(poll_interval)
+        future.result()
+    if on_progress is not None:
+        on_progress(progress.bytes_transferred, size)
@@ -1,35 +1,23 @@
-import boto3
+from aws_clients import get_client
+from instance_lookup import find_instances
 
-def stop_instance(region, identifier):
+def stop_instance(region, identifier, inventory=None):
     try:
         # Initialize the EC2 client for the specified region
-        ec2_client = boto3.client('ec2', region_name=region)
+        ec2_client = get_client('ec2', region_name=region)
 
-        # Retrieve all instances
-        response = ec2_client.describe_instances()
+        # Match instances by ID or Name tag, from the shared inventory's indexes when one is given
+        if inventory is not None:
+            matching_instances = [record.as_dict() for record in inventory.find(identifier)]
+        else:
+            matching_instances = find_instances(region, identifier)
 
-        # List to store i nstances to stop
         instances_to_stop = []
-
-        # Search for matching instances by ID or Name tag
-        for reservation in response['Reservations']:
-            for instance in reservation['Instances']:
-                instance_id = instance['InstanceId']
-                instance_state = instance['State']['Name']
-                instance_name = None
-
-                # Retrieve Name tag if available
-                if 'Tags' in instance:
-                    for tag in instance['Tags']:
-                        if tag['Key'] == 'Name':
-                            instance_name = tag['Value']
-
-                # Check for match by Instance ID or Name tag
-                if instance_id == identifier or instance_name == identifier:
-                    if instance_state == 'running':
-                        instances_to_stop.append(instance_id)
-                    else:
-                        print(f"Instance {instance_id} (Name: {instance_name}) is in state '{instance_state}' and cannot be stopped.")
+        for instance in matching_instances:
+            if instance['State'] == 'running':
+                instances_to_stop.append(instance['InstanceId'])
+            else:
+                print(f"Instance {instance['InstanceId']} (Name: {instance['Name']}) is in state '{instance['State']}' and cannot be stopped.")
 
         # Stop matching instances
         if instances_to_stop:
@@ -42,6 +30,9 @@ def stop_instance(region, identifier):
     except Exception as e:
         print(f"Error stopping instance(s): {e}")
 
-stop_instance(region='eu-north-1', identifier='i-047944d99cd7991bc')
-stop_instance(region='eu-north-1', identifier='nicgar_santej_lab3')
+if __name__ == "__main__":
+    # e.g. python scripts/stop_instance.py --region eu-north-1 i-047944d99cd7991bc nicgar_santej_lab3
+    import sys
+    from fleet_cli import main
+    sys.exit(main(["stop", *sys.argv[1:]]))
 
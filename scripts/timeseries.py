@@ -0,0 +1,173 @@
+import os
+import threading
+from datetime import timezone
+
+import numpy as np
+
+# Default retention per series: number of points and, optionally, maximum age in seconds
+HISTORY_POINTS = int(os.environ.get("METRIC_HISTORY_POINTS", "2880"))
+HISTORY_MAX_AGE = float(os.environ.get("METRIC_HISTORY_MAX_AGE", "0")) or None
+
+
+def to_datetime64(timestamp):
+    """
+    Converts a datetime (naive UTC or timezone-aware) to numpy datetime64[ns].
+    """
+    if getattr(timestamp, "tzinfo", None) is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return np.datetime64(timestamp, "ns")
+
+
+def series_from_columns(columns):
+    """
+    Converts collect_fleet_metrics output to {(InstanceId, MetricName): (timestamps, values)}
+    with datetime64[ns] timestamps in time order.
+    """
+    import pandas as pd
+
+    if not columns['Value']:
+        return {}
+    frame = pd.DataFrame({
+        'InstanceId': columns['InstanceId'],
+        'MetricName': columns['MetricName'],
+        'Timestamp': pd.to_datetime(columns['Timestamp'], utc=True).tz_convert(None),
+        'Value': columns['Value'],
+    }).sort_values(['InstanceId', 'MetricName', 'Timestamp'], kind="stable")
+    keys = frame[['InstanceId', 'MetricName']].to_numpy()
+    starts = np.concatenate(([0], np.flatnonzero((keys[1:] != keys[:-1]).any(axis=1)) + 1))
+    timestamps = np.split(frame['Timestamp'].to_numpy(dtype="datetime64[ns]"), starts[1:])
+    values = np.split(frame['Value'].to_numpy(dtype=np.float64), starts[1:])
+    return {tuple(keys[start]): (series_timestamps, series_values)
+            for start, series_timestamps, series_values in zip(starts, timestamps, values)}
+
+
+def align_series(series_list):
+    """
+    Places (timestamps, values) series on their common time axis.
+    Returns the sorted union of timestamps and a (len(series_list), len(timestamps))
+    matrix that is NaN where a series has no point.
+    """
+    if not series_list:
+        return np.empty(0, dtype="datetime64[ns]"), np.empty((0, 0))
+    timestamps = np.unique(np.concatenate([np.asarray(series_timestamps, dtype="datetime64[ns]")
+                                           for series_timestamps, _ in series_list]))
+    matrix = np.full((len(series_list), len(timestamps)), np.nan)
+    for row, (series_timestamps, series_values) in enumerate(series_list):
+        matrix[row, np.searchsorted(timestamps, np.asarray(series_timestamps, dtype="datetime64[ns]"))] = series_values
+    return timestamps, matrix
+
+
+class RingBuffer:
+    """
+    Fixed-size buffer of (timestamp, float64 value) points.
+
+    Every point is written twice, at i and i + capacity, so the retained window
+    is always one contiguous slice: appends are O(1) and timestamps()/values()
+    return views instead of copies. Points older than max_age seconds relative
+    to the newest point are excluded from the views. A point older than the
+    newest one is inserted in time order, and a point with a stored timestamp
+    replaces that point's value.
+    """
+
+    def __init__(self, capacity=HISTORY_POINTS, max_age=HISTORY_MAX_AGE):
+        self.capacity = capacity
+        self.max_age = np.timedelta64(int(max_age * 1e9), "ns") if max_age else None
+        self._timestamps = np.zeros(2 * capacity, dtype="datetime64[ns]")
+        self._values = np.zeros(2 * capacity, dtype=np.float64)
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        start, end, _ = self._window().indices(2 * self.capacity)
+        return end - start
+
+    def append(self, timestamp, value):
+        timestamp = to_datetime64(timestamp)
+        latest = self.latest()
+        if latest is not None and timestamp <= latest[0]:
+            self._insert(timestamp, value)
+            return
+        index = self._next
+        self._timestamps[index] = self._timestamps[index + self.capacity] = timestamp
+        self._values[index] = self._values[index + self.capacity] = value
+        self._next = (index + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def _span(self):
+        # The newest point sits at _next - 1, so the window ends at _next (+ capacity once wrapped)
+        end = self._next + self.capacity if self._count == self.capacity else self._next
+        return end - self._count, end
+
+    def _insert(self, timestamp, value):
+        start, end = self._span()
+        position = int(np.searchsorted(self._timestamps[start:end], timestamp, side="left"))
+        if start + position < end and self._timestamps[start + position] == timestamp:
+            # A revised value replaces the stored one in both copies
+            index = (start + position) % self.capacity
+            self._values[index] = self._values[index + self.capacity] = value
+            return
+        # Late (backfilled) points are rare, so an O(n) rewrite keeps the window sorted
+        timestamps = np.insert(self._timestamps[start:end], position, timestamp)[-self.capacity:]
+        values = np.insert(self._values[start:end], position, value)[-self.capacity:]
+        count = len(timestamps)
+        self._timestamps[:count] = self._timestamps[self.capacity:self.capacity + count] = timestamps
+        self._values[:count] = self._values[self.capacity:self.capacity + count] = values
+        self._next = count % self.capacity
+        self._count = count
+
+    def _window(self):
+        start, end = self._span()
+        if self.max_age is not None and self._count:
+            cutoff = self._timestamps[end - 1] - self.max_age
+            start += int(np.searchsorted(self._timestamps[start:end], cutoff, side="left"))
+        return slice(start, end)
+
+    def timestamps(self):
+        return self._timestamps[self._window()]
+
+    def values(self):
+        return self._values[self._window()]
+
+    def latest(self):
+        """
+        Returns the newest (timestamp, value) pair, or None when the buffer is empty.
+        """
+        if not self._count:
+            return None
+        index = (self._next - 1) % self.capacity
+        return self._timestamps[index], self._values[index]
+
+
+class TimeSeriesStore:
+    """
+    Per-(instance, metric) ring buffers with shared retention settings.
+    """
+
+    def __init__(self, capacity=HISTORY_POINTS, max_age=HISTORY_MAX_AGE):
+        self.capacity = capacity
+        self.max_age = max_age
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def buffer(self, instance_id, metric_name):
+        key = (instance_id, metric_name)
+        buffer = self._series.get(key)
+        if buffer is None:
+            with self._lock:
+                buffer = self._series.setdefault(key, RingBuffer(self.capacity, self.max_age))
+        return buffer
+
+    def append(self, instance_id, metric_name, timestamp, value):
+        self.buffer(instance_id, metric_name).append(timestamp, value)
+
+    def series(self, instance_id, metric_name):
+        """
+        Returns (timestamps, values) views of a series; both are empty for unknown series.
+        """
+        buffer = self._series.get((instance_id, metric_name))
+        if buffer is None:
+            return np.empty(0, dtype="datetime64[ns]"), np.empty(0, dtype=np.float64)
+        return buffer.timestamps(), buffer.values()
+
+    def keys(self):
+        return list(self._series)
@@ -0,0 +1,102 @@
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Seconds a cached lookup stays fresh and the maximum number of cached entries
+CACHE_TTL = float(os.environ.get("DASHBOARD_CACHE_TTL", "60"))
+CACHE_MAX_ENTRIES = int(os.environ.get("DASHBOARD_CACHE_SIZE", "256"))
+
+
+class TTLCache:
+    """
+    Thread-safe, size-bounded cache whose entries expire after a fixed TTL.
+    Keys are (namespace, scope, arguments) tuples, where scope is usually the
+    region or bucket, so writes can invalidate exactly the lookups they affect.
+    The least recently used entry is evicted once max_entries is reached.
+    """
+
+    def __init__(self, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns (True, value) for a fresh entry and (False, None) otherwise.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, namespace, scope=None):
+        """
+        Drops every entry of a namespace, or only those of one scope when given.
+        """
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] == namespace and (scope is None or key[1] == scope):
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = TTLCache()
+
+
+def _freeze(value):
+    # Lists and dicts are turned into tuples so they can be part of a cache key
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    return value
+
+
+def cached(namespace, cache=None):
+    """
+    Caches a function's return value per argument set under the given namespace.
+    The first positional argument (region, bucket, ...) is used as the scope for
+    invalidate(). Exceptions propagate and are never cached.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            store = cache or _cache
+            scope = args[0] if args else None
+            key = (namespace, scope, _freeze(args[1:]), _freeze(kwargs))
+            hit, value = store.get(key)
+            if hit:
+                return value
+            value = func(*args, **kwargs)
+            store.set(key, value)
+            return value
+        return wrapper
+    return decorator
+
+
+def invalidate(*namespaces, scope=None, cache=None):
+    """
+    Invalidates the cached entries of each namespace, optionally limited to one scope.
+    """
+    store = cache or _cache
+    for namespace in namespaces:
+        store.invalidate(namespace, scope)
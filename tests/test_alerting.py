@@ -0,0 +1,83 @@
+import threading
+import time
+
+import numpy as np
+
+from alerting import AlertEngine, ThresholdRule
+
+START = np.datetime64("2024-06-01T00:00", "ns")
+PERIOD = np.timedelta64(300, "s")
+
+
+def _series(values):
+    values = np.asarray(values, dtype=np.float64)
+    return START + PERIOD * np.arange(len(values)), values
+
+
+def test_failed_notifier_is_recorded_until_it_delivers_again():
+    attempts = []
+
+    def flaky(events):
+        attempts.append(events)
+        if len(attempts) == 1:
+            raise ConnectionError("webhook down")
+
+    engine = AlertEngine([ThresholdRule("High CPU", "CPUUtilization", 90)], notifiers=[flaky])
+    engine.evaluate({('i-1', 'CPUUtilization'): _series([95])})
+    engine.flush()
+    assert [(failure['Notifier'], failure['Error']) for failure in engine.notifier_errors()] == [("flaky", "webhook down")]
+
+    engine.evaluate({('i-1', 'CPUUtilization'): _series([50])})
+    engine.flush()
+    assert engine.notifier_errors() == []
+    assert [event['Status'] for batch in attempts for event in batch] == ["firing", "resolved"]
+
+
+def test_zscore_fires_on_the_dashboard_default_fleet_window():
+    # The Fleet view fetches 60 minutes at a 300 s period; the current period is often not published yet
+    points = 60 * 60 // 300 - 1
+    baseline = 40 + 2 * np.sin(np.arange(points - 1))
+    engine = AlertEngine()
+
+    breaches = engine.evaluate({('i-1', 'CPUUtilization'): _series([*baseline, 60])})
+
+    assert "CPU anomaly" in {breach['Rule'] for breach in breaches}
+
+
+def test_breach_expires_when_its_series_is_no_longer_evaluated(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("alerting.time.monotonic", lambda: clock[0])
+    events = []
+    engine = AlertEngine([ThresholdRule("High CPU", "CPUUtilization", 90)], notifiers=[events.extend], ttl=600)
+
+    # A one-off fleet collection breaches; later ticks only evaluate other series
+    engine.evaluate({('i-1', 'CPUUtilization'): _series([95])})
+    clock[0] += 300
+    engine.evaluate({('i-2', 'CPUUtilization'): _series([50])})
+    assert [breach['InstanceId'] for breach in engine.active()] == ['i-1']
+
+    clock[0] += 400
+    assert engine.active() == []
+    engine.flush()
+    assert [event['Status'] for event in events] == ["firing", "expired"]
+
+
+def test_slow_notifier_does_not_block_evaluation():
+    delivering = threading.Event()
+    release = threading.Event()
+
+    def slow(events):
+        delivering.set()
+        release.wait(5)
+
+    engine = AlertEngine([ThresholdRule("High CPU", "CPUUtilization", 90)], notifiers=[slow], queue_size=1)
+    start = time.monotonic()
+    engine.evaluate({('i-1', 'CPUUtilization'): _series([95])})
+    assert delivering.wait(5)
+    # One batch waits in the queue; the next one overflows it and is dropped
+    engine.evaluate({('i-1', 'CPUUtilization'): _series([50])})
+    engine.evaluate({('i-1', 'CPUUtilization'): _series([95])})
+    assert time.monotonic() - start < 1
+    assert engine.dropped_events == 1
+    release.set()
+    engine.flush()
@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+from botocore.exceptions import ClientError
+
+import fleet_aggregates
+from aws_clients import clear_clients, get_client
+from fake_aws import FakeAccount
+from fleet_aggregates import fleet_aggregate, fleet_top_n
+
+REGION = "eu-north-1"
+END_TIME = datetime(2024, 6, 1, tzinfo=timezone.utc)
+WINDOW = {'start_time': END_TIME - timedelta(hours=2), 'end_time': END_TIME}
+METRIC_GROUPS = {
+    "CPU": [{'MetricName': 'CPUUtilization', 'Namespace': 'AWS/EC2', 'Unit': 'Percent'}],
+    "Network": [{'MetricName': 'NetworkOut', 'Namespace': 'AWS/EC2', 'Unit': 'Bytes'}],
+}
+
+
+@pytest.fixture
+def account(monkeypatch):
+    # 7 instances in chunks of 3 queries: every server-side path combines 3 requests
+    monkeypatch.setattr(fleet_aggregates, "SERVER_CHUNK_SIZE", 3)
+    account = FakeAccount(REGION, 7, 0)
+    clear_clients()
+    for service in ("ec2", "cloudwatch"):
+        account.attach(get_client(service, region_name=REGION))
+    yield account
+    clear_clients()
+
+
+def _assert_same_series(server, local):
+    assert server.keys() == local.keys()
+    for metric_name, (timestamps, values) in server.items():
+        np.testing.assert_array_equal(timestamps, local[metric_name][0])
+        np.testing.assert_allclose(values, local[metric_name][1])
+
+
+@pytest.mark.parametrize("aggregate", ["avg", "max", "sum"])
+def test_chunked_metric_math_matches_the_local_reduction(account, aggregate):
+    server = fleet_aggregate(REGION, METRIC_GROUPS, aggregate, all_running=True, **WINDOW)
+    local = fleet_aggregate(REGION, METRIC_GROUPS, aggregate, all_running=True, server_side=False, **WINDOW)
+
+    assert (server['Source'], local['Source']) == ("metric-math", "local")
+    assert server['Instances'] == 7
+    _assert_same_series(server['Series'], local['Series'])
+
+
+@pytest.mark.parametrize("descending", [True, False])
+def test_chunked_top_n_matches_the_local_ranking(account, descending):
+    server = fleet_top_n(REGION, METRIC_GROUPS, "NetworkOut", n=4, descending=descending, all_running=True, **WINDOW)
+    local = fleet_top_n(REGION, METRIC_GROUPS, "NetworkOut", n=4, descending=descending, all_running=True,
+                        server_side=False, **WINDOW)
+
+    assert server['Source'] == "metric-math"
+    assert [row['InstanceId'] for row in server['Series']] == [row['InstanceId'] for row in local['Series']]
+    np.testing.assert_allclose([row['Score'] for row in server['Series']], [row['Score'] for row in local['Series']])
+
+
+def test_rejected_expressions_fall_back_to_the_local_reduction(account, monkeypatch):
+    get_metric_data = account._GetMetricData
+
+    def reject_expressions(params):
+        if any('Expression' in query for query in params['MetricDataQueries']):
+            raise ClientError({'Error': {'Code': 'ValidationError', 'Message': "Unsupported expression"}}, 'GetMetricData')
+        return get_metric_data(params)
+
+    monkeypatch.setattr(account, "_GetMetricData", reject_expressions)
+    result = fleet_aggregate(REGION, METRIC_GROUPS, "avg", all_running=True, **WINDOW)
+    local = fleet_aggregate(REGION, METRIC_GROUPS, "avg", all_running=True, server_side=False, **WINDOW)
+
+    assert result['Source'] == "local"
+    _assert_same_series(result['Series'], local['Series'])
+
+
+def test_failed_evaluation_falls_back_to_the_local_ranking(account, monkeypatch):
+    get_metric_data = account._GetMetricData
+
+    def fail_expressions(params):
+        response = get_metric_data(params)
+        for result in response['MetricDataResults']:
+            if result['Id'] == "top":
+                result['StatusCode'] = 'InternalError'
+        return response
+
+    monkeypatch.setattr(account, "_GetMetricData", fail_expressions)
+    result = fleet_top_n(REGION, METRIC_GROUPS, "CPUUtilization", n=3, all_running=True, **WINDOW)
+
+    assert result['Source'] == "local"
+    assert len(result['Series']) == 3
@@ -0,0 +1,36 @@
+import io
+import json
+
+import fleet_cli
+
+
+def _records(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_unexpected_task_error_is_reported_and_fails_the_run(monkeypatch):
+    def ok():
+        yield {'value': 1}
+
+    def broken():
+        yield {'value': 2}
+        raise RuntimeError("boom")
+
+    monkeypatch.setitem(fleet_cli.COMMANDS, "regions", lambda args: [({'task': 'ok'}, ok), ({'task': 'broken'}, broken)])
+    stream = io.StringIO()
+
+    assert fleet_cli.main(["regions"], stream=stream) == 1
+    records = _records(stream)
+    assert {'task': 'broken', 'error': 'RuntimeError', 'message': 'boom'} in records
+    assert {'value': 1} in records and {'value': 2} in records
+
+
+def test_successful_run_exits_zero(monkeypatch):
+    def ok():
+        yield {'value': 1}
+
+    monkeypatch.setitem(fleet_cli.COMMANDS, "regions", lambda args: [({'task': 'ok'}, ok)])
+    stream = io.StringIO()
+
+    assert fleet_cli.main(["regions"], stream=stream) == 0
+    assert _records(stream) == [{'value': 1}]
@@ -0,0 +1,115 @@
+import pytest
+from botocore.stub import Stubber
+
+import fleet_ops
+from aws_clients import clear_clients, get_client
+
+REGION = "eu-north-1"
+
+
+@pytest.fixture
+def ec2():
+    clear_clients()
+    client = get_client('ec2', region_name=REGION)
+    with Stubber(client) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+    clear_clients()
+
+
+def _status(instance_id, state):
+    return {'InstanceId': instance_id, 'InstanceState': {'Code': 16, 'Name': state}}
+
+
+def test_wait_for_state_retries_instances_not_yet_visible(ec2):
+    ec2.add_client_error('describe_instance_status', 'InvalidInstanceID.NotFound')
+    ec2.add_response('describe_instance_status', {'InstanceStatuses': [_status('i-1', 'running')]})
+
+    assert fleet_ops.wait_for_state(REGION, ['i-1'], 'running', interval=0) == {'i-1': 'running'}
+
+
+def test_launch_fleet_returns_instances_when_waiting_fails(ec2):
+    ec2.add_response('describe_instances', {'Reservations': []})
+    ec2.add_response('run_instances', {'Instances': [{'InstanceId': 'i-1'}]})
+    ec2.add_client_error('describe_instance_status', 'UnauthorizedOperation', 'not allowed')
+
+    result = fleet_ops.launch_fleet(REGION, 1, 'ami-1', ['t3.micro'], ['subnet-a'], 'token', interval=0)
+
+    assert result['InstanceIds'] == ['i-1']
+    assert result['WaitError'] == 'not allowed'
+
+
+def _reservation(instance_id, state):
+    return {'Instances': [{'InstanceId': instance_id, 'State': {'Code': 80, 'Name': state}}]}
+
+
+def test_launch_fleet_counts_stopped_members(ec2):
+    ec2.add_response('describe_instances', {'Reservations': [_reservation('i-1', 'stopped'), _reservation('i-2', 'running')]})
+
+    result = fleet_ops.launch_fleet(REGION, 2, 'ami-1', ['t3.micro'], ['subnet-a'], 'token', wait=False)
+
+    assert result['InstanceIds'] == ['i-1', 'i-2']
+    assert result['Shortfall'] == 0
+
+
+def _launch_token(ec2, target_count):
+    ec2.add_response('describe_instances', {'Reservations': []})
+    tokens = []
+    ec2.client.meta.events.register('before-parameter-build.ec2.RunInstances',
+                                    lambda params, **kwargs: tokens.append((params['ClientToken'], params['MaxCount'])))
+    ec2.add_response('run_instances', {'Instances': [{'InstanceId': f"i-{index}"} for index in range(target_count)]})
+    fleet_ops.launch_fleet(REGION, target_count, 'ami-1', ['t3.micro'], ['subnet-a'], 'token', wait=False)
+    return tokens[-1]
+
+
+def test_launch_token_changes_with_the_requested_count(ec2):
+    first_token, first_count = _launch_token(ec2, 2)
+    second_token, second_count = _launch_token(ec2, 3)
+
+    assert (first_count, second_count) == (2, 3)
+    assert first_token != second_token
+
+
+def test_change_state_isolates_instances_in_the_wrong_state(ec2):
+    def stopping(instance_ids):
+        return {'StoppingInstances': [{'InstanceId': instance_id} for instance_id in instance_ids]}
+
+    # i-3 is already stopped, so every request containing it fails
+    ec2.add_client_error('stop_instances', 'IncorrectInstanceState', "The instance 'i-3' is not running.")
+    ec2.add_response('stop_instances', stopping(['i-1', 'i-2']), {'InstanceIds': ['i-1', 'i-2']})
+    ec2.add_client_error('stop_instances', 'IncorrectInstanceState', "The instance 'i-3' is not running.")
+    ec2.add_client_error('stop_instances', 'IncorrectInstanceState', "The instance 'i-3' is not running.",
+                         expected_params={'InstanceIds': ['i-3']})
+    ec2.add_response('stop_instances', stopping(['i-4']), {'InstanceIds': ['i-4']})
+
+    result = fleet_ops.change_state(REGION, "stop", ['i-1', 'i-2', 'i-3', 'i-4'])
+
+    assert result['Requested'] == ['i-1', 'i-2', 'i-4']
+    assert [(error['InstanceIds'], error['Code']) for error in result['Errors']] == [(['i-3'], 'IncorrectInstanceState')]
+
+
+def test_change_state_keeps_request_wide_errors_whole(ec2):
+    ec2.add_client_error('start_instances', 'UnauthorizedOperation', "not allowed")
+
+    result = fleet_ops.change_state(REGION, "start", ['i-1', 'i-2'])
+
+    assert result['Requested'] == []
+    assert result['Errors'] == [{'InstanceIds': ['i-1', 'i-2'], 'Code': 'UnauthorizedOperation', 'Message': "not allowed"}]
+
+
+def test_describe_states_keeps_batches_around_an_unknown_instance(ec2, monkeypatch):
+    monkeypatch.setattr(fleet_ops, "STATUS_BATCH_SIZE", 2)
+    ids = [f"i-{index}" for index in range(1, 7)]
+    ec2.add_response('describe_instance_status', {'InstanceStatuses': [_status('i-1', 'running'), _status('i-2', 'running')]})
+    # Batch 2 of 3 holds i-4, which is not visible yet
+    ec2.add_client_error('describe_instance_status', 'InvalidInstanceID.NotFound', expected_params={
+        'InstanceIds': ['i-3', 'i-4'], 'IncludeAllInstances': True})
+    ec2.add_response('describe_instance_status', {'InstanceStatuses': [_status('i-3', 'pending')]},
+                     {'InstanceIds': ['i-3'], 'IncludeAllInstances': True})
+    ec2.add_client_error('describe_instance_status', 'InvalidInstanceID.NotFound', expected_params={
+        'InstanceIds': ['i-4'], 'IncludeAllInstances': True})
+    ec2.add_response('describe_instance_status', {'InstanceStatuses': [_status('i-5', 'running'), _status('i-6', 'running')]})
+
+    states = fleet_ops.describe_states(REGION, ids)
+
+    assert states == {'i-1': 'running', 'i-2': 'running', 'i-3': 'pending', 'i-5': 'running', 'i-6': 'running'}
@@ -0,0 +1,102 @@
+import pytest
+from botocore.stub import Stubber
+
+from aws_clients import clear_clients, get_client
+from instance_inventory import InstanceInventory
+
+REGION = "eu-north-1"
+STATE_CODES = {'pending': 0, 'running': 16, 'stopping': 64, 'stopped': 80}
+
+
+@pytest.fixture
+def ec2():
+    clear_clients()
+    client = get_client('ec2', region_name=REGION)
+    with Stubber(client) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+    clear_clients()
+
+
+def _instance(instance_id, name, state, tier="web"):
+    return {'InstanceId': instance_id, 'InstanceType': 't3.micro', 'State': {'Code': STATE_CODES[state], 'Name': state},
+            'Tags': [{'Key': 'Name', 'Value': name}, {'Key': 'tier', 'Value': tier}]}
+
+
+def _describe(ec2, *instances):
+    ec2.add_response('describe_instances', {'Reservations': [{'Instances': [instance]} for instance in instances]})
+
+
+def _statuses(ec2, states):
+    ec2.add_response('describe_instance_status', {'InstanceStatuses': [
+        {'InstanceId': instance_id, 'InstanceState': {'Code': STATE_CODES[state], 'Name': state}}
+        for instance_id, state in states.items()
+    ]})
+
+
+def _loaded(ec2):
+    inventory = InstanceInventory(REGION)
+    _describe(ec2, _instance('i-1', 'web-1', 'running'), _instance('i-2', 'web-2', 'running'),
+              _instance('i-3', 'db-1', 'running', tier="db"))
+    assert inventory.refresh()['Full']
+    return inventory
+
+
+def _ids(records):
+    return [record.instance_id for record in records]
+
+
+def test_refresh_indexes_added_removed_and_changed_instances(ec2):
+    inventory = _loaded(ec2)
+    # i-2 stopped, i-3 was terminated and is gone, i-4 is new
+    _statuses(ec2, {'i-1': 'running', 'i-2': 'stopped', 'i-4': 'pending'})
+    _describe(ec2, _instance('i-4', 'web-3', 'pending'), _instance('i-2', 'web-2', 'stopped'))
+
+    changes = inventory.refresh()
+
+    assert (changes['Added'], changes['Changed'], changes['Removed'], changes['Full']) == (['i-4'], ['i-2'], ['i-3'], False)
+    assert len(inventory) == 3
+    assert inventory.get('i-3') is None
+    assert _ids(inventory.select(states=['running'])) == ['i-1']
+    assert _ids(inventory.select(states=['stopped'])) == ['i-2']
+    assert _ids(inventory.select(states=['pending'], tags={'tier': 'web'})) == ['i-4']
+    assert _ids(inventory.select(tags={'tier': 'db'})) == []
+    assert _ids(inventory.find('db-1')) == []
+    assert _ids(inventory.find('web-3')) == ['i-4']
+    assert _ids(inventory.find('web-2', states=['running'])) == []
+
+
+def test_refresh_without_changes_describes_nothing(ec2):
+    inventory = _loaded(ec2)
+    _statuses(ec2, {'i-1': 'running', 'i-2': 'running', 'i-3': 'running'})
+
+    changes = inventory.refresh()
+
+    assert (changes['Added'], changes['Changed'], changes['Removed']) == ([], [], [])
+    assert _ids(inventory.select(states=['running'])) == ['i-1', 'i-2', 'i-3']
+
+
+def test_rename_is_indexed_once_the_instance_is_described_again(ec2):
+    inventory = _loaded(ec2)
+    # Tag edits are invisible to state polls; a state change re-describes the instance
+    _statuses(ec2, {'i-1': 'stopped', 'i-2': 'running', 'i-3': 'running'})
+    _describe(ec2, _instance('i-1', 'web-renamed', 'stopped', tier="api"))
+
+    inventory.refresh()
+
+    assert _ids(inventory.find('web-1')) == []
+    assert _ids(inventory.find('web-renamed')) == ['i-1']
+    assert _ids(inventory.select(tags={'tier': 'web'})) == ['i-2']
+    assert _ids(inventory.select(tags={'tier': 'api'}, names=['web-renamed'])) == ['i-1']
+
+
+def test_overdue_refresh_reloads_renamed_instances(ec2):
+    inventory = _loaded(ec2)
+    inventory.full_refresh_interval = 0
+    _describe(ec2, _instance('i-1', 'web-renamed', 'running'), _instance('i-2', 'web-2', 'running'))
+
+    assert inventory.refresh()['Full']
+    assert _ids(inventory.find('web-1')) == []
+    assert _ids(inventory.find('web-renamed')) == ['i-1']
+    assert _ids(inventory.find('db-1')) == []
+    assert _ids(inventory.select(states=['running'])) == ['i-1', 'i-2']
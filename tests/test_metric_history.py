@@ -0,0 +1,87 @@
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from metric_history import MetricHistoryStore
+from metrics_poller import MetricsPoller, SharedCollector
+
+REGION = "eu-north-1"
+METRIC_GROUPS = {"CPU": [{'MetricName': 'CPUUtilization', 'Namespace': 'AWS/EC2', 'Unit': 'Percent'}]}
+
+
+def test_prune_expired_keeps_the_retention_window(tmp_path):
+    store = MetricHistoryStore(str(tmp_path / "history.sqlite3"), retention_days=1)
+    now = datetime.now(timezone.utc)
+    store.write_points([
+        (REGION, 'i-1', 'CPUUtilization', now - timedelta(days=2), 10.0),
+        (REGION, 'i-1', 'CPUUtilization', now - timedelta(hours=1), 20.0),
+    ])
+
+    assert store.prune_expired() == 1
+    assert store.read_range(REGION, 'i-1', 'CPUUtilization')[1].tolist() == [20.0]
+    # Prunes are spaced out, so writing pollers do not run one per tick
+    assert store.prune_expired() is None
+
+
+class BlockingHistory:
+    # Holds the first read until released, like a slow disk
+    def __init__(self):
+        self.reading = threading.Event()
+        self.release = threading.Event()
+
+    def read_range(self, *args, **kwargs):
+        self.reading.set()
+        self.release.wait(5)
+        return np.array([np.datetime64(datetime.now(timezone.utc).replace(tzinfo=None), "ns")]), np.array([1.0])
+
+
+def test_history_preload_does_not_block_other_subscribers(monkeypatch):
+    monkeypatch.setattr(MetricsPoller, "poll_once", lambda self: None)
+    history = BlockingHistory()
+    collector = SharedCollector(history=history)
+    subscriptions = []
+    loading = threading.Thread(target=lambda: subscriptions.append(collector.subscribe(REGION, 'i-1', METRIC_GROUPS)))
+    loading.start()
+    assert history.reading.wait(5)
+
+    # Joining the loading poller returns while its history is still being read
+    joining = threading.Thread(target=lambda: subscriptions.append(collector.subscribe(REGION, 'i-1', METRIC_GROUPS)))
+    joining.start()
+    joining.join(1)
+    assert not joining.is_alive()
+    history.release.set()
+    loading.join(5)
+    assert collector.subscriber_count(subscriptions[0].key) == 2
+    assert subscriptions[0].poller is subscriptions[1].poller
+    assert subscriptions[0].poller.error('history') is None
+    assert len(subscriptions[0].poller.series('CPUUtilization')[1]) == 1
+    for subscription in subscriptions:
+        subscription.close()
+
+
+def test_series_of_different_periods_do_not_overwrite_each_other(tmp_path):
+    store = MetricHistoryStore(str(tmp_path / "history.sqlite3"))
+    timestamp = datetime(2024, 6, 1, 12, 0, tzinfo=timezone.utc)
+    store.write_points([(REGION, 'i-1', 'CPUUtilization', timestamp, 10.0)], period=60)
+    store.write_points([(REGION, 'i-1', 'CPUUtilization', timestamp, 20.0)], period=300)
+    store.write_points([(REGION, 'i-1', 'CPUUtilization', timestamp, 90.0)], period=300, stat="Maximum")
+
+    assert store.read_range(REGION, 'i-1', 'CPUUtilization', period=60)[1].tolist() == [10.0]
+    assert store.read_range(REGION, 'i-1', 'CPUUtilization', period=300)[1].tolist() == [20.0]
+    assert store.read_range(REGION, 'i-1', 'CPUUtilization', period=300, stat="Maximum")[1].tolist() == [90.0]
+
+
+def test_databases_without_period_are_migrated_as_300_second_averages(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute("CREATE TABLE datapoints (region TEXT NOT NULL, instance_id TEXT NOT NULL, metric TEXT NOT NULL,"
+                           " ts INTEGER NOT NULL, value REAL NOT NULL, PRIMARY KEY (region, instance_id, metric, ts)) WITHOUT ROWID")
+        connection.execute("INSERT INTO datapoints VALUES (?, 'i-1', 'CPUUtilization', 1717243200000, 42.0)", (REGION,))
+    connection.close()
+
+    store = MetricHistoryStore(path)
+
+    assert store.read_range(REGION, 'i-1', 'CPUUtilization', period=300, stat="Average")[1].tolist() == [42.0]
@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from botocore.stub import Stubber
+
+from aws_clients import clear_clients, get_client
+from metrics_engine import IncrementalFetcher
+from timeseries import RingBuffer
+
+REGION = "eu-north-1"
+METRICS = [{'MetricName': 'CPUUtilization', 'Namespace': 'AWS/EC2'}]
+NOW = datetime(2024, 6, 1, 12, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def cloudwatch():
+    clear_clients()
+    with Stubber(get_client('cloudwatch', region_name=REGION)) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+    clear_clients()
+
+
+def _respond(stubber, points):
+    stubber.add_response('get_metric_data', {'MetricDataResults': [{
+        'Id': 'q0', 'Label': 'CPUUtilization', 'StatusCode': 'Complete',
+        'Timestamps': [timestamp for timestamp, _ in points], 'Values': [value for _, value in points],
+    }]})
+
+
+def test_value_revised_inside_lookback_is_returned_again(cloudwatch):
+    fetcher = IncrementalFetcher(REGION, lookback=timedelta(minutes=10))
+    first, second = NOW - timedelta(minutes=5), NOW
+
+    _respond(cloudwatch, [(first, 10.0)])
+    assert fetcher.fetch(['i-1'], METRICS, end_time=NOW) == {('i-1', 'CPUUtilization'): [(first, 10.0)]}
+
+    # CloudWatch finished aggregating the first period and published the next one
+    _respond(cloudwatch, [(first, 15.0), (second, 20.0)])
+    assert fetcher.fetch(['i-1'], METRICS, end_time=NOW) == {('i-1', 'CPUUtilization'): [(first, 15.0), (second, 20.0)]}
+
+    _respond(cloudwatch, [(first, 15.0), (second, 20.0)])
+    assert fetcher.fetch(['i-1'], METRICS, end_time=NOW) == {('i-1', 'CPUUtilization'): []}
+
+
+def test_ring_buffer_replaces_the_value_of_a_stored_timestamp():
+    buffer = RingBuffer(capacity=4)
+    timestamps = [NOW + timedelta(minutes=5 * index) for index in range(6)]
+    for index, timestamp in enumerate(timestamps):
+        buffer.append(timestamp, float(index))
+
+    buffer.append(timestamps[-1], 50.0)
+    buffer.append(timestamps[-3], 30.0)
+
+    assert len(buffer) == 4
+    assert buffer.values().tolist() == [2.0, 30.0, 4.0, 50.0]
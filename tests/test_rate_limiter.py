@@ -0,0 +1,59 @@
+import pytest
+from botocore.awsrequest import AWSResponse
+from botocore.exceptions import ClientError
+
+import rate_limiter
+from aws_clients import clear_clients, get_client
+
+REGION = "eu-north-1"
+
+_THROTTLED = (b"<Response><Errors><Error><Code>RequestLimitExceeded</Code><Message>Request limit exceeded."
+              b"</Message></Error></Errors><RequestID>test</RequestID></Response>")
+
+
+class _Body:
+    def __init__(self, data):
+        self.data = data
+
+    def stream(self, **kwargs):
+        yield self.data
+
+
+@pytest.fixture
+def throttled_ec2(monkeypatch):
+    # Every attempt is throttled; backoff sleeps are skipped
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+    clear_clients()
+    rate_limiter.reset()
+    client = get_client('ec2', region_name=REGION)
+    attempts = []
+
+    def throttle(request, **kwargs):
+        attempts.append(request)
+        # A veto that stopped working would retry without end
+        if len(attempts) > 2 * rate_limiter.MAX_ATTEMPTS:
+            raise RuntimeError("The retry budget did not stop the retries.")
+        return AWSResponse(request.url, 503, {}, _Body(_THROTTLED))
+
+    client.meta.events.register_last("before-send.ec2", throttle)
+    yield client, attempts
+    clear_clients()
+    rate_limiter.reset()
+
+
+def test_throttled_call_is_retried_while_the_budget_allows(throttled_ec2):
+    client, attempts = throttled_ec2
+    with pytest.raises(ClientError):
+        client.describe_instances()
+    assert len(attempts) == rate_limiter.MAX_ATTEMPTS
+    assert rate_limiter.limiter_stats()['Buckets'][0]['Throttles'] == rate_limiter.MAX_ATTEMPTS
+
+
+def test_spent_retry_budget_vetoes_the_retry(throttled_ec2, monkeypatch):
+    client, attempts = throttled_ec2
+    monkeypatch.setattr(rate_limiter.retry_budget, "tokens", 0)
+    with pytest.raises(ClientError) as error:
+        client.describe_instances()
+    assert error.value.response['Error']['Code'] == 'RequestLimitExceeded'
+    assert len(attempts) == 1
+    assert rate_limiter.retry_budget.rejected == 1
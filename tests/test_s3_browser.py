@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+from botocore.awsrequest import AWSResponse
+from botocore.stub import Stubber
+
+import s3_browser
+from aws_clients import clear_clients, get_client
+
+REGION = "eu-north-1"
+BUCKET = "bucket"
+
+
+@pytest.fixture
+def s3():
+    clear_clients()
+    client = get_client('s3', region_name=REGION)
+    yield client
+    clear_clients()
+
+
+def _keys(count):
+    return [f"logs/{index:05d}.json" for index in range(count)]
+
+
+def _delete_request(keys):
+    return {'Bucket': BUCKET, 'Delete': {'Objects': [{'Key': key} for key in keys], 'Quiet': True}}
+
+
+def test_delete_keys_batches_and_collects_per_key_errors(s3):
+    keys = _keys(2500)
+    progress = []
+    with Stubber(s3) as stubber:
+        stubber.add_response('delete_objects', {}, _delete_request(keys[:1000]))
+        stubber.add_response('delete_objects', {'Errors': [
+            {'Key': keys[1000], 'Code': 'AccessDenied', 'Message': "Access Denied"},
+            {'Key': keys[1999], 'Code': 'InternalError', 'Message': "We encountered an internal error."},
+        ]}, _delete_request(keys[1000:2000]))
+        stubber.add_client_error('delete_objects', 'SlowDown', "Please reduce your request rate.",
+                                 expected_params=_delete_request(keys[2000:]))
+
+        # One batch in flight keeps the stubbed responses in request order
+        result = s3_browser.delete_keys(BUCKET, iter(keys), region_name=REGION, concurrency=1,
+                                        on_progress=lambda deleted, failed: progress.append((deleted, failed)))
+        stubber.assert_no_pending_responses()
+
+    assert result['Deleted'] == 1998
+    assert [(error['Key'], error['Code']) for error in result['Errors'][:2]] == [
+        (keys[1000], 'AccessDenied'), (keys[1999], 'InternalError')]
+    # A request that failed as a whole reports every one of its keys
+    assert [error['Key'] for error in result['Errors'][2:]] == keys[2000:]
+    assert {error['Code'] for error in result['Errors'][2:]} == {'SlowDown'}
+    assert progress == [(1000, 0), (1998, 2), (1998, 502)]
+
+
+def test_delete_keys_bounds_the_batches_in_flight(s3):
+    lock = threading.Lock()
+    in_flight = [0, 0]
+    batches = []
+
+    def record_batch(params, **kwargs):
+        with lock:
+            batches.append(len(params['Delete']['Objects']))
+
+    def delete_objects(**kwargs):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight[1], in_flight[0])
+        time.sleep(0.05)
+        with lock:
+            in_flight[0] -= 1
+        return AWSResponse(None, 200, {}, None), {}
+
+    s3.meta.events.register('before-parameter-build.s3.DeleteObjects', record_batch)
+    s3.meta.events.register_first('before-call.s3.DeleteObjects', delete_objects)
+    result = s3_browser.delete_keys(BUCKET, iter(_keys(10_500)), region_name=REGION, concurrency=3)
+
+    assert result == {'Deleted': 10_500, 'Errors': []}
+    assert sorted(batches) == [500] + [1000] * 10
+    assert in_flight[1] == 3